@@ -1,4 +1,4 @@
-import sensor, image, lcd, math, time
+import sensor, image, lcd, math, time, gc
 from machine import UART
 from fpioa_manager import fm
 
@@ -29,12 +29,104 @@ last_center = None
 current_target_index = 0
 last_sent_time = 0
 
-# 缩放图像
+# find_rects阈值闭环调节
+AUTO_THRESHOLD = True  # 根据候选数量和检测结果每帧调节阈值
+RECT_THRESHOLD = 30000  # 初始阈值（保存文件存在时使用上次调节的结果）
+THRESHOLD_MIN = 5000
+THRESHOLD_MAX = 100000
+TARGET_MIN_RECTS = 1  # 候选数目标区间下限
+TARGET_MAX_RECTS = 2  # 候选数目标区间上限
+THRESHOLD_STEP = 0.1  # 每帧相对调整比例
+THRESHOLD_SEARCH_FRAMES = 10  # 没有候选时最多连续降低阈值的帧数，之后保持不变
+SAVE_STABLE_FRAMES = 30  # 连续N帧处于目标区间后保存阈值
+THRESHOLD_FILE = "/flash/rect_threshold_apex.txt"
+
+# 串口命令
+CMD_BUFFER_SIZE = 256  # 接收环形缓冲区大小（字节）
+CMD_MAX_LENGTH = 32  # '$'帧的最大长度，超长的帧被丢弃
+CMD_MAX_PER_FRAME = 4  # 每帧最多执行的命令数
+SEND_PERIOD = 100  # 坐标发送周期（毫秒）
+DISPLAY_MODE = 1  # 1: 在LCD上显示标注后的图像，0: 不刷新LCD
+# 可通过 $GET,名称 / $SET,名称,值 读写的参数：名称 -> (全局变量, 类型, 最小值, 最大值)
+PARAMS = {
+    "THRESHOLD": ("rect_threshold", int, THRESHOLD_MIN, THRESHOLD_MAX),
+    "AUTO": ("AUTO_THRESHOLD", int, 0, 1),
+    "PERIOD": ("SEND_PERIOD", int, 10, 1000),
+    "DISPLAY": ("DISPLAY_MODE", int, 0, 1),
+}
+
+# 全分辨率角点精化
+REFINE_CORNERS = True  # 半分辨率检测后在原图上用直线拟合求亚像素角点
+REFINE_RADIUS = 4  # 沿法线搜索边缘的半径（原图像素）
+REFINE_SPAN = 16  # 角点附近用于拟合的边长范围（原图像素）
+REFINE_SAMPLES = 4  # 每条边的采样剖面数
+REFINE_MIN_GRADIENT = 20  # 最小边缘梯度（灰度差）
+
+# 边框宽度测量
+MEASURE_BORDER = True  # 沿各边法线测量实际边框宽度，代替按比例估算
+BORDER_SAMPLES = 3  # 每条边的采样剖面数
+BORDER_MAX_RATIO = 0.3  # 剖面在边两侧的搜索范围（相对边长）
+BORDER_MIN_GRADIENT = 30  # 边框内外边缘的最小梯度（灰度差）
+BORDER_RESCALE = 0.1  # 矩形平均边长变化超过此比例时重新测量
+border_cache_width = None  # 缓存的边框宽度（原图像素）
+border_cache_scale = 0  # 测量时的平均边长
+
+# 跟踪模式：只在上一次矩形附近搜索
+USE_ROI_TRACKING = True  # 关闭后每帧全图搜索
+ROI_MARGIN = 0.25  # 搜索区域外扩比例（相对外接框较长边），每丢失一帧再加一份
+ROI_MIN_MARGIN = 8  # 最小外扩像素（缩放图像）
+FULL_SEARCH_MISSES = 3  # 连续丢失N帧后改为全图搜索
+FPS_WINDOW = 100  # 每N帧统计一次稳态帧率
+track_box = None  # 上一次矩形在缩放图像上的外接框
+last_corners = None  # 上一次检测到的角点（缩放图像，已对应编号）
+miss_count = 0
+roi_frames = 0
+fps_frames = 0
+fps_start = time.ticks_ms()
+
+# 缩放缓冲池
+USE_BUFFER_POOL = True  # 半分辨率图像只在启动时分配一次，之后每帧把均值池化的结果写入其中
+scaled_buffer = None
+pool_into_buffer = True  # 固件的mean_pooled不支持写入已有图像时自动置为False
+scale_alloc = 0  # 本统计窗口内缩放步骤分配的堆内存（字节）
+
+# 遥测
+STATUS_PERIOD = 1000  # 状态消息（如未检测到矩形）的最小发送间隔（毫秒）
+STATUS_NO_RECT = b"E,No rectangle detected\n"
+last_status_time = time.ticks_ms() - STATUS_PERIOD
+packet_alloc = 0  # 本统计窗口内打包和发送分配的堆内存（字节）
+
+# 基准测试
+BENCHMARK = False  # 定期对比单尺度与多尺度检测的耗时和最小可检测矩形
+BENCH_INTERVAL = 30  # 基准测试间隔帧数
+frame_count = 0
+
+# 多尺度检测：全图搜索时先在1/4分辨率图像上找候选，再在半分辨率图像的小ROI中验证
+MULTI_SCALE = True  # 关闭后全图搜索直接在半分辨率图像上进行（跟踪ROI搜索不受影响）
+PROPOSAL_SCALE = 2  # 候选图像相对半分辨率图像的缩小倍数（160x120 -> 80x60）
+PROPOSAL_THRESHOLD_RATIO = 0.5  # 候选阶段阈值比例：边长减半，边缘强度之和约减半
+MAX_PROPOSALS = 3  # 每帧最多验证的候选数（按边缘强度）
+VERIFY_MARGIN = 6  # 验证ROI外扩像素（半分辨率图像）
+VERIFY_SIZE_TOL = 0.15  # 验证结果与候选外接框尺寸的最大相对偏差
+proposal_buffer = None  # 预先分配的候选图像
+bench_min_side = [None, None]  # 基准测试中单尺度/多尺度仍能检测到的最小矩形短边（原图像素）
+
+# 缩放图像：scale×scale均值池化（不修改原图，抗混叠），使用缓冲池时结果写入预先分配的图像，稳态帧不再分配新图像
 def scale_image(img, scale):
+    global scaled_buffer, pool_into_buffer
     width = img.width() // scale
     height = img.height() // scale
-    img_scaled = img.resize(width, height)
-    return img_scaled
+    if USE_BUFFER_POOL:
+        if scaled_buffer is None or scaled_buffer.width() != width or scaled_buffer.height() != height:
+            scaled_buffer = image.Image(size=(width, height))
+        if pool_into_buffer:
+            try:
+                return img.mean_pooled(scale, scale, copy=scaled_buffer)
+            except TypeError:
+                pool_into_buffer = False
+                print("mean_pooled cannot write into a buffer, allocating per frame")
+        return img.mean_pooled(scale, scale)
+    return img.resize(width, height)
 
 # 自动估算边框宽度
 def estimate_border_width(w, h):
@@ -54,39 +146,457 @@ def ensure_clockwise(corners):
 
     return corners if area > 0 else [corners[3], corners[2], corners[1], corners[0]]
 
+# 矩形顶点的外接框 (x, y, w, h)
+def corners_box(corners):
+    xs = [p[0] for p in corners]
+    ys = [p[1] for p in corners]
+    return (min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+
+# 根据上一次的外接框计算搜索区域：每丢失一帧多外扩一份边距，连续丢失过多时返回None（全图搜索）
+def search_roi(box, misses, width, height):
+    if box is None or misses >= FULL_SEARCH_MISSES:
+        return None
+    x, y, w, h = box
+    margin = int(max(w, h) * ROI_MARGIN * (misses + 1)) + ROI_MIN_MARGIN
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(width, x + w + margin), min(height, y + h + margin)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+# 读取上次保存的阈值，文件不存在时使用默认值
+def load_threshold(default):
+    try:
+        with open(THRESHOLD_FILE) as f:
+            return max(THRESHOLD_MIN, min(THRESHOLD_MAX, int(f.read())))
+    except Exception:
+        return default
+
+# 保存阈值到文件
+def save_threshold(threshold):
+    try:
+        with open(THRESHOLD_FILE, "w") as f:
+            f.write(str(threshold))
+    except Exception as e:
+        print("Threshold save error:", e)
+
+# 闭环调节阈值：候选过多时提高阈值；没有候选时降低阈值，但连续THRESHOLD_SEARCH_FRAMES帧仍没有候选时
+# 视野中可能没有目标，保持阈值不再降低；连续稳定SAVE_STABLE_FRAMES帧后打印收敛帧数，与已保存值相差超过5%时写入文件
+def update_threshold(count, found):
+    global rect_threshold, stable_frames, saved_threshold, tune_frames, empty_frames
+    tune_frames += 1
+    empty_frames = empty_frames + 1 if count < TARGET_MIN_RECTS else 0
+    if count > TARGET_MAX_RECTS:
+        rect_threshold = min(THRESHOLD_MAX, int(rect_threshold * (1 + THRESHOLD_STEP)))
+        stable_frames = 0
+    elif count < TARGET_MIN_RECTS or not found:
+        if empty_frames <= THRESHOLD_SEARCH_FRAMES:
+            rect_threshold = max(THRESHOLD_MIN, int(rect_threshold * (1 - THRESHOLD_STEP)))
+        stable_frames = 0
+    else:
+        stable_frames += 1
+        if stable_frames == SAVE_STABLE_FRAMES:
+            print("Threshold settled at {} after {} frames".format(rect_threshold, tune_frames))
+            if abs(rect_threshold - saved_threshold) > saved_threshold * 0.05:
+                save_threshold(rect_threshold)
+                saved_threshold = rect_threshold
+
+# 读取全分辨率图像的灰度值（越界返回None）
+def gray_at(img, x, y):
+    if 0 <= x < img.width() and 0 <= y < img.height():
+        r, g, b = img.get_pixel(x, y)
+        return (r * 77 + g * 150 + b * 29) >> 8
+    return None
+
+# 从(x, y)沿法线(nx, ny)采样灰度剖面，返回梯度最强处的亚像素偏移（没有明显边缘时返回None）
+def edge_offset(img, x, y, nx, ny):
+    r = REFINE_RADIUS
+    profile = []
+    for k in range(-r - 2, r + 3):
+        v = gray_at(img, int(x + nx * k + 0.5), int(y + ny * k + 0.5))
+        if v is None:
+            return None
+        profile.append(v)
+
+    # 中心差分梯度，在[-r, r]内找绝对值最大处
+    grads = [abs(profile[k + 1] - profile[k - 1]) for k in range(1, len(profile) - 1)]
+    best_k = 1
+    for k in range(2, len(grads) - 1):
+        if grads[k] > grads[best_k]:
+            best_k = k
+    if grads[best_k] < REFINE_MIN_GRADIENT:
+        return None
+
+    # 抛物线插值求峰值的亚像素位置
+    offset = best_k - r - 1
+    g0, g1, g2 = grads[best_k - 1], grads[best_k], grads[best_k + 1]
+    den = g0 - 2 * g1 + g2
+    if den < 0:
+        offset += 0.5 * (g0 - g2) / den
+    return offset
+
+# 拟合角点corner到相邻角点other这条边在角点附近的直线，返回 (点x, 点y, 方向x, 方向y)
+def fit_side(img, corner, other):
+    dx, dy = other[0] - corner[0], other[1] - corner[1]
+    length = math.sqrt(dx*dx + dy*dy)
+    if length < 4:
+        return None
+    dx, dy = dx / length, dy / length
+    nx, ny = -dy, dx
+    span = min(REFINE_SPAN, length * 0.45)
+
+    # 沿边取几个采样位置，记录边缘相对粗略边的法向偏移
+    ts, offsets = [], []
+    for i in range(REFINE_SAMPLES):
+        t = span * (i + 1) / REFINE_SAMPLES
+        o = edge_offset(img, corner[0] + dx * t, corner[1] + dy * t, nx, ny)
+        if o is not None:
+            ts.append(t)
+            offsets.append(o)
+
+    # 最小二乘拟合 offset = a + b*t，剔除残差超过1像素的点后再拟合一次
+    for _ in range(2):
+        n = len(ts)
+        if n < 2:
+            return None
+        st, so = sum(ts), sum(offsets)
+        stt = sum(t * t for t in ts)
+        sto = sum(t * o for t, o in zip(ts, offsets))
+        den = n * stt - st * st
+        if den == 0:
+            return None
+        b = (n * sto - st * so) / den
+        a = (so - b * st) / n
+        keep = [i for i in range(n) if abs(a + b * ts[i] - offsets[i]) <= 1.0]
+        if len(keep) == n:
+            break
+        ts = [ts[i] for i in keep]
+        offsets = [offsets[i] for i in keep]
+
+    return (corner[0] + nx * a, corner[1] + ny * a, dx + nx * b, dy + ny * b)
+
+# 在全分辨率图像上精化角点：对每个角点的两条相邻边各拟合一条直线并求交点，
+# 只访问角点附近的小窗口；拟合失败或交点偏离过远时保留原角点
+def refine_corners(img, corners):
+    refined = []
+    for i in range(4):
+        corner = corners[i]
+        line1 = fit_side(img, corner, corners[i - 1])
+        line2 = fit_side(img, corner, corners[(i + 1) % 4])
+        if line1 is None or line2 is None:
+            refined.append(corner)
+            continue
+        px, py, vx, vy = line1
+        qx, qy, wx, wy = line2
+        cross = vx * wy - vy * wx
+        if abs(cross) < 0.1:  # 两边接近平行
+            refined.append(corner)
+            continue
+        u = ((qx - px) * wy - (qy - py) * wx) / cross
+        x, y = px + vx * u, py + vy * u
+        if abs(x - corner[0]) > 2 * REFINE_RADIUS or abs(y - corner[1]) > 2 * REFINE_RADIUS:
+            refined.append(corner)
+        else:
+            refined.append((x, y))
+    return refined
+
+# 沿各边内法线采样灰度剖面测量边框宽度（原图像素）：外边缘取由亮变暗最强处，
+# 内边缘取其内侧由暗变亮最强处，取所有剖面的中位数；有效剖面太少时返回None
+def measure_border_width(img, corners):
+    cx = sum(p[0] for p in corners) / 4
+    cy = sum(p[1] for p in corners) / 4
+    widths = []
+    for i in range(4):
+        x0, y0 = corners[i]
+        x1, y1 = corners[(i + 1) % 4]
+        dx, dy = x1 - x0, y1 - y0
+        length = math.sqrt(dx*dx + dy*dy)
+        if length < 8:
+            continue
+        nx, ny = -dy / length, dx / length
+        # 法线指向矩形内部
+        if (cx - (x0 + x1) / 2) * nx + (cy - (y0 + y1) / 2) * ny < 0:
+            nx, ny = -nx, -ny
+        reach = int(length * BORDER_MAX_RATIO)
+
+        for s in range(BORDER_SAMPLES):
+            t = (s + 1) / (BORDER_SAMPLES + 1)
+            px, py = x0 + dx * t, y0 + dy * t
+            profile = []
+            for k in range(-reach, reach + 1):
+                v = gray_at(img, int(px + nx * k + 0.5), int(py + ny * k + 0.5))
+                if v is None:
+                    break
+                profile.append(v)
+            if len(profile) < 2 * reach + 1:
+                continue
+
+            # 由外向内的中心差分梯度
+            outer, outer_g = 0, 0
+            for k in range(1, len(profile) - 1):
+                g = profile[k + 1] - profile[k - 1]
+                if g < outer_g:
+                    outer, outer_g = k, g
+            inner, inner_g = 0, 0
+            for k in range(outer + 1, len(profile) - 1):
+                g = profile[k + 1] - profile[k - 1]
+                if g > inner_g:
+                    inner, inner_g = k, g
+            if -outer_g >= BORDER_MIN_GRADIENT and inner_g >= BORDER_MIN_GRADIENT:
+                widths.append(inner - outer)
+
+    if len(widths) < 3:
+        return None
+    widths.sort()
+    return widths[len(widths) // 2]
+
+# 边框宽度（原图像素）：缓存测量结果，平均边长变化超过BORDER_RESCALE时才重新测量，
+# 其余时间按边长比例缩放缓存值；从未测量成功时使用fallback。返回 (宽度, 是否为测量值)
+def get_border_width(img, corners, fallback):
+    global border_cache_width, border_cache_scale
+    scale = sum(distance(corners[i], corners[(i + 1) % 4]) for i in range(4)) / 4
+    if scale <= 0:
+        return fallback, False
+    if border_cache_width is None or abs(scale - border_cache_scale) > border_cache_scale * BORDER_RESCALE:
+        measured = measure_border_width(img, corners)
+        if measured is not None:
+            border_cache_width, border_cache_scale = measured, scale
+            print("Border width: {} px (side {:.1f} px)".format(measured, scale))
+    if border_cache_width is None:
+        return fallback, False
+    return border_cache_width * scale / border_cache_scale, True
+
+# 角点对应：在新四边形的4种循环起点和2种方向中，选与上一帧角点总位移（平方和）最小的排列，
+# 使角点编号在帧间保持稳定；没有上一帧时以x+y最小的点（左上角）为起点
+def associate_corners(corners, previous):
+    corners = list(corners)
+    if previous is None:
+        start = 0
+        for i in range(1, 4):
+            if corners[i][0] + corners[i][1] < corners[start][0] + corners[start][1]:
+                start = i
+        return corners[start:] + corners[:start]
+
+    best, best_cost = corners, -1
+    for order in (corners, [corners[0], corners[3], corners[2], corners[1]]):
+        for s in range(4):
+            cost = 0
+            for j in range(4):
+                p, q = order[(s + j) % 4], previous[j]
+                cost += (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2
+            if best_cost < 0 or cost < best_cost:
+                best, best_cost = order[s:] + order[:s], cost
+    return best
+
 # 计算两点之间的距离
 def distance(p1, p2):
     return math.sqrt((p2[0]-p1[0])**2 + (p2[1]-p1[1])**2)
 
-# 处理串口命令
+# 候选阶段：把半分辨率图像再缩小到预先分配的候选图像中，在其上全图找矩形，返回(候选, 候选总数)
+def propose_rects(img_scaled, threshold):
+    global proposal_buffer
+    width = img_scaled.width() // PROPOSAL_SCALE
+    height = img_scaled.height() // PROPOSAL_SCALE
+    if proposal_buffer is None or proposal_buffer.width() != width or proposal_buffer.height() != height:
+        proposal_buffer = image.Image(size=(width, height))
+    proposal_buffer.draw_image(img_scaled, 0, 0, x_scale=1.0 / PROPOSAL_SCALE, y_scale=1.0 / PROPOSAL_SCALE)
+    proposals = proposal_buffer.find_rects(threshold=int(threshold * PROPOSAL_THRESHOLD_RATIO))
+    count = len(proposals)
+    if count > MAX_PROPOSALS:
+        proposals = sorted(proposals, key=lambda r: r.magnitude(), reverse=True)[:MAX_PROPOSALS]
+    return proposals, count
+
+# 验证阶段：在候选外接框（放大到半分辨率并外扩）内重新检测，
+# 没有检测到或尺寸与候选不符的候选被丢弃（相邻候选的ROI重叠时同一矩形只保留一次），返回半分辨率图像坐标
+def verify_rects(img_scaled, proposals, threshold):
+    width, height = img_scaled.width(), img_scaled.height()
+    verified = []
+    for proposal in proposals:
+        x, y, w, h = corners_box(proposal.corners())
+        w, h = w * PROPOSAL_SCALE, h * PROPOSAL_SCALE
+        x0 = max(0, x * PROPOSAL_SCALE - VERIFY_MARGIN)
+        y0 = max(0, y * PROPOSAL_SCALE - VERIFY_MARGIN)
+        x1 = min(width, x * PROPOSAL_SCALE + w + VERIFY_MARGIN)
+        y1 = min(height, y * PROPOSAL_SCALE + h + VERIFY_MARGIN)
+        for rect in img_scaled.find_rects(roi=(x0, y0, x1 - x0, y1 - y0), threshold=threshold):
+            _, _, rw, rh = corners_box(rect.corners())
+            # 候选坐标有±1个候选像素的量化误差，容差再加一个缩放倍数
+            if (abs(rw - w) <= w * VERIFY_SIZE_TOL + PROPOSAL_SCALE and
+                    abs(rh - h) <= h * VERIFY_SIZE_TOL + PROPOSAL_SCALE and
+                    not any(v.corners() == rect.corners() for v in verified)):
+                verified.append(rect)
+    return verified
+
+# 对比单尺度全图检测与多尺度检测的耗时，并记录各自仍能检测到的最小矩形（边缘强度最高者的短边）
+def bench_multiscale(img_scaled, threshold):
+    t0 = time.ticks_us()
+    single = img_scaled.find_rects(threshold=threshold)
+    t1 = time.ticks_us()
+    multi = verify_rects(img_scaled, propose_rects(img_scaled, threshold)[0], threshold)
+    t2 = time.ticks_us()
+    for i, rects in enumerate((single, multi)):
+        if rects:
+            _, _, w, h = corners_box(max(rects, key=lambda r: r.magnitude()).corners())
+            side = min(w, h) * 2
+            if bench_min_side[i] is None or side < bench_min_side[i]:
+                bench_min_side[i] = side
+    print("Rect search: single {:.1f} ms ({} rects), multi-scale {:.1f} ms ({} rects), min side found: single {} px, multi {} px".format(
+        time.ticks_diff(t1, t0) / 1000, len(single), time.ticks_diff(t2, t1) / 1000, len(multi),
+        bench_min_side[0], bench_min_side[1]))
+
+# 串口命令接收：每帧把串口中待读的字节全部读入环形缓冲区（缓冲区满时覆盖最旧的字节），
+# 再从中取出完整的命令：'$'开头、换行结尾的文本命令，或帧外的单字母命令
+class CommandReader:
+    def __init__(self, size, letters, max_length):
+        self.buf = bytearray(size)
+        self.size = size
+        self.start = 0  # 最旧的未处理字节位置
+        self.count = 0  # 未处理字节数
+        self.letters = tuple(letters)  # 单字母命令的字节值（MicroPython不支持 int in bytes）
+        self.line = bytearray(max_length)
+        self.line_len = -1  # 当前'$'帧已收到的长度，-1表示不在帧内
+        self.dropped = 0  # 缓冲区溢出丢弃的字节数
+
+    # 读入串口中所有待读字节
+    def fill(self, uart):
+        n = uart.any()
+        if not n:
+            return
+        data = uart.read(n)
+        if len(data) > self.size:
+            self.dropped += len(data) - self.size
+            data = data[-self.size:]
+        overflow = self.count + len(data) - self.size
+        if overflow > 0:
+            self.start = (self.start + overflow) % self.size
+            self.count -= overflow
+            self.dropped += overflow
+        end = (self.start + self.count) % self.size
+        first = min(len(data), self.size - end)
+        self.buf[end:end + first] = data[:first]
+        self.buf[:len(data) - first] = data[first:]
+        self.count += len(data)
+
+    # 取出下一条完整命令（去掉'$'和换行），没有时返回None；未结束的'$'帧留到下一帧继续拼接
+    def next_command(self):
+        while self.count:
+            b = self.buf[self.start]
+            self.start = (self.start + 1) % self.size
+            self.count -= 1
+            if self.line_len >= 0:
+                if b == 10 or b == 13:  # '\n' 或 '\r' 结束一帧
+                    n = self.line_len
+                    self.line_len = -1
+                    if n:
+                        return bytes(self.line[:n])
+                elif b == 36:  # 新的'$'，丢弃未结束的帧
+                    self.line_len = 0
+                elif self.line_len < len(self.line):
+                    self.line[self.line_len] = b
+                    self.line_len += 1
+                else:  # 超长帧丢弃
+                    self.line_len = -1
+            elif b == 36:  # '$'
+                self.line_len = 0
+            elif b in self.letters:
+                return bytes([b])
+        return None
+
+# 遥测数据包：启动时按固定宽度排好各行并分配缓冲区，发送时只把数字逐位写入，整包一次uart.write；
+# 数值截断到0-999并补零（与edge_run的X000Y000格式相同），下位机仍可逐行解析
+class TelemetryPacket:
+    def __init__(self):
+        # C,xxx,yyy  T,xxx,yyy  P,8个顶点坐标
+        self.buf = bytearray(("C,000,000\nT,000,000\nP," + ",".join(["000"] * 8) + "\n").encode())
+
+    # 在pos处写入三位整数
+    def put(self, pos, value):
+        value = max(0, min(999, int(value)))
+        buf = self.buf
+        buf[pos] = 48 + value // 100
+        buf[pos + 1] = 48 + value // 10 % 10
+        buf[pos + 2] = 48 + value % 10
+
+    # 写入本次的所有字段，返回整包缓冲区
+    def pack(self, center_x, center_y, target_x, target_y, corners):
+        self.put(2, center_x)
+        self.put(6, center_y)
+        self.put(12, target_x)
+        self.put(16, target_y)
+        for i in range(4):
+            self.put(22 + 8 * i, corners[i][0])
+            self.put(26 + 8 * i, corners[i][1])
+        return self.buf
+
+# 处理串口命令：读入所有待读字节，每帧最多执行CMD_MAX_PER_FRAME条，其余留到下一帧
 def handle_uart_commands():
+    try:
+        commands.fill(uart)
+    except Exception as e:
+        print("UART error:", e)
+        return
+    for _ in range(CMD_MAX_PER_FRAME):
+        try:
+            cmd = commands.next_command()
+        except Exception as e:
+            print("UART error:", e)
+            break
+        if cmd is None:
+            break
+        try:
+            execute_command(cmd.decode())
+        except Exception as e:
+            print("UART error:", e)
+            uart.write(b"$ERR," + cmd + b"\n")
+
+# 读写参数：GET,名称 / SET,名称,值，应答 $OK,名称,当前值
+def execute_param_command(cmd):
+    fields = cmd.split(",")
+    if len(fields) < 2 or fields[1] not in PARAMS:
+        raise ValueError("unknown command")
+    name, kind, low, high = PARAMS[fields[1]]
+    if fields[0] == "SET" and len(fields) == 3:
+        globals()[name] = max(low, min(high, kind(fields[2])))
+    elif fields[0] != "GET" or len(fields) != 2:
+        raise ValueError("unknown command")
+    uart.write("$OK,{},{}\n".format(fields[1], globals()[name]))
+
+# 执行一条命令并应答：单字母命令 P暂停/继续、R复位、S开始/停止发送、N下一个点，其余为参数读写
+def execute_command(cmd):
     global SEND_COORDINATES, PAUSED, current_target_index
+    print("Received command:", cmd)
 
-    if uart.any():
-        try:
-            cmd = uart.read(1).decode()
-            print("Received command:", cmd)
+    if cmd == 'P':  # 暂停/继续
+        PAUSED = not PAUSED
+        uart.write("Pause:" + ("ON" if PAUSED else "OFF") + "\n")
 
-            if cmd == 'P':  # 暂停/继续
-                PAUSED = not PAUSED
-                uart.write("Pause:" + ("ON" if PAUSED else "OFF") + "\n")
+    elif cmd == 'R':  # 复位
+        PAUSED = False
+        current_target_index = 0
+        uart.write("RESET\n")
 
-            elif cmd == 'R':  # 复位
-                PAUSED = False
-                current_target_index = 0
-                uart.write("RESET\n")
+    elif cmd == 'S':  # 开始/停止发送坐标
+        SEND_COORDINATES = not SEND_COORDINATES
+        uart.write("Send:" + ("ON" if SEND_COORDINATES else "OFF") + "\n")
 
-            elif cmd == 'S':  # 开始/停止发送坐标
-                SEND_COORDINATES = not SEND_COORDINATES
-                uart.write("Send:" + ("ON" if SEND_COORDINATES else "OFF") + "\n")
+    elif cmd == 'N':  # 下一个点
+        if not PAUSED:
+            current_target_index = (current_target_index + 1) % 4
+            uart.write("NEXT\n")
 
-            elif cmd == 'N':  # 下一个点
-                if not PAUSED:
-                    current_target_index = (current_target_index + 1) % 4
-                    uart.write("NEXT\n")
+    else:
+        execute_param_command(cmd)
 
-        except Exception as e:
-            print("UART error:", e)
+# 遥测数据包
+packet = TelemetryPacket()
+
+# 串口命令缓冲区
+commands = CommandReader(CMD_BUFFER_SIZE, b"PRSN", CMD_MAX_LENGTH)
+
+# 阈值调节状态
+rect_threshold = load_threshold(RECT_THRESHOLD) if AUTO_THRESHOLD else RECT_THRESHOLD
+saved_threshold = rect_threshold
+stable_frames = 0
+tune_frames = 0
+empty_frames = 0  # 连续没有候选的帧数
 
 while True:
     img = sensor.snapshot()
@@ -95,8 +605,30 @@ while True:
     img.gaussian(1)  # 高斯模糊降噪
 
 
+    # 统计缩放步骤的堆分配（gc.mem_alloc差值，期间发生回收时差值为负，忽略）
+    heap_before = gc.mem_alloc()
     img_scaled = scale_image(img, 2)  # 将图像缩小为原来的一半
-    rects = img_scaled.find_rects(threshold=30000)
+    heap_delta = gc.mem_alloc() - heap_before
+    if heap_delta > 0:
+        scale_alloc += heap_delta
+    # 跟踪模式下只在上一次矩形附近搜索
+    roi = search_roi(track_box, miss_count, img_scaled.width(), img_scaled.height()) if USE_ROI_TRACKING else None
+    if roi:
+        rects = img_scaled.find_rects(roi=roi, threshold=rect_threshold)
+        rect_count = len(rects)
+        roi_frames += 1
+    elif MULTI_SCALE:
+        # 在80x60图像上找候选，只在候选附近的半分辨率ROI中验证
+        proposals, rect_count = propose_rects(img_scaled, rect_threshold)
+        rects = verify_rects(img_scaled, proposals, rect_threshold)
+    else:
+        rects = img_scaled.find_rects(threshold=rect_threshold)
+        rect_count = len(rects)
+    frame_count += 1
+    if BENCHMARK and frame_count % BENCH_INTERVAL == 0:
+        bench_multiscale(img_scaled, rect_threshold)
+    if AUTO_THRESHOLD:
+        update_threshold(rect_count, len(rects) > 0)
 
 
 
@@ -110,6 +642,14 @@ while True:
         rect = rects[0]  # 只处理第一个矩形
         corners = rect.corners()
         corners = ensure_clockwise(corners)  # 确保顺时针顺序
+        corners = associate_corners(corners, last_corners)  # 与上一帧角点对应，保持编号稳定
+        last_corners = corners
+        track_box = corners_box(corners)
+        miss_count = 0
+
+        # 在原图上对四个角点做亚像素精化，再换回缩放图像坐标供后续计算
+        if REFINE_CORNERS:
+            corners = [(x / 2, y / 2) for (x, y) in refine_corners(img, [(x*2, y*2) for (x, y) in corners])]
 
         # 计算矩形的中心点（缩放图像上）
         center_x_scaled = sum(p[0] for p in corners) / 4
@@ -119,6 +659,11 @@ while True:
         w_scaled = distance(corners[0], corners[1])
         h_scaled = distance(corners[1], corners[2])
         border_width_scaled = estimate_border_width(w_scaled, h_scaled)
+        if MEASURE_BORDER:
+            # 在原图上测量实际边框宽度（测量失败时使用按比例估算的值）
+            corners_full = [(x*2, y*2) for (x, y) in corners]
+            border_width_full, _ = get_border_width(img, corners_full, border_width_scaled * 2)
+            border_width_scaled = border_width_full / 2
 
         # 计算四条边的向量
         edges = []
@@ -129,7 +674,8 @@ while True:
             dy = y1 - y0
             edges.append((dx, dy))
 
-        # 计算单位法向量（指向内部）
+        # 计算单位法向量（指向内部）；角点对应可能选中逆时针方向，此时法向量取反
+        orientation = 1 if sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(corners, corners[1:] + corners[:1])) > 0 else -1
         normals = []
         for dx, dy in edges:
             length = math.sqrt(dx*dx + dy*dy)
@@ -137,7 +683,7 @@ while True:
                 normals.append((0, 0))
             else:
                 # 逆时针旋转90度得到指向内部的法向量
-                normals.append((-dy/length, dx/length))
+                normals.append((-dy/length * orientation, dx/length * orientation))
 
         # 计算内矩形的顶点（在缩放图像上）
         inner_corners_scaled = []
@@ -195,33 +741,41 @@ while True:
 
         # 发送坐标数据
         current_time = time.ticks_ms()
-        if SEND_COORDINATES and not PAUSED and current_time - last_sent_time > 100:  # 每100ms发送一次
-            # 发送中心坐标
-            uart.write("C,{},{}\n".format(center_x, center_y))
-
-            # 发送当前目标点
+        if SEND_COORDINATES and not PAUSED and time.ticks_diff(current_time, last_sent_time) > SEND_PERIOD:  # 每SEND_PERIOD毫秒发送一次
+            # 中心坐标、当前目标点和所有顶点（调试用）整包一次写出
             target_x, target_y = avg_corners[current_target_index]
-            uart.write("T,{},{}\n".format(target_x, target_y))
-
-            # 发送所有顶点（调试用）
-            uart.write("P,{},{},{},{},{},{},{},{}\n".format(
-                avg_corners[0][0], avg_corners[0][1],
-                avg_corners[1][0], avg_corners[1][1],
-                avg_corners[2][0], avg_corners[2][1],
-                avg_corners[3][0], avg_corners[3][1]
-            ))
-
+            heap_before = gc.mem_alloc()
+            uart.write(packet.pack(center_x, center_y, target_x, target_y, avg_corners))
+            heap_delta = gc.mem_alloc() - heap_before
+            if heap_delta > 0:
+                packet_alloc += heap_delta
             last_sent_time = current_time
 
             # 自动移动到下一个点（每隔2秒）
             if current_time % 2000 < 100:  # 每2秒移动一次
                 current_target_index = (current_target_index + 1) % 4
     else:
-        # 没有检测到矩形时发送错误信息
-        if time.ticks_ms() % 1000 < 100:
-            uart.write("E,No rectangle detected\n")
+        miss_count += 1
+
+        # 没有检测到矩形时发送错误信息（每STATUS_PERIOD毫秒最多一次）
+        if time.ticks_diff(time.ticks_ms(), last_status_time) >= STATUS_PERIOD:
+            uart.write(STATUS_NO_RECT)
+            last_status_time = time.ticks_ms()
 
         # 显示未检测到矩形的消息
         img.draw_string(10, 10, "No rectangle detected", color=(255, 0, 0))
 
-    lcd.display(img)
+    if DISPLAY_MODE:
+        lcd.display(img)
+
+    # 统计稳态帧率（每FPS_WINDOW帧的平均值）
+    fps_frames += 1
+    if fps_frames == FPS_WINDOW:
+        elapsed = time.ticks_diff(time.ticks_ms(), fps_start)
+        print("FPS: {:.1f}, ROI frames: {}/{}, scale alloc: {} B/frame, packet alloc: {} B, heap free: {} B".format(
+            fps_frames * 1000 / elapsed, roi_frames, fps_frames, scale_alloc // fps_frames, packet_alloc, gc.mem_free()))
+        scale_alloc = 0
+        packet_alloc = 0
+        fps_frames = 0
+        roi_frames = 0
+        fps_start = time.ticks_ms()
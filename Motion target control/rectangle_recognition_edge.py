@@ -1,4 +1,4 @@
-import sensor, image, lcd, math, time
+import sensor, image, lcd, math, time, gc
 from machine import UART
 from fpioa_manager import fm
 
@@ -35,54 +35,610 @@ MOVE_SPEED = 0.02  # 增加红点移动速度 (原值0.01)
 last_move_time = time.ticks_ms()
 last_sent_time = 0
 
+# 板面坐标（图像与板面之间的单应变换）
+USE_HOMOGRAPHY = True  # 在板面坐标中生成路径再投影回图像，透视下运动点在实际板面上匀速
+BOARD_WIDTH_MM = 297.0  # 路径矩形（平均矩形）0->1边的实际长度（毫米，按靶纸实测修改）
+BOARD_HEIGHT_MM = 210.0  # 路径矩形1->2边的实际长度（毫米）
+
+# 弧长参数化路径
+USE_ARC_LENGTH = True  # 按周长弧长匀速运动（长边与短边上速度相同），关闭后每条边用时相同
+PATH_SPEED_MM = 50.0  # 板面路径上的切向速度 (毫米/秒)
+PATH_SPEED_PX = 30.0  # 没有单应映射时图像路径上的切向速度 (像素/秒)
+PATH_TOLERANCE = 2.0  # 角点移动超过此值（像素）时重建累计边长表
+
+# 转角速度规划
+USE_CORNER_PROFILE = True  # 梯形速度曲线：接近角点前减速、离开角点后加速，云台不再在角点过冲
+ACCEL_TIME = 0.3  # 从静止加速到路径速度所需时间（秒），决定加速度
+CORNER_RADIUS_RATIO = 0.0  # 转角倒圆半径（相对较短的邻边），0表示在角点停下再转向
+
+# 激光点检测
+USE_LASER = False  # 在矩形区域内寻找激光点，并以板面坐标发送
+LASER_THRESHOLD = (40, 100, 10, 127, -20, 127)  # 激光点颜色阈值 (LAB)
+LASER_MIN_PIXELS = 2  # 激光点最小像素数
+LASER_MAX_PIXELS = 80  # 激光点最大像素数，更大的色块视为干扰
+
 # 矩形检测历史缓存
 RECT_HISTORY_SIZE = 7  # 增加历史缓存大小
-rect_history = []
-rect_history_index = 0
-
-# 缩放图像
+BENCH_SMOOTHER = False  # 记录原始角点轨迹，每BENCH_TRACK_FRAMES帧对比原历史平均与QuadSmoother的延迟和抖动
+BENCH_TRACK_FRAMES = 300  # 每段轨迹的帧数
+smoother_track = []  # 记录中的角点轨迹（未检测到矩形的帧为None）
+smoother_track_start = time.ticks_ms()
+
+# 角点卡尔曼滤波
+USE_KALMAN = True  # 使用匀速模型卡尔曼滤波代替历史加权平均，丢失时按模型预测
+KALMAN_ACCEL = 300  # 加速度噪声标准差 (像素/秒²)，越大跟随越快、越不平滑
+KALMAN_MEAS_STD = 1.5  # 角点观测噪声标准差 (像素)
+KALMAN_INIT_VEL_STD = 100  # 初始化时速度的标准差 (像素/秒)
+KALMAN_GATE = 20.1  # 新息门限（8自由度卡方分布99%分位数）
+KALMAN_MAX_REJECTS = 3  # 连续拒绝N次观测后用新观测重新初始化
+KALMAN_LOST_STD = 15  # 预测的位置标准差超过此值（像素）时视为丢失
+
+# 矩形评分参数
+QUALITY_THRESHOLD = 0.6  # 最低质量分数
+EDGE_WEIGHT = 0.6  # 边长得分权重
+ANGLE_WEIGHT = 0.4  # 角度得分权重
+COS_45 = 0.7071  # 角度偏差45°时的|cos|，此时角度得分为0
+BENCHMARK = False  # 定期运行基准测试：原评分与批量评分的吞吐量、单尺度与多尺度检测
+BENCH_INTERVAL = 30  # 基准测试间隔帧数
+BENCH_REPEAT = 20  # 每次基准测试重复评分的次数
+MAX_CANDIDATES = 8  # 每帧最多评分的候选数
+
+# find_rects阈值闭环调节
+AUTO_THRESHOLD = True  # 根据候选数量和检测结果每帧调节阈值
+RECT_THRESHOLD = 28000  # 初始阈值（保存文件存在时使用上次调节的结果）
+THRESHOLD_MIN = 5000
+THRESHOLD_MAX = 100000
+TARGET_MIN_RECTS = 1  # 候选数目标区间下限
+TARGET_MAX_RECTS = 3  # 候选数目标区间上限
+THRESHOLD_STEP = 0.1  # 每帧相对调整比例
+THRESHOLD_SEARCH_FRAMES = 10  # 没有候选时最多连续降低阈值的帧数，之后保持不变
+SAVE_STABLE_FRAMES = 30  # 连续N帧处于目标区间后保存阈值
+THRESHOLD_FILE = "/flash/rect_threshold_edge.txt"
+
+# 串口命令
+CMD_BUFFER_SIZE = 256  # 接收环形缓冲区大小（字节）
+CMD_MAX_LENGTH = 32  # '$'帧的最大长度，超长的帧被丢弃
+CMD_MAX_PER_FRAME = 4  # 每帧最多执行的命令数
+SEND_PERIOD = 50  # 坐标发送周期（毫秒）
+DISPLAY_MODE = 1  # 1: 在LCD上显示标注后的图像，0: 不刷新LCD
+# 可通过 $GET,名称 / $SET,名称,值 读写的参数：名称 -> (全局变量, 类型, 最小值, 最大值)
+PARAMS = {
+    "SPEED": ("MOVE_SPEED", float, 0.0, 1.0),
+    "SPEED_MM": ("PATH_SPEED_MM", float, 1.0, 1000.0),
+    "SPEED_PX": ("PATH_SPEED_PX", float, 1.0, 1000.0),
+    "THRESHOLD": ("rect_threshold", int, THRESHOLD_MIN, THRESHOLD_MAX),
+    "AUTO": ("AUTO_THRESHOLD", int, 0, 1),
+    "PERIOD": ("SEND_PERIOD", int, 10, 1000),
+    "DISPLAY": ("DISPLAY_MODE", int, 0, 1),
+}
+
+# 全分辨率角点精化
+REFINE_CORNERS = True  # 半分辨率检测后在原图上用直线拟合求亚像素角点
+REFINE_RADIUS = 4  # 沿法线搜索边缘的半径（原图像素）
+REFINE_SPAN = 16  # 角点附近用于拟合的边长范围（原图像素）
+REFINE_SAMPLES = 4  # 每条边的采样剖面数
+REFINE_MIN_GRADIENT = 20  # 最小边缘梯度（灰度差）
+
+# 边框宽度测量
+MEASURE_BORDER = True  # 沿各边法线测量实际边框宽度，代替按比例估算
+BORDER_SAMPLES = 3  # 每条边的采样剖面数
+BORDER_MAX_RATIO = 0.3  # 剖面在边两侧的搜索范围（相对边长）
+BORDER_MIN_GRADIENT = 30  # 边框内外边缘的最小梯度（灰度差）
+BORDER_RESCALE = 0.1  # 矩形平均边长变化超过此比例时重新测量
+border_cache_width = None  # 缓存的边框宽度（原图像素）
+border_cache_scale = 0  # 测量时的平均边长
+frame_count = 0
+
+# 跟踪模式：只在上一次矩形附近搜索
+USE_ROI_TRACKING = True  # 关闭后每帧全图搜索
+ROI_MARGIN = 0.25  # 搜索区域外扩比例（相对外接框较长边），每丢失一帧再加一份
+ROI_MIN_MARGIN = 8  # 最小外扩像素（缩放图像）
+FULL_SEARCH_MISSES = 3  # 连续丢失N帧后改为全图搜索
+FPS_WINDOW = 100  # 每N帧统计一次稳态帧率
+track_box = None  # 上一次矩形在缩放图像上的外接框
+last_corners = None  # 上一次检测到的角点（缩放图像，已对应编号）
+miss_count = 0
+roi_frames = 0
+fps_frames = 0
+fps_start = time.ticks_ms()
+
+# 缩放缓冲池
+USE_BUFFER_POOL = True  # 半分辨率图像只在启动时分配一次，之后每帧把均值池化的结果写入其中
+scaled_buffer = None
+pool_into_buffer = True  # 固件的mean_pooled不支持写入已有图像时自动置为False
+scale_alloc = 0  # 本统计窗口内缩放步骤分配的堆内存（字节）
+
+# 遥测
+STATUS_PERIOD = 1000  # 状态消息（如未检测到矩形）的最小发送间隔（毫秒）
+STATUS_NO_RECT = b"E,No rectangle detected\n"
+last_status_time = time.ticks_ms() - STATUS_PERIOD
+packet_alloc = 0  # 本统计窗口内打包和发送分配的堆内存（字节）
+
+# 多尺度检测：全图搜索时先在1/4分辨率图像上找候选，再在半分辨率图像的小ROI中验证
+MULTI_SCALE = True  # 关闭后全图搜索直接在半分辨率图像上进行（跟踪ROI搜索不受影响）
+PROPOSAL_SCALE = 2  # 候选图像相对半分辨率图像的缩小倍数（160x120 -> 80x60）
+PROPOSAL_THRESHOLD_RATIO = 0.5  # 候选阶段阈值比例：边长减半，边缘强度之和约减半
+MAX_PROPOSALS = 3  # 每帧最多验证的候选数（按边缘强度）
+VERIFY_MARGIN = 6  # 验证ROI外扩像素（半分辨率图像）
+VERIFY_SIZE_TOL = 0.15  # 验证结果与候选外接框尺寸的最大相对偏差
+proposal_buffer = None  # 预先分配的候选图像
+bench_min_side = [None, None]  # 基准测试中单尺度/多尺度仍能检测到的最小矩形短边（原图像素）
+
+# 缩放图像：scale×scale均值池化（不修改原图，抗混叠），使用缓冲池时结果写入预先分配的图像，稳态帧不再分配新图像
 def scale_image(img, scale):
+    global scaled_buffer, pool_into_buffer
     width = img.width() // scale
     height = img.height() // scale
-    img_scaled = img.resize(width, height)
-    return img_scaled
-
-# 确保顶点顺序为顺时针
+    if USE_BUFFER_POOL:
+        if scaled_buffer is None or scaled_buffer.width() != width or scaled_buffer.height() != height:
+            scaled_buffer = image.Image(size=(width, height))
+        if pool_into_buffer:
+            try:
+                return img.mean_pooled(scale, scale, copy=scaled_buffer)
+            except TypeError:
+                pool_into_buffer = False
+                print("mean_pooled cannot write into a buffer, allocating per frame")
+        return img.mean_pooled(scale, scale)
+    return img.resize(width, height)
+
+# 确保顶点顺序为顺时针：用叉积找出与第一个点相对的顶点排成环形，再按有向面积决定方向，
+# 不做atan2排序；起始角点由associate_corners决定
 def ensure_clockwise(corners):
     if len(corners) != 4:
         return corners
 
-    # 计算凸包中心
+    p0 = corners[0]
+    ordered = list(corners)
+    for k in (1, 2, 3):
+        a, b = [corners[i] for i in (1, 2, 3) if i != k]
+        dx, dy = corners[k][0] - p0[0], corners[k][1] - p0[1]
+        # 对角点：另外两点分别位于p0到该点连线的两侧
+        if (dx * (a[1] - p0[1]) - dy * (a[0] - p0[0])) * (dx * (b[1] - p0[1]) - dy * (b[0] - p0[0])) < 0:
+            ordered = [p0, a, corners[k], b]
+            break
+
+    area = 0
+    for i in range(4):
+        x1, y1 = ordered[i]
+        x2, y2 = ordered[(i + 1) % 4]
+        area += (x1 * y2 - x2 * y1)
+
+    return ordered if area > 0 else [ordered[0], ordered[3], ordered[2], ordered[1]]
+
+# 矩形顶点的外接框 (x, y, w, h)
+def corners_box(corners):
+    xs = [p[0] for p in corners]
+    ys = [p[1] for p in corners]
+    return (min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+
+# 根据上一次的外接框计算搜索区域：每丢失一帧多外扩一份边距，连续丢失过多时返回None（全图搜索）
+def search_roi(box, misses, width, height):
+    if box is None or misses >= FULL_SEARCH_MISSES:
+        return None
+    x, y, w, h = box
+    margin = int(max(w, h) * ROI_MARGIN * (misses + 1)) + ROI_MIN_MARGIN
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(width, x + w + margin), min(height, y + h + margin)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+# 读取上次保存的阈值，文件不存在时使用默认值
+def load_threshold(default):
+    try:
+        with open(THRESHOLD_FILE) as f:
+            return max(THRESHOLD_MIN, min(THRESHOLD_MAX, int(f.read())))
+    except Exception:
+        return default
+
+# 保存阈值到文件
+def save_threshold(threshold):
+    try:
+        with open(THRESHOLD_FILE, "w") as f:
+            f.write(str(threshold))
+    except Exception as e:
+        print("Threshold save error:", e)
+
+# 闭环调节阈值：候选过多时提高阈值；没有候选时降低阈值，但连续THRESHOLD_SEARCH_FRAMES帧仍没有候选时
+# 视野中可能没有目标，保持阈值不再降低；有候选但最佳分数低于QUALITY_THRESHOLD时降低阈值只会引入更多
+# 噪声候选，同样保持不变；连续稳定SAVE_STABLE_FRAMES帧后打印收敛帧数，与已保存值相差超过5%时写入文件
+def update_threshold(count, best_score):
+    global rect_threshold, stable_frames, saved_threshold, tune_frames, empty_frames
+    tune_frames += 1
+    empty_frames = empty_frames + 1 if count < TARGET_MIN_RECTS else 0
+    if count > TARGET_MAX_RECTS:
+        rect_threshold = min(THRESHOLD_MAX, int(rect_threshold * (1 + THRESHOLD_STEP)))
+        stable_frames = 0
+    elif count < TARGET_MIN_RECTS:
+        if empty_frames <= THRESHOLD_SEARCH_FRAMES:
+            rect_threshold = max(THRESHOLD_MIN, int(rect_threshold * (1 - THRESHOLD_STEP)))
+        stable_frames = 0
+    elif best_score < QUALITY_THRESHOLD:
+        stable_frames = 0
+    else:
+        stable_frames += 1
+        if stable_frames == SAVE_STABLE_FRAMES:
+            print("Threshold settled at {} after {} frames".format(rect_threshold, tune_frames))
+            if abs(rect_threshold - saved_threshold) > saved_threshold * 0.05:
+                save_threshold(rect_threshold)
+                saved_threshold = rect_threshold
+
+# 读取全分辨率图像的灰度值（越界返回None）
+def gray_at(img, x, y):
+    if 0 <= x < img.width() and 0 <= y < img.height():
+        r, g, b = img.get_pixel(x, y)
+        return (r * 77 + g * 150 + b * 29) >> 8
+    return None
+
+# 从(x, y)沿法线(nx, ny)采样灰度剖面，返回梯度最强处的亚像素偏移（没有明显边缘时返回None）
+def edge_offset(img, x, y, nx, ny):
+    r = REFINE_RADIUS
+    profile = []
+    for k in range(-r - 2, r + 3):
+        v = gray_at(img, int(x + nx * k + 0.5), int(y + ny * k + 0.5))
+        if v is None:
+            return None
+        profile.append(v)
+
+    # 中心差分梯度，在[-r, r]内找绝对值最大处
+    grads = [abs(profile[k + 1] - profile[k - 1]) for k in range(1, len(profile) - 1)]
+    best_k = 1
+    for k in range(2, len(grads) - 1):
+        if grads[k] > grads[best_k]:
+            best_k = k
+    if grads[best_k] < REFINE_MIN_GRADIENT:
+        return None
+
+    # 抛物线插值求峰值的亚像素位置
+    offset = best_k - r - 1
+    g0, g1, g2 = grads[best_k - 1], grads[best_k], grads[best_k + 1]
+    den = g0 - 2 * g1 + g2
+    if den < 0:
+        offset += 0.5 * (g0 - g2) / den
+    return offset
+
+# 拟合角点corner到相邻角点other这条边在角点附近的直线，返回 (点x, 点y, 方向x, 方向y)
+def fit_side(img, corner, other):
+    dx, dy = other[0] - corner[0], other[1] - corner[1]
+    length = math.sqrt(dx*dx + dy*dy)
+    if length < 4:
+        return None
+    dx, dy = dx / length, dy / length
+    nx, ny = -dy, dx
+    span = min(REFINE_SPAN, length * 0.45)
+
+    # 沿边取几个采样位置，记录边缘相对粗略边的法向偏移
+    ts, offsets = [], []
+    for i in range(REFINE_SAMPLES):
+        t = span * (i + 1) / REFINE_SAMPLES
+        o = edge_offset(img, corner[0] + dx * t, corner[1] + dy * t, nx, ny)
+        if o is not None:
+            ts.append(t)
+            offsets.append(o)
+
+    # 最小二乘拟合 offset = a + b*t，剔除残差超过1像素的点后再拟合一次
+    for _ in range(2):
+        n = len(ts)
+        if n < 2:
+            return None
+        st, so = sum(ts), sum(offsets)
+        stt = sum(t * t for t in ts)
+        sto = sum(t * o for t, o in zip(ts, offsets))
+        den = n * stt - st * st
+        if den == 0:
+            return None
+        b = (n * sto - st * so) / den
+        a = (so - b * st) / n
+        keep = [i for i in range(n) if abs(a + b * ts[i] - offsets[i]) <= 1.0]
+        if len(keep) == n:
+            break
+        ts = [ts[i] for i in keep]
+        offsets = [offsets[i] for i in keep]
+
+    return (corner[0] + nx * a, corner[1] + ny * a, dx + nx * b, dy + ny * b)
+
+# 在全分辨率图像上精化角点：对每个角点的两条相邻边各拟合一条直线并求交点，
+# 只访问角点附近的小窗口；拟合失败或交点偏离过远时保留原角点
+def refine_corners(img, corners):
+    refined = []
+    for i in range(4):
+        corner = corners[i]
+        line1 = fit_side(img, corner, corners[i - 1])
+        line2 = fit_side(img, corner, corners[(i + 1) % 4])
+        if line1 is None or line2 is None:
+            refined.append(corner)
+            continue
+        px, py, vx, vy = line1
+        qx, qy, wx, wy = line2
+        cross = vx * wy - vy * wx
+        if abs(cross) < 0.1:  # 两边接近平行
+            refined.append(corner)
+            continue
+        u = ((qx - px) * wy - (qy - py) * wx) / cross
+        x, y = px + vx * u, py + vy * u
+        if abs(x - corner[0]) > 2 * REFINE_RADIUS or abs(y - corner[1]) > 2 * REFINE_RADIUS:
+            refined.append(corner)
+        else:
+            refined.append((x, y))
+    return refined
+
+# 沿各边内法线采样灰度剖面测量边框宽度（原图像素）：外边缘取由亮变暗最强处，
+# 内边缘取其内侧由暗变亮最强处，取所有剖面的中位数；有效剖面太少时返回None
+def measure_border_width(img, corners):
     cx = sum(p[0] for p in corners) / 4
     cy = sum(p[1] for p in corners) / 4
+    widths = []
+    for i in range(4):
+        x0, y0 = corners[i]
+        x1, y1 = corners[(i + 1) % 4]
+        dx, dy = x1 - x0, y1 - y0
+        length = math.sqrt(dx*dx + dy*dy)
+        if length < 8:
+            continue
+        nx, ny = -dy / length, dx / length
+        # 法线指向矩形内部
+        if (cx - (x0 + x1) / 2) * nx + (cy - (y0 + y1) / 2) * ny < 0:
+            nx, ny = -nx, -ny
+        reach = int(length * BORDER_MAX_RATIO)
+
+        for s in range(BORDER_SAMPLES):
+            t = (s + 1) / (BORDER_SAMPLES + 1)
+            px, py = x0 + dx * t, y0 + dy * t
+            profile = []
+            for k in range(-reach, reach + 1):
+                v = gray_at(img, int(px + nx * k + 0.5), int(py + ny * k + 0.5))
+                if v is None:
+                    break
+                profile.append(v)
+            if len(profile) < 2 * reach + 1:
+                continue
 
-    # 计算每个点相对于中心的角度
-    angles = []
-    for x, y in corners:
-        dx = x - cx
-        dy = y - cy
-        angles.append(math.atan2(dy, dx))
-
-    # 按角度排序
-    sorted_corners = [p for _, p in sorted(zip(angles, corners))]
-
-    # 确保第一个点是左上角
-    min_index = 0
-    min_distance = float('inf')
-    for i, (x, y) in enumerate(sorted_corners):
-        distance = x + y  # 左上角通常是x+y最小的点
-        if distance < min_distance:
-            min_distance = distance
-            min_index = i
-
-    # 旋转列表使左上角在前
-    return sorted_corners[min_index:] + sorted_corners[:min_index]
+            # 由外向内的中心差分梯度
+            outer, outer_g = 0, 0
+            for k in range(1, len(profile) - 1):
+                g = profile[k + 1] - profile[k - 1]
+                if g < outer_g:
+                    outer, outer_g = k, g
+            inner, inner_g = 0, 0
+            for k in range(outer + 1, len(profile) - 1):
+                g = profile[k + 1] - profile[k - 1]
+                if g > inner_g:
+                    inner, inner_g = k, g
+            if -outer_g >= BORDER_MIN_GRADIENT and inner_g >= BORDER_MIN_GRADIENT:
+                widths.append(inner - outer)
+
+    if len(widths) < 3:
+        return None
+    widths.sort()
+    return widths[len(widths) // 2]
+
+# 边框宽度（原图像素）：缓存测量结果，平均边长变化超过BORDER_RESCALE时才重新测量，
+# 其余时间按边长比例缩放缓存值；从未测量成功时使用fallback。返回 (宽度, 是否为测量值)
+def get_border_width(img, corners, fallback):
+    global border_cache_width, border_cache_scale
+    scale = sum(distance(corners[i], corners[(i + 1) % 4]) for i in range(4)) / 4
+    if scale <= 0:
+        return fallback, False
+    if border_cache_width is None or abs(scale - border_cache_scale) > border_cache_scale * BORDER_RESCALE:
+        measured = measure_border_width(img, corners)
+        if measured is not None:
+            border_cache_width, border_cache_scale = measured, scale
+            print("Border width: {} px (side {:.1f} px)".format(measured, scale))
+    if border_cache_width is None:
+        return fallback, False
+    return border_cache_width * scale / border_cache_scale, True
+
+# 四边形平滑器：环形缓冲保存最近size帧的角点，按新旧线性加权（最新帧权重size，最旧帧权重1）。
+# 维护有效帧的坐标和与加权和，新帧到来时所有旧帧权重减1等价于 加权和 -= 坐标和，每帧O(1)更新；
+# 丢失的帧记为None，占用缓冲位置但不参与平均
+class QuadSmoother:
+    def __init__(self, size):
+        self.size = size
+        self.buf = [None] * size
+        self.index = 0
+        self.sum = [0] * 8    # 有效帧坐标之和 (x0, y0, ..., x3, y3)
+        self.wsum = [0] * 8   # 有效帧加权坐标之和
+        self.count = 0        # 缓冲中的有效帧数
+        self.weight = 0       # 有效帧权重之和
+
+    # 加入一帧角点，corners为None表示该帧未检测到矩形
+    def push(self, corners):
+        s, ws, n = self.sum, self.wsum, self.size
+        # 已有帧的权重各减1，最旧帧权重减为0后移出
+        for k in range(8):
+            ws[k] -= s[k]
+        self.weight -= self.count
+        old = self.buf[self.index]
+        if old is not None:
+            for k in range(8):
+                s[k] -= old[k]
+            self.count -= 1
+
+        flat = None
+        if corners is not None:
+            flat = (corners[0][0], corners[0][1], corners[1][0], corners[1][1],
+                    corners[2][0], corners[2][1], corners[3][0], corners[3][1])
+            for k in range(8):
+                s[k] += flat[k]
+                ws[k] += n * flat[k]
+            self.count += 1
+            self.weight += n
+        self.buf[self.index] = flat
+        self.index = (self.index + 1) % n
+
+    # 加权平均角点，缓冲中没有有效帧时返回None
+    def average(self):
+        if self.weight == 0:
+            return None
+        ws, w = self.wsum, self.weight
+        return [(int(ws[2*j] / w), int(ws[2*j + 1] / w)) for j in range(4)]
+
+# 角点卡尔曼滤波：8个坐标各自为匀速模型 (位置, 速度)，观测为位置。
+# 各坐标的模型和观测噪声相同，协方差随时间的演化也相同，因此只保存一份2x2协方差 [[a, b], [b, c]]，
+# 预测和更新都是闭式标量运算；整组角点的新息马氏距离超过门限时拒绝该次观测
+class CornerKalman:
+    def __init__(self, accel, meas_std, gate, max_rejects):
+        self.q = accel * accel        # 加速度白噪声方差 (像素/秒²)²
+        self.r = meas_std * meas_std  # 观测噪声方差 (像素²)
+        self.gate = gate              # 8自由度卡方门限
+        self.max_rejects = max_rejects
+        self.pos = [0.0] * 8
+        self.vel = [0.0] * 8
+        self.a = self.b = self.c = 0.0
+        self.ready = False
+        self.rejects = 0              # 连续被拒绝的观测数
+
+    # 用一组观测重新初始化：速度为0，速度方差取较大值
+    def reset(self, corners):
+        for j in range(4):
+            self.pos[2*j], self.pos[2*j + 1] = corners[j][0], corners[j][1]
+        self.vel = [0.0] * 8
+        self.a, self.b, self.c = self.r, 0.0, KALMAN_INIT_VEL_STD ** 2
+        self.rejects = 0
+        self.ready = True
+
+    # 按时间间隔dt（秒）预测
+    def predict(self, dt):
+        if not self.ready:
+            return
+        pos, vel = self.pos, self.vel
+        for k in range(8):
+            pos[k] += vel[k] * dt
+        a, b, c, q = self.a, self.b, self.c, self.q
+        dt2 = dt * dt
+        self.a = a + 2 * dt * b + dt2 * c + q * dt2 * dt2 / 4
+        self.b = b + dt * c + q * dt2 * dt / 2
+        self.c = c + q * dt2
+
+    # 用检测到的角点更新，返回是否接受该观测
+    def update(self, corners):
+        if not self.ready:
+            self.reset(corners)
+            return True
+        pos, vel = self.pos, self.vel
+        s = self.a + self.r
+        innov = [0.0] * 8
+        d2 = 0.0
+        for j in range(4):
+            innov[2*j] = corners[j][0] - pos[2*j]
+            innov[2*j + 1] = corners[j][1] - pos[2*j + 1]
+        for y in innov:
+            d2 += y * y
+        # 新息门限：连续多次拒绝说明目标确实跳变（例如换了位置），直接重新初始化
+        if d2 / s > self.gate:
+            self.rejects += 1
+            if self.rejects >= self.max_rejects:
+                self.reset(corners)
+                return True
+            return False
+        self.rejects = 0
+        ka, kb = self.a / s, self.b / s
+        for k in range(8):
+            pos[k] += ka * innov[k]
+            vel[k] += kb * innov[k]
+        a, b, c = self.a, self.b, self.c
+        self.a = a - a * a / s
+        self.b = b - a * b / s
+        self.c = c - b * b / s
+        return True
+
+    # 每个角点坐标的位置标准差（像素），供后续判断结果是否可信
+    def std(self):
+        return math.sqrt(self.a) if self.ready else float('inf')
+
+    # 当前估计的角点（整数像素坐标）
+    def corners(self):
+        pos = self.pos
+        return [(int(pos[2*j] + 0.5), int(pos[2*j + 1] + 0.5)) for j in range(4)]
+
+# 角点对应：在新四边形的4种循环起点和2种方向中，选与上一帧角点总位移（平方和）最小的排列，
+# 使角点编号在帧间保持稳定；没有上一帧时以x+y最小的点（左上角）为起点
+def associate_corners(corners, previous):
+    corners = list(corners)
+    if previous is None:
+        start = 0
+        for i in range(1, 4):
+            if corners[i][0] + corners[i][1] < corners[start][0] + corners[start][1]:
+                start = i
+        return corners[start:] + corners[:start]
+
+    best, best_cost = corners, -1
+    for order in (corners, [corners[0], corners[3], corners[2], corners[1]]):
+        for s in range(4):
+            cost = 0
+            for j in range(4):
+                p, q = order[(s + j) % 4], previous[j]
+                cost += (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2
+            if best_cost < 0 or cost < best_cost:
+                best, best_cost = order[s:] + order[:s], cost
+    return best
+
+# 原实现的历史平均（仅用于对比）：权重按缓冲位置取 size - i，缓冲绕回后最旧的帧可能权重最大
+def legacy_average(history):
+    size = len(history)
+    sums = [0] * 8
+    total_weight = 0
+    for i, corners in enumerate(history):
+        if corners is None:
+            continue
+        weight = size - i
+        total_weight += weight
+        for j in range(4):
+            sums[2*j] += corners[j][0] * weight
+            sums[2*j + 1] += corners[j][1] * weight
+    if total_weight == 0:
+        return None
+    return [(int(sums[2*j] / total_weight), int(sums[2*j + 1] / total_weight)) for j in range(4)]
+
+# 平滑结果的延迟：使平滑角点与k帧前原始角点平均距离最小的k（帧）
+def smoothing_lag(track, output, max_lag):
+    best_lag, best_err = 0, -1
+    for k in range(max_lag + 1):
+        err, n = 0.0, 0
+        for t in range(k, len(track)):
+            raw, out = track[t - k], output[t]
+            if raw is None or out is None:
+                continue
+            for j in range(4):
+                err += math.sqrt((out[j][0] - raw[j][0])**2 + (out[j][1] - raw[j][1])**2)
+            n += 4
+        if n and (best_err < 0 or err / n < best_err):
+            best_lag, best_err = k, err / n
+    return best_lag
+
+# 平滑结果的抖动：连续三帧角点二阶差分的均方根（像素）
+def smoothing_jitter(output):
+    total, n = 0.0, 0
+    for t in range(2, len(output)):
+        a, b, c = output[t - 2], output[t - 1], output[t]
+        if a is None or b is None or c is None:
+            continue
+        for j in range(4):
+            for k in range(2):
+                d = c[j][k] - 2 * b[j][k] + a[j][k]
+                total += d * d
+                n += 1
+    return math.sqrt(total / n) if n else 0.0
+
+# 在记录的角点轨迹上重放原历史平均与QuadSmoother（轨迹中None表示该帧未检测到矩形），
+# 返回 ((原延迟帧数, 原抖动), (新延迟帧数, 新抖动))
+def compare_smoothers(track, size):
+    history = [None] * size
+    index = 0
+    ring = QuadSmoother(size)
+    legacy_out, ring_out = [], []
+    for corners in track:
+        history[index] = corners
+        index = (index + 1) % size
+        ring.push(corners)
+        legacy_out.append(legacy_average(history))
+        ring_out.append(ring.average())
+    return ((smoothing_lag(track, legacy_out, size), smoothing_jitter(legacy_out)),
+            (smoothing_lag(track, ring_out, size), smoothing_jitter(ring_out)))
 
 # 计算两点之间的距离
 def distance(p1, p2):
     return math.sqrt((p2[0]-p1[0])**2 + (p2[1]-p1[1])**2)
 
-# 计算矩形质量分数 (更严格的评分)
+# 计算矩形质量分数（原实现，仅用于基准测试对比）
 def calculate_rectangle_quality(corners):
     if len(corners) != 4:
         return 0
@@ -139,30 +695,573 @@ def calculate_rectangle_quality(corners):
     # 综合评分（更严格的阈值）
     return (edge_score * 0.6) + (angle_score * 0.4)
 
-# 处理串口命令
-def handle_uart_commands():
-    global SEND_COORDINATES, PAUSED
-
-    if uart.any():
-        try:
-            cmd = uart.read(1).decode()
-            print("Received command:", cmd)
-
-            if cmd == 'P':  # 暂停/继续
-                PAUSED = not PAUSED
-                uart.write("Pause:" + ("ON" if PAUSED else "OFF") + "\n")
-
-            elif cmd == 'R':  # 复位
-                PAUSED = False
-                current_position = 0.0
-                uart.write("RESET\n")
+# 批量评估本帧所有候选矩形，返回 (最佳矩形, 分数)，没有达到min_score的候选时返回 (None, min_score)
+# 只用平方边长和余弦：边长得分为 sqrt(最短边²/最长边²)，角度得分由各角|cos|的平均值给出（45°偏差时为0）；
+# 非凸四边形、边长比不可能胜出的候选在计算角度前就被跳过
+def find_best_rect(rects, min_score):
+    best_rect = None
+    best_score = min_score
+    # 边长比下限：edge_score低于此值时即使四个角都是直角也无法超过best_score
+    limit = (best_score - ANGLE_WEIGHT) / EDGE_WEIGHT
+    limit2 = limit * limit if limit > 0 else 0.0
+    for rect in rects:
+        corners = rect.corners()
+        if len(corners) != 4:
+            continue
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = corners
+
+        # 四条边向量及平方长度
+        ax, ay = x1 - x0, y1 - y0
+        bx, by = x2 - x1, y2 - y1
+        cx, cy = x3 - x2, y3 - y2
+        dx, dy = x0 - x3, y0 - y3
+        la = ax*ax + ay*ay
+        lb = bx*bx + by*by
+        lc = cx*cx + cy*cy
+        ld = dx*dx + dy*dy
+        lmin = min(la, lb, lc, ld)
+        lmax = max(la, lb, lc, ld)
+        if lmin == 0 or lmin < limit2 * lmax:
+            continue
 
-            elif cmd == 'S':  # 开始/停止发送坐标
-                SEND_COORDINATES = not SEND_COORDINATES
-                uart.write("Send:" + ("ON" if SEND_COORDINATES else "OFF") + "\n")
+        # 凸性检查：相邻边叉积同号（顺时针或逆时针均可，与顶点起始位置无关）
+        c0 = dx*ay - dy*ax
+        c1 = ax*by - ay*bx
+        c2 = bx*cy - by*cx
+        c3 = cx*dy - cy*dx
+        if not ((c0 > 0 and c1 > 0 and c2 > 0 and c3 > 0) or
+                (c0 < 0 and c1 < 0 and c2 < 0 and c3 < 0)):
+            continue
 
+        # 各角余弦的绝对值：相邻两边点积 / 两边长度之积
+        cos_sum = (abs(dx*ax + dy*ay) / math.sqrt(ld * la) +
+                   abs(ax*bx + ay*by) / math.sqrt(la * lb) +
+                   abs(bx*cx + by*cy) / math.sqrt(lb * lc) +
+                   abs(cx*dx + cy*dy) / math.sqrt(lc * ld))
+        score = (EDGE_WEIGHT * math.sqrt(lmin / lmax) +
+                 ANGLE_WEIGHT * (1 - cos_sum / (4 * COS_45)))
+        if score > best_score:
+            best_score = score
+            best_rect = rect
+            limit = (best_score - ANGLE_WEIGHT) / EDGE_WEIGHT
+            limit2 = limit * limit if limit > 0 else 0.0
+    return best_rect, best_score
+
+# 对比原评分（逐个排序+acos）与批量评分的吞吐量（候选数/毫秒）
+def bench_quality(rects):
+    if not rects:
+        return
+    t0 = time.ticks_us()
+    for _ in range(BENCH_REPEAT):
+        legacy_rect, legacy_score = None, QUALITY_THRESHOLD
+        for rect in rects:
+            corners = rect.corners()
+            if len(corners) != 4:
+                continue
+            score = calculate_rectangle_quality(ensure_clockwise(corners))
+            if score > legacy_score:
+                legacy_rect, legacy_score = rect, score
+    t1 = time.ticks_us()
+    for _ in range(BENCH_REPEAT):
+        batch_rect, batch_score = find_best_rect(rects, QUALITY_THRESHOLD)
+    t2 = time.ticks_us()
+    n = len(rects) * BENCH_REPEAT
+    print("Quad scoring: {} candidates, legacy {:.1f}/ms, batch {:.1f}/ms, same best: {}".format(
+        len(rects), n * 1000 / max(1, time.ticks_diff(t1, t0)),
+        n * 1000 / max(1, time.ticks_diff(t2, t1)), legacy_rect is batch_rect))
+
+# 候选阶段：把半分辨率图像再缩小到预先分配的候选图像中，在其上全图找矩形，返回(候选, 候选总数)
+def propose_rects(img_scaled, threshold):
+    global proposal_buffer
+    width = img_scaled.width() // PROPOSAL_SCALE
+    height = img_scaled.height() // PROPOSAL_SCALE
+    if proposal_buffer is None or proposal_buffer.width() != width or proposal_buffer.height() != height:
+        proposal_buffer = image.Image(size=(width, height))
+    proposal_buffer.draw_image(img_scaled, 0, 0, x_scale=1.0 / PROPOSAL_SCALE, y_scale=1.0 / PROPOSAL_SCALE)
+    proposals = proposal_buffer.find_rects(threshold=int(threshold * PROPOSAL_THRESHOLD_RATIO))
+    count = len(proposals)
+    if count > MAX_PROPOSALS:
+        proposals = sorted(proposals, key=lambda r: r.magnitude(), reverse=True)[:MAX_PROPOSALS]
+    return proposals, count
+
+# 验证阶段：在候选外接框（放大到半分辨率并外扩）内重新检测，
+# 没有检测到或尺寸与候选不符的候选被丢弃（相邻候选的ROI重叠时同一矩形只保留一次），返回半分辨率图像坐标
+def verify_rects(img_scaled, proposals, threshold):
+    width, height = img_scaled.width(), img_scaled.height()
+    verified = []
+    for proposal in proposals:
+        x, y, w, h = corners_box(proposal.corners())
+        w, h = w * PROPOSAL_SCALE, h * PROPOSAL_SCALE
+        x0 = max(0, x * PROPOSAL_SCALE - VERIFY_MARGIN)
+        y0 = max(0, y * PROPOSAL_SCALE - VERIFY_MARGIN)
+        x1 = min(width, x * PROPOSAL_SCALE + w + VERIFY_MARGIN)
+        y1 = min(height, y * PROPOSAL_SCALE + h + VERIFY_MARGIN)
+        for rect in img_scaled.find_rects(roi=(x0, y0, x1 - x0, y1 - y0), threshold=threshold):
+            _, _, rw, rh = corners_box(rect.corners())
+            # 候选坐标有±1个候选像素的量化误差，容差再加一个缩放倍数
+            if (abs(rw - w) <= w * VERIFY_SIZE_TOL + PROPOSAL_SCALE and
+                    abs(rh - h) <= h * VERIFY_SIZE_TOL + PROPOSAL_SCALE and
+                    not any(v.corners() == rect.corners() for v in verified)):
+                verified.append(rect)
+    return verified
+
+# 对比单尺度全图检测与多尺度检测的耗时，并记录各自仍能检测到的最小矩形（边缘强度最高者的短边）
+def bench_multiscale(img_scaled, threshold):
+    t0 = time.ticks_us()
+    single = img_scaled.find_rects(threshold=threshold)
+    t1 = time.ticks_us()
+    multi = verify_rects(img_scaled, propose_rects(img_scaled, threshold)[0], threshold)
+    t2 = time.ticks_us()
+    for i, rects in enumerate((single, multi)):
+        if rects:
+            _, _, w, h = corners_box(max(rects, key=lambda r: r.magnitude()).corners())
+            side = min(w, h) * 2
+            if bench_min_side[i] is None or side < bench_min_side[i]:
+                bench_min_side[i] = side
+    print("Rect search: single {:.1f} ms ({} rects), multi-scale {:.1f} ms ({} rects), min side found: single {} px, multi {} px".format(
+        time.ticks_diff(t1, t0) / 1000, len(single), time.ticks_diff(t2, t1) / 1000, len(multi),
+        bench_min_side[0], bench_min_side[1]))
+
+# 串口命令接收：每帧把串口中待读的字节全部读入环形缓冲区（缓冲区满时覆盖最旧的字节），
+# 再从中取出完整的命令：'$'开头、换行结尾的文本命令，或帧外的单字母命令
+class CommandReader:
+    def __init__(self, size, letters, max_length):
+        self.buf = bytearray(size)
+        self.size = size
+        self.start = 0  # 最旧的未处理字节位置
+        self.count = 0  # 未处理字节数
+        self.letters = tuple(letters)  # 单字母命令的字节值（MicroPython不支持 int in bytes）
+        self.line = bytearray(max_length)
+        self.line_len = -1  # 当前'$'帧已收到的长度，-1表示不在帧内
+        self.dropped = 0  # 缓冲区溢出丢弃的字节数
+
+    # 读入串口中所有待读字节
+    def fill(self, uart):
+        n = uart.any()
+        if not n:
+            return
+        data = uart.read(n)
+        if len(data) > self.size:
+            self.dropped += len(data) - self.size
+            data = data[-self.size:]
+        overflow = self.count + len(data) - self.size
+        if overflow > 0:
+            self.start = (self.start + overflow) % self.size
+            self.count -= overflow
+            self.dropped += overflow
+        end = (self.start + self.count) % self.size
+        first = min(len(data), self.size - end)
+        self.buf[end:end + first] = data[:first]
+        self.buf[:len(data) - first] = data[first:]
+        self.count += len(data)
+
+    # 取出下一条完整命令（去掉'$'和换行），没有时返回None；未结束的'$'帧留到下一帧继续拼接
+    def next_command(self):
+        while self.count:
+            b = self.buf[self.start]
+            self.start = (self.start + 1) % self.size
+            self.count -= 1
+            if self.line_len >= 0:
+                if b == 10 or b == 13:  # '\n' 或 '\r' 结束一帧
+                    n = self.line_len
+                    self.line_len = -1
+                    if n:
+                        return bytes(self.line[:n])
+                elif b == 36:  # 新的'$'，丢弃未结束的帧
+                    self.line_len = 0
+                elif self.line_len < len(self.line):
+                    self.line[self.line_len] = b
+                    self.line_len += 1
+                else:  # 超长帧丢弃
+                    self.line_len = -1
+            elif b == 36:  # '$'
+                self.line_len = 0
+            elif b in self.letters:
+                return bytes([b])
+        return None
+
+# 遥测数据包：启动时按固定宽度排好各行并分配缓冲区，发送时只把数字逐位写入，整包一次uart.write；
+# 像素坐标截断到0-999并补零（与edge_run的X000Y000格式相同），板面毫米带符号位截断到±999.9，下位机仍可逐行解析
+class TelemetryPacket:
+    def __init__(self):
+        # C,xxx,yyy  T,xxx,yyy  P,8个顶点坐标  B/L,±xxx.x,±yyy.y（板面毫米，可选）
+        self.buf = bytearray(("C,000,000\nT,000,000\nP," + ",".join(["000"] * 8) + "\nB,+000.0,+000.0\nL,+000.0,+000.0\n").encode())
+        mv = memoryview(self.buf)
+        # 可选行不同组合的整包视图，启动时建好，发送时不再切片
+        self.views = (mv[:54], mv[:70], mv)
+
+    # 在pos处写入三位整数
+    def put(self, pos, value):
+        value = max(0, min(999, int(value)))
+        buf = self.buf
+        buf[pos] = 48 + value // 100
+        buf[pos + 1] = 48 + value // 10 % 10
+        buf[pos + 2] = 48 + value % 10
+
+    # 在pos处写入 ±xxx.x（符号位固定占一个字节）
+    def put_decimal(self, pos, value):
+        value = int(value * 10 + (0.5 if value >= 0 else -0.5))
+        self.buf[pos] = 45 if value < 0 else 43  # '-' 或 '+'
+        value = min(9999, abs(value))
+        self.put(pos + 1, value // 10)
+        self.buf[pos + 5] = 48 + value % 10
+
+    # 写入本次的所有字段，返回要发送的视图；没有板面坐标时省略B行，没有激光点时省略L行
+    def pack(self, center_x, center_y, target_x, target_y, corners, board_pos, laser_board):
+        self.put(2, center_x)
+        self.put(6, center_y)
+        self.put(12, target_x)
+        self.put(16, target_y)
+        for i in range(4):
+            self.put(22 + 8 * i, corners[i][0])
+            self.put(26 + 8 * i, corners[i][1])
+        if not board_pos:
+            return self.views[0]
+        self.put_decimal(56, board_pos[0])
+        self.put_decimal(63, board_pos[1])
+        if not laser_board:
+            return self.views[1]
+        self.put_decimal(72, laser_board[0])
+        self.put_decimal(79, laser_board[1])
+        return self.views[2]
+
+# 处理串口命令：读入所有待读字节，每帧最多执行CMD_MAX_PER_FRAME条，其余留到下一帧
+def handle_uart_commands():
+    try:
+        commands.fill(uart)
+    except Exception as e:
+        print("UART error:", e)
+        return
+    for _ in range(CMD_MAX_PER_FRAME):
+        try:
+            cmd = commands.next_command()
         except Exception as e:
             print("UART error:", e)
+            break
+        if cmd is None:
+            break
+        try:
+            execute_command(cmd.decode())
+        except Exception as e:
+            print("UART error:", e)
+            uart.write(b"$ERR," + cmd + b"\n")
+
+# 读写参数：GET,名称 / SET,名称,值，应答 $OK,名称,当前值
+def execute_param_command(cmd):
+    fields = cmd.split(",")
+    if len(fields) < 2 or fields[1] not in PARAMS:
+        raise ValueError("unknown command")
+    name, kind, low, high = PARAMS[fields[1]]
+    if fields[0] == "SET" and len(fields) == 3:
+        globals()[name] = max(low, min(high, kind(fields[2])))
+    elif fields[0] != "GET" or len(fields) != 2:
+        raise ValueError("unknown command")
+    uart.write("$OK,{},{}\n".format(fields[1], globals()[name]))
+
+# 执行一条命令并应答：单字母命令 P暂停/继续、R复位、S开始/停止发送，其余为参数读写
+def execute_command(cmd):
+    global SEND_COORDINATES, PAUSED, current_position
+    print("Received command:", cmd)
+
+    if cmd == 'P':  # 暂停/继续
+        PAUSED = not PAUSED
+        uart.write("Pause:" + ("ON" if PAUSED else "OFF") + "\n")
+
+    elif cmd == 'R':  # 复位
+        PAUSED = False
+        current_position = 0.0
+        uart.write("RESET\n")
+
+    elif cmd == 'S':  # 开始/停止发送坐标
+        SEND_COORDINATES = not SEND_COORDINATES
+        uart.write("Send:" + ("ON" if SEND_COORDINATES else "OFF") + "\n")
+
+    else:
+        execute_param_command(cmd)
+
+# 图像与板面坐标的映射：由路径矩形的四个角点求单应矩阵（单位正方形到四边形的闭式解），
+# 板面坐标以角点0为原点，0->1边为x轴，0->3边为y轴，单位毫米
+class BoardMapping:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.h = None  # 板面 -> 图像
+        self.inv = None  # 图像 -> 板面
+
+    # 角点更新时求一次单应矩阵及其逆矩阵，四点退化（共线）时返回False
+    def update(self, corners):
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = corners
+        sx = x0 - x1 + x2 - x3
+        sy = y0 - y1 + y2 - y3
+        dx1, dx2 = x1 - x2, x3 - x2
+        dy1, dy2 = y1 - y2, y3 - y2
+        det = dx1 * dy2 - dx2 * dy1
+        if det == 0:
+            self.h = None
+            return False
+        # 平行四边形时g=h=0，退化为仿射变换
+        g = (sx * dy2 - dx2 * sy) / det
+        h = (dx1 * sy - sx * dy1) / det
+        # 单位正方形 -> 图像，再把u、v换成板面毫米
+        a = (x1 - x0 + g * x1) / self.width
+        b = (x3 - x0 + h * x3) / self.height
+        d = (y1 - y0 + g * y1) / self.width
+        e = (y3 - y0 + h * y3) / self.height
+        c, f = x0, y0
+        g, h = g / self.width, h / self.height
+        self.h = (a, b, c, d, e, f, g, h, 1.0)
+        # 逆矩阵取伴随矩阵（单应矩阵与比例无关，不必除以行列式）
+        self.inv = (e - f * h, c * h - b, b * f - c * e,
+                    f * g - d, a - c * g, c * d - a * f,
+                    d * h - e * g, b * g - a * h, a * e - b * d)
+        return True
+
+    # 板面坐标 (毫米) -> 图像坐标
+    def to_image(self, x, y):
+        return self.apply(self.h, x, y)
+
+    # 图像坐标 -> 板面坐标 (毫米)
+    def to_board(self, x, y):
+        return self.apply(self.inv, x, y)
+
+    @staticmethod
+    def apply(m, x, y):
+        w = m[6] * x + m[7] * y + m[8]
+        return ((m[0] * x + m[1] * y + m[2]) / w, (m[3] * x + m[4] * y + m[5]) / w)
+
+# 计算在板面矩形边缘上的位置（毫米），position的含义与get_position_on_edge相同
+def get_board_position(position):
+    position %= 4.0
+    edge_index = int(position)
+    t = position - edge_index
+    p0 = BOARD_CORNERS[edge_index]
+    p1 = BOARD_CORNERS[(edge_index + 1) % 4]
+    return (p0[0] * (1 - t) + p1[0] * t, p0[1] * (1 - t) + p1[1] * t)
+
+# 周长采样器：按弧长参数化路径四边形。累计边长表只在角点移动超过容差时重建，
+# 采样时在当前角点上插值，每次采样最多比较三次；四边等长时与get_position_on_edge结果相同
+class PerimeterSampler:
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.reference = None  # 建表时的角点
+        self.corners = None
+        self.breaks = [0.0, 1.0, 2.0, 3.0, 4.0]  # 各角点处的position（累计边长/周长*4）
+        self.length = 0.0  # 周长
+
+    # 更新当前角点，需要时重建累计边长表；返回是否重建
+    def update(self, corners):
+        self.corners = corners
+        if self.reference is not None and all(
+                abs(c[0] - r[0]) <= self.tolerance and abs(c[1] - r[1]) <= self.tolerance
+                for c, r in zip(corners, self.reference)):
+            return False
+        self.reference = [(c[0], c[1]) for c in corners]
+        lengths = [distance(corners[i], corners[(i + 1) % 4]) for i in range(4)]
+        self.length = sum(lengths)
+        if self.length > 0:
+            total = 0.0
+            for i in range(3):
+                total += lengths[i]
+                self.breaks[i + 1] = 4.0 * total / self.length
+        return True
+
+    # position为0-4（周长比例*4）
+    def sample(self, position):
+        position %= 4.0
+        i = 0
+        while i < 3 and position >= self.breaks[i + 1]:
+            i += 1
+        span = self.breaks[i + 1] - self.breaks[i]
+        t = (position - self.breaks[i]) / span if span > 0 else 0.0
+        p0 = self.corners[i]
+        p1 = self.corners[(i + 1) % 4]
+        return (p0[0] * (1 - t) + p1[0] * t, p0[1] * (1 - t) + p1[1] * t)
+
+# 转角速度规划：每条直边用梯形速度曲线（加速-匀速-减速），转角处减速到倒圆弧允许的速度
+# （向心加速度不超过加速度，不倒圆时在角点停下）。角点移动超过容差或速度改变时重建，
+# 之后每次推进和采样只在不超过16段的表中查找；position为0-4（路径长度比例*4）
+class CornerProfile:
+    def __init__(self, tolerance, accel_time, radius_ratio):
+        self.tolerance = tolerance
+        self.accel_time = accel_time
+        self.radius_ratio = radius_ratio
+        self.reference = None  # 建表时的角点
+        self.speed = None
+        self.segments = []  # 几何段 (s0, 长度, 起点/圆心, 方向/起始半径向量, 转向, 半径)
+        self.pieces = []  # 运动段 (t0, s0, 时长, 长度, 初速度, 加速度)
+        self.length = 0.0  # 路径总长（含倒圆弧）
+        self.period = 0.0  # 走完一圈的时间（秒）
+
+    # 角点或速度变化时重建速度曲线；返回是否重建
+    def update(self, corners, speed):
+        if self.reference is not None and speed == self.speed and all(
+                abs(c[0] - r[0]) <= self.tolerance and abs(c[1] - r[1]) <= self.tolerance
+                for c, r in zip(corners, self.reference)):
+            return False
+        self.reference = [(c[0], c[1]) for c in corners]
+        self.speed = speed
+        self.build(self.reference, speed, speed / self.accel_time)
+        return True
+
+    def build(self, corners, vmax, accel):
+        lengths = [distance(corners[i], corners[(i + 1) % 4]) for i in range(4)]
+        dirs = []
+        for i in range(4):
+            l = lengths[i] or 1.0
+            p0, p1 = corners[i], corners[(i + 1) % 4]
+            dirs.append(((p1[0] - p0[0]) / l, (p1[1] - p0[1]) / l))
+
+        # 各角点的转角、倒圆半径、切点到角点的距离和允许速度
+        turns, radii, trims, speeds = [], [], [], []
+        for k in range(4):
+            din, dout = dirs[k - 1], dirs[k]
+            cross = din[0] * dout[1] - din[1] * dout[0]
+            turn = math.atan2(abs(cross), din[0] * dout[0] + din[1] * dout[1])
+            half = min(lengths[k - 1], lengths[k]) * 0.5
+            radius = self.radius_ratio * half * 2
+            trim = min(radius * math.tan(turn / 2), half) if turn < 3.1 else 0.0
+            radius = trim / math.tan(turn / 2) if trim > 0 else 0.0
+            turns.append(math.copysign(turn, cross))
+            radii.append(radius)
+            trims.append(trim)
+            if turn < 0.001:
+                speeds.append(vmax)
+            else:
+                speeds.append(min(vmax, math.sqrt(accel * radius)))
+
+        # 直边长度不足以加减速时降低两端的角点速度（前后各两遍，闭合路径）
+        straights = [max(0.0, lengths[k] - trims[k] - trims[(k + 1) % 4]) for k in range(4)]
+        for _ in range(2):
+            for k in range(4):
+                n = (k + 1) % 4
+                speeds[n] = min(speeds[n], math.sqrt(speeds[k] ** 2 + 2 * accel * straights[k]))
+            for k in range(3, -1, -1):
+                n = (k + 1) % 4
+                speeds[k] = min(speeds[k], math.sqrt(speeds[n] ** 2 + 2 * accel * straights[k]))
+
+        # 从角点0之后的直边开始，依次为直边k、角点k+1的倒圆弧
+        self.segments = []
+        self.pieces = []
+        s = t = 0.0
+        for k in range(4):
+            n = (k + 1) % 4
+            c, d = corners[k], dirs[k]
+            self.segments.append((s, straights[k], (c[0] + d[0] * trims[k], c[1] + d[1] * trims[k]), d, 0, 0.0))
+            t = self.add_trapezoid(t, s, straights[k], speeds[k], speeds[n], vmax, accel)
+            s += straights[k]
+
+            arc = abs(turns[n]) * radii[n]
+            if arc > 0:
+                c, d = corners[n], dirs[k]
+                start = (c[0] - d[0] * trims[n], c[1] - d[1] * trims[n])
+                sign = 1 if turns[n] > 0 else -1
+                center = (start[0] - d[1] * sign * radii[n], start[1] + d[0] * sign * radii[n])
+                self.segments.append((s, arc, center, (start[0] - center[0], start[1] - center[1]), sign, radii[n]))
+                self.pieces.append((t, s, arc / speeds[n], arc, speeds[n], 0.0))
+                t += arc / speeds[n]
+                s += arc
+        self.length = s
+        self.period = t
+
+    # 一条直边的梯形（或三角形）速度曲线，返回结束时间
+    def add_trapezoid(self, t, s, length, v_in, v_out, vmax, accel):
+        peak = min(vmax, math.sqrt(accel * length + (v_in ** 2 + v_out ** 2) / 2))
+        d_acc = (peak ** 2 - v_in ** 2) / (2 * accel)
+        d_dec = (peak ** 2 - v_out ** 2) / (2 * accel)
+        d_cruise = max(0.0, length - d_acc - d_dec)
+        for ds, duration, v0, a in ((d_acc, (peak - v_in) / accel, v_in, accel),
+                                    (d_cruise, d_cruise / peak if peak > 0 else 0.0, peak, 0.0),
+                                    (d_dec, (peak - v_out) / accel, peak, -accel)):
+            if duration > 0:
+                self.pieces.append((t, s, duration, ds, v0, a))
+                t += duration
+                s += ds
+        return t
+
+    # 推进dt秒：路径位置 -> 曲线时间 -> 加dt -> 路径位置
+    def advance(self, position, dt):
+        s = (position % 4.0) * self.length / 4.0
+        for piece in self.pieces:
+            if s < piece[1] + piece[3]:
+                break
+        t0, s0, duration, ds, v0, a = piece
+        u = min(s - s0, ds)
+        if a == 0:
+            tau = u / v0
+        else:
+            tau = (math.sqrt(max(0.0, v0 * v0 + 2 * a * u)) - v0) / a
+        t = (t0 + tau + dt) % self.period
+        for piece in self.pieces:
+            if t < piece[0] + piece[2]:
+                break
+        t0, s0, duration, ds, v0, a = piece
+        tau = min(t - t0, duration)
+        return 4.0 * (s0 + v0 * tau + 0.5 * a * tau * tau) / self.length
+
+    def sample(self, position):
+        s = (position % 4.0) * self.length / 4.0
+        for seg in self.segments:
+            if s < seg[0] + seg[1]:
+                break
+        s0, length, p, d, sign, radius = seg
+        u = min(s - s0, length)
+        if radius == 0:
+            return (p[0] + d[0] * u, p[1] + d[1] * u)
+        angle = sign * u / radius
+        ca, sa = math.cos(angle), math.sin(angle)
+        return (p[0] + d[0] * ca - d[1] * sa, p[1] + d[0] * sa + d[1] * ca)
+
+# 更新路径：单应映射有效时为板面矩形（毫米），否则为图像上的平均矩形（像素）
+def update_path(avg_corners):
+    global path_on_board
+    path_on_board = USE_HOMOGRAPHY and board.update(avg_corners)
+    corners = BOARD_CORNERS if path_on_board else avg_corners
+    if USE_CORNER_PROFILE:
+        profile.update(corners, PATH_SPEED_MM if path_on_board else PATH_SPEED_PX)
+    elif USE_ARC_LENGTH:
+        path.update(corners)
+
+# 推进运动位置：按转角速度曲线推进；弧长模式下把切向速度换算为周长比例；否则每100ms前进MOVE_SPEED条边
+def advance_position(position, dt_ms):
+    if USE_CORNER_PROFILE:
+        return profile.advance(position, dt_ms / 1000.0) if profile.period > 0 else position
+    if USE_ARC_LENGTH and path.length > 0:
+        speed = PATH_SPEED_MM if path_on_board else PATH_SPEED_PX
+        position += 4.0 * speed * dt_ms / 1000.0 / path.length
+    else:
+        position += MOVE_SPEED * (dt_ms / 100.0)
+    return position % 4.0
+
+# 计算运动点：板面路径上的点投影回图像，否则直接在图像上插值（需先调用update_path）；
+# 返回 (x, y, 板面坐标)，没有板面坐标时为None
+def get_target_point(avg_corners, position):
+    if USE_CORNER_PROFILE:
+        x, y = profile.sample(position)
+    elif USE_ARC_LENGTH:
+        x, y = path.sample(position)
+    elif path_on_board:
+        x, y = get_board_position(position)
+    else:
+        x, y = get_position_on_edge(avg_corners, position)
+    if not path_on_board:
+        return int(x), int(y), None
+    board_pos = (x, y)
+    x, y = board.to_image(x, y)
+    return int(x), int(y), board_pos
+
+# 在矩形外接框内寻找激光点：取像素数不超过LASER_MAX_PIXELS的最大色块中心，没有时返回None
+def find_laser_point(img, corners):
+    x, y, w, h = corners_box(corners)
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(img.width(), x + w), min(img.height(), y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    best = None
+    for blob in img.find_blobs([LASER_THRESHOLD], roi=(x0, y0, x1 - x0, y1 - y0),
+                               pixels_threshold=LASER_MIN_PIXELS, area_threshold=LASER_MIN_PIXELS, merge=True):
+        if blob.pixels() <= LASER_MAX_PIXELS and (best is None or blob.pixels() > best.pixels()):
+            best = blob
+    return (best.cx(), best.cy()) if best else None
 
 # 计算在矩形边缘上的位置
 def get_position_on_edge(avg_corners, position):
@@ -183,9 +1282,29 @@ def get_position_on_edge(avg_corners, position):
 
     return (x, y)
 
+# 遥测数据包
+packet = TelemetryPacket()
+
+# 串口命令缓冲区
+commands = CommandReader(CMD_BUFFER_SIZE, b"PRS", CMD_MAX_LENGTH)
+
+# 阈值调节状态
+rect_threshold = load_threshold(RECT_THRESHOLD) if AUTO_THRESHOLD else RECT_THRESHOLD
+saved_threshold = rect_threshold
+stable_frames = 0
+tune_frames = 0
+empty_frames = 0  # 连续没有候选的帧数
+
+# 板面映射初始化
+BOARD_CORNERS = [(0.0, 0.0), (BOARD_WIDTH_MM, 0.0), (BOARD_WIDTH_MM, BOARD_HEIGHT_MM), (0.0, BOARD_HEIGHT_MM)]
+board = BoardMapping(BOARD_WIDTH_MM, BOARD_HEIGHT_MM)
+path = PerimeterSampler(PATH_TOLERANCE)
+profile = CornerProfile(PATH_TOLERANCE, ACCEL_TIME, CORNER_RADIUS_RATIO)
+path_on_board = False
+
 # 历史缓存初始化
-for i in range(RECT_HISTORY_SIZE):
-    rect_history.append(None)
+smoother = QuadSmoother(RECT_HISTORY_SIZE)
+kalman = CornerKalman(KALMAN_ACCEL, KALMAN_MEAS_STD, KALMAN_GATE, KALMAN_MAX_REJECTS)
 
 while True:
     img = sensor.snapshot()
@@ -194,10 +1313,31 @@ while True:
     img.gaussian(1)  # 高斯模糊降噪
     #img.laplacian(1, sharpen=True)  # 锐化图像，增强边缘
 
+    # 统计缩放步骤的堆分配（gc.mem_alloc差值，期间发生回收时差值为负，忽略）
+    heap_before = gc.mem_alloc()
     img_scaled = scale_image(img, 2)  # 将图像缩小为原来的一半
+    heap_delta = gc.mem_alloc() - heap_before
+    if heap_delta > 0:
+        scale_alloc += heap_delta
 
     # 使用更稳定的矩形检测方法
-    rects = img_scaled.find_rects(threshold=28000)  # 调整阈值以提高检测精度
+    # 跟踪模式下只在上一次矩形附近搜索
+    roi = search_roi(track_box, miss_count, img_scaled.width(), img_scaled.height()) if USE_ROI_TRACKING else None
+    if roi:
+        rects = img_scaled.find_rects(roi=roi, threshold=rect_threshold)  # 调整阈值以提高检测精度
+        rect_count = len(rects)
+        roi_frames += 1
+    elif MULTI_SCALE:
+        # 在80x60图像上找候选，只在候选附近的半分辨率ROI中验证
+        proposals, rect_count = propose_rects(img_scaled, rect_threshold)
+        rects = verify_rects(img_scaled, proposals, rect_threshold)
+    else:
+        rects = img_scaled.find_rects(threshold=rect_threshold)  # 调整阈值以提高检测精度
+        rect_count = len(rects)
+    frame_count += 1
+    if BENCHMARK and frame_count % BENCH_INTERVAL == 0:
+        bench_quality(rects)
+        bench_multiscale(img_scaled, rect_threshold)
 
     # 处理串口命令
     handle_uart_commands()
@@ -209,37 +1349,36 @@ while True:
     current_time = time.ticks_ms()
     time_diff = current_time - last_move_time
     last_move_time = current_time
+    if USE_KALMAN:
+        kalman.predict(time_diff / 1000.0)
 
-    valid_rect_found = False
-    best_rect = None
-    best_score = 0
+    # 限制参与评分的候选数，只保留边缘强度最高的几个
+    if len(rects) > MAX_CANDIDATES:
+        rects = sorted(rects, key=lambda r: r.magnitude(), reverse=True)[:MAX_CANDIDATES]
 
-    # 寻找质量最高的矩形
-    for rect in rects:
-        corners = rect.corners()
-        if len(corners) != 4:
-            continue
-
-        # 确保顺时针顺序
-        corners = ensure_clockwise(corners)
-
-        # 计算矩形质量分数
-        score = calculate_rectangle_quality(corners)
-
-        # 如果质量更好，则选择
-        if score > best_score and score > 0.6:  # 提高最低质量阈值
-            best_score = score
-            best_rect = rect
-            valid_rect_found = True
+    # 一次遍历评估所有候选，寻找质量最高的矩形
+    # 下限取0以得到本帧最佳分数（即使不合格），供阈值调节区分“没有候选”和“候选质量差”
+    best_rect, best_score = find_best_rect(rects, 0.0)
+    valid_rect_found = best_score >= QUALITY_THRESHOLD
+    if AUTO_THRESHOLD:
+        update_threshold(rect_count, best_score)
 
     if valid_rect_found:
         rect = best_rect
         corners = rect.corners()
         corners = ensure_clockwise(corners)  # 确保顺时针顺序
+        corners = associate_corners(corners, last_corners)  # 与上一帧角点对应，保持编号稳定
+        last_corners = corners
+        track_box = corners_box(corners)
+        miss_count = 0
 
         # 将坐标放大到原始图像尺寸
         corners_orig = [(x*2, y*2) for (x, y) in corners]
 
+        # 在原图上对四个角点做亚像素精化，消除缩放带来的±2像素误差
+        if REFINE_CORNERS:
+            corners_orig = refine_corners(img, corners_orig)
+
         # 计算矩形中心
         center_x = int(sum(p[0] for p in corners_orig) / 4)
         center_y = int(sum(p[1] for p in corners_orig) / 4)
@@ -248,8 +1387,11 @@ while True:
         w = distance(corners_orig[0], corners_orig[1])
         h = distance(corners_orig[1], corners_orig[2])
 
-        # 计算内缩距离（边框宽度的12%）
+        # 计算内缩距离：测量实际边框宽度，测量失败时按12%估算
         border_width = min(w, h) * 0.12
+        border_measured = False
+        if MEASURE_BORDER:
+            border_width, border_measured = get_border_width(img, corners_orig, border_width)
 
         # 计算内矩形顶点
         inner_corners = []
@@ -282,8 +1424,14 @@ while True:
                 bisector = (bisector[0]/bisector_len, bisector[1]/bisector_len)
 
             # 计算内缩点
-            inner_x = curr[0] + bisector[0] * border_width
-            inner_y = curr[1] + bisector[1] * border_width
+            # 使用测量宽度时沿角平分线移动 宽度/sin(半角)，使内矩形各边与外边正好相距边框宽度；
+            # 12%估算值是按原有的沿角平分线内缩标定的，不做修正
+            inset = border_width
+            if border_measured:
+                sin_half = abs(v1[0]*bisector[1] - v1[1]*bisector[0])
+                inset = border_width / max(sin_half, 0.3)
+            inner_x = curr[0] + bisector[0] * inset
+            inner_y = curr[1] + bisector[1] * inset
             inner_corners.append((int(inner_x), int(inner_y)))
 
         # 计算平均矩形的顶点（原始图像尺寸）
@@ -292,35 +1440,20 @@ while True:
             avg_x = int((corners_orig[i][0] + inner_corners[i][0]) / 2)
             avg_y = int((corners_orig[i][1] + inner_corners[i][1]) / 2)
             current_avg_corners.append((avg_x, avg_y))
-
-        # 保存平均矩形到历史记录
-        rect_history[rect_history_index] = current_avg_corners
-        rect_history_index = (rect_history_index + 1) % RECT_HISTORY_SIZE
-
-        # 计算历史平均顶点 (带权重)
-        avg_corners = [[0.0, 0.0] for _ in range(4)]
-        total_weight = 0
-
-        # 遍历历史记录，计算加权平均
-        for i, corners in enumerate(rect_history):
-            if corners is None:
-                continue
-
-            # 最近的历史有更高的权重
-            weight = RECT_HISTORY_SIZE - i
-            total_weight += weight
-
-            for j in range(4):
-                avg_corners[j][0] += corners[j][0] * weight
-                avg_corners[j][1] += corners[j][1] * weight
-
-        if total_weight > 0:
-            for i in range(4):
-                avg_corners[i][0] = int(avg_corners[i][0] / total_weight)
-                avg_corners[i][1] = int(avg_corners[i][1] / total_weight)
-            avg_corners = [(x, y) for x, y in avg_corners]
+        if BENCH_SMOOTHER:
+            smoother_track.append(current_avg_corners)
+
+        # 卡尔曼滤波更新（新息过大的观测被拒绝，此时使用预测值）；
+        # 或保存平均矩形到历史记录，取历史加权平均顶点（最近的帧权重更高）
+        if USE_KALMAN:
+            kalman.update(current_avg_corners)
+            avg_corners = kalman.corners()
         else:
-            avg_corners = current_avg_corners
+            smoother.push(current_avg_corners)
+            avg_corners = smoother.average()
+
+        # 在绘制之前寻找激光点，避免把画上去的红点当成激光
+        laser = find_laser_point(img, avg_corners) if USE_LASER else None
 
         # 在原始图像上绘制平均矩形（蓝色）
         for i in range(4):
@@ -334,15 +1467,18 @@ while True:
         for i, (x, y) in enumerate(avg_corners):
             img.draw_circle(x, y, 5, color=(0, 255, 0), thickness=2)
 
-        # 更新连续运动位置
+        # 更新路径，再基于时间和速度更新连续运动位置
+        update_path(avg_corners)
         if not PAUSED:
-            # 基于时间和速度更新位置
-            current_position += MOVE_SPEED * (time_diff / 100.0)
-            if current_position >= 4.0:
-                current_position -= 4.0
+            current_position = advance_position(current_position, time_diff)
+
+        # 获取当前运动点位置（及其板面坐标）
+        target_x, target_y, board_pos = get_target_point(avg_corners, current_position)
 
-        # 获取当前运动点位置
-        target_x, target_y = get_position_on_edge(avg_corners, current_position)
+        # 激光点换算到板面坐标（需要有效的单应映射）
+        laser_board = board.to_board(laser[0], laser[1]) if laser and board_pos else None
+        if laser:
+            img.draw_cross(laser[0], laser[1], color=(255, 0, 255), size=6)
 
         # 绘制运动点（红色）
         img.draw_circle(target_x, target_y, 8, color=(255, 0, 0), thickness=2, fill=True)
@@ -357,68 +1493,63 @@ while True:
         img.draw_string(10, 40, quality_str, color=(255, 255, 255), scale=1.0)
 
         # 显示移动速度
-        speed_str = "Speed: {:.2f}".format(MOVE_SPEED)
+        if not (USE_ARC_LENGTH or USE_CORNER_PROFILE):
+            speed_str = "Speed: {:.2f}".format(MOVE_SPEED)
+        elif path_on_board:
+            speed_str = "Speed: {:.0f} mm/s".format(PATH_SPEED_MM)
+        else:
+            speed_str = "Speed: {:.0f} px/s".format(PATH_SPEED_PX)
         img.draw_string(10, 60, speed_str, color=(255, 255, 255), scale=1.0)
 
+        # 显示角点位置标准差
+        if USE_KALMAN:
+            std_str = "Std: {:.1f}".format(kalman.std())
+            img.draw_string(10, 80, std_str, color=(255, 255, 255), scale=1.0)
+
         # 绘制中心点（红色十字）
         img.draw_cross(center_x, center_y, color=(255, 0, 0), size=10)
         center_str = "Center ({}, {})".format(center_x, center_y)
         img.draw_string(center_x, center_y, center_str, color=(255, 255, 255))
 
-        # 发送坐标数据
-        if SEND_COORDINATES and not PAUSED and current_time - last_sent_time > 50:  # 每50ms发送一次
-            # 发送中心坐标
-            uart.write("C,{},{}\n".format(center_x, center_y))
-
-            # 发送当前目标点（连续运动点）
-            uart.write("T,{},{}\n".format(target_x, target_y))
-
-            # 发送所有顶点
-            uart.write("P,{},{},{},{},{},{},{},{}\n".format(
-                avg_corners[0][0], avg_corners[0][1],
-                avg_corners[1][0], avg_corners[1][1],
-                avg_corners[2][0], avg_corners[2][1],
-                avg_corners[3][0], avg_corners[3][1]
-            ))
-
+        # 发送坐标数据：中心、当前目标点（连续运动点）、所有顶点，
+        # 以及目标点与激光点的板面坐标（毫米，下位机直接相减即为实际偏差），整包一次写出。
+        # 包格式（每行以\n结尾，字段定宽，下位机需按此解析）：
+        #   C,xxx,yyy                     中心（像素，000-999）
+        #   T,xxx,yyy                     目标点（像素）
+        #   P,x0,y0,x1,y1,x2,y2,x3,y3     四个顶点（像素，各3位）
+        #   B,±xxx.x,±yyy.y               目标点板面坐标（毫米，带符号，仅单应映射有效时）
+        #   L,±xxx.x,±yyy.y               激光点板面坐标（毫米，带符号，仅检测到激光点时，紧跟B行）
+        if SEND_COORDINATES and not PAUSED and time.ticks_diff(current_time, last_sent_time) > SEND_PERIOD:  # 每SEND_PERIOD毫秒发送一次
+            heap_before = gc.mem_alloc()
+            uart.write(packet.pack(center_x, center_y, target_x, target_y, avg_corners, board_pos, laser_board))
+            heap_delta = gc.mem_alloc() - heap_before
+            if heap_delta > 0:
+                packet_alloc += heap_delta
             last_sent_time = current_time
 
     else:
+        miss_count += 1
+        if BENCH_SMOOTHER:
+            smoother_track.append(None)
+
         # 更新历史记录
-        rect_history[rect_history_index] = None
-        rect_history_index = (rect_history_index + 1) % RECT_HISTORY_SIZE
+        if not USE_KALMAN:
+            smoother.push(None)
 
-        # 没有检测到矩形时发送错误信息
-        if time.ticks_ms() % 1000 < 100:
-            uart.write("E,No rectangle detected\n")
+        # 没有检测到矩形时发送错误信息（每STATUS_PERIOD毫秒最多一次）
+        if time.ticks_diff(time.ticks_ms(), last_status_time) >= STATUS_PERIOD:
+            uart.write(STATUS_NO_RECT)
+            last_status_time = time.ticks_ms()
 
         # 显示未检测到矩形的消息
         img.draw_string(10, 10, "No rectangle detected", color=(255, 0, 0))
 
-        # 如果没有矩形但历史中有数据，使用历史平均值
-        valid_count = 0
-        avg_corners = [[0.0, 0.0] for _ in range(4)]
-        total_weight = 0
-
-        # 遍历历史记录，计算加权平均
-        for i, corners in enumerate(rect_history):
-            if corners is None:
-                continue
-
-            # 最近的历史有更高的权重
-            weight = RECT_HISTORY_SIZE - i
-            total_weight += weight
-
-            for j in range(4):
-                avg_corners[j][0] += corners[j][0] * weight
-                avg_corners[j][1] += corners[j][1] * weight
-
-        if total_weight > 0:
-            for i in range(4):
-                avg_corners[i][0] = int(avg_corners[i][0] / total_weight)
-                avg_corners[i][1] = int(avg_corners[i][1] / total_weight)
-            avg_corners = [(x, y) for x, y in avg_corners]
-
+        # 如果没有矩形：卡尔曼模式按模型预测（不确定度过大时视为丢失），否则使用历史平均值
+        if USE_KALMAN:
+            avg_corners = kalman.corners() if kalman.std() < KALMAN_LOST_STD else None
+        else:
+            avg_corners = smoother.average()
+        if avg_corners is not None:
             # 在原始图像上绘制平均矩形（黄色，表示历史数据）
             for i in range(4):
                 start_point = avg_corners[i]
@@ -428,16 +1559,15 @@ while True:
                              color=(255, 255, 0), thickness=1, dotted=True)
 
             # 显示警告信息
-            img.draw_string(10, 80, "Using historical data", color=(255, 255, 0))
+            img.draw_string(10, 80, "Predicted" if USE_KALMAN else "Using historical data", color=(255, 255, 0))
 
-            # 更新连续运动位置
+            # 更新路径和连续运动位置
+            update_path(avg_corners)
             if not PAUSED:
-                current_position += MOVE_SPEED * (time_diff / 100.0)
-                if current_position >= 4.0:
-                    current_position -= 4.0
+                current_position = advance_position(current_position, time_diff)
 
             # 获取当前运动点位置
-            target_x, target_y = get_position_on_edge(avg_corners, current_position)
+            target_x, target_y, board_pos = get_target_point(avg_corners, current_position)
 
             # 绘制运动点（黄色）
             img.draw_circle(target_x, target_y, 8, color=(255, 255, 0), thickness=2, fill=True)
@@ -446,4 +1576,27 @@ while True:
             coord_str = "({}, {})".format(target_x, target_y)
             img.draw_string(target_x + 5, target_y, coord_str, color=(255, 255, 255), scale=1.0)
 
-    lcd.display(img)
+    if DISPLAY_MODE:
+        lcd.display(img)
+
+    # 记录满一段轨迹后对比两种平滑方式（延迟按记录期间的平均帧间隔换算为毫秒）
+    if BENCH_SMOOTHER and len(smoother_track) >= BENCH_TRACK_FRAMES:
+        frame_ms = time.ticks_diff(time.ticks_ms(), smoother_track_start) / len(smoother_track)
+        (legacy_lag, legacy_jitter), (ring_lag, ring_jitter) = compare_smoothers(smoother_track, RECT_HISTORY_SIZE)
+        print("Smoother on {} frames ({} missed): legacy lag {:.0f} ms, jitter {:.2f} px; ring lag {:.0f} ms, jitter {:.2f} px".format(
+            len(smoother_track), smoother_track.count(None), legacy_lag * frame_ms, legacy_jitter,
+            ring_lag * frame_ms, ring_jitter))
+        smoother_track = []
+        smoother_track_start = time.ticks_ms()
+
+    # 统计稳态帧率（每FPS_WINDOW帧的平均值）
+    fps_frames += 1
+    if fps_frames == FPS_WINDOW:
+        elapsed = time.ticks_diff(time.ticks_ms(), fps_start)
+        print("FPS: {:.1f}, ROI frames: {}/{}, scale alloc: {} B/frame, packet alloc: {} B, heap free: {} B".format(
+            fps_frames * 1000 / elapsed, roi_frames, fps_frames, scale_alloc // fps_frames, packet_alloc, gc.mem_free()))
+        scale_alloc = 0
+        packet_alloc = 0
+        fps_frames = 0
+        roi_frames = 0
+        fps_start = time.ticks_ms()
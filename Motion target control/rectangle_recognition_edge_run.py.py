@@ -1,4 +1,4 @@
-import sensor, image, time, lcd, machine
+import sensor, image, time, lcd, machine, gc
 from machine import UART
 from fpioa_manager import fm
 import math
@@ -31,42 +31,563 @@ last_move_time = time.ticks_ms()
 
 # 矩形检测历史缓存
 RECT_HISTORY_SIZE = 7
-rect_history = []
-rect_history_index = 0
-for i in range(RECT_HISTORY_SIZE):
-    rect_history.append(None)
-
-# 确保顶点顺序为顺时针
+BENCH_SMOOTHER = False  # 记录原始角点轨迹，每BENCH_TRACK_FRAMES帧对比原历史平均与QuadSmoother的延迟和抖动
+BENCH_TRACK_FRAMES = 300  # 每段轨迹的帧数
+smoother_track = []  # 记录中的角点轨迹（未检测到矩形的帧为None）
+smoother_track_start = time.ticks_ms()
+
+# 角点卡尔曼滤波
+USE_KALMAN = True  # 使用匀速模型卡尔曼滤波代替历史加权平均，丢失时按模型预测
+KALMAN_ACCEL = 300  # 加速度噪声标准差 (像素/秒²)，越大跟随越快、越不平滑
+KALMAN_MEAS_STD = 1.5  # 角点观测噪声标准差 (像素)
+KALMAN_INIT_VEL_STD = 100  # 初始化时速度的标准差 (像素/秒)
+KALMAN_GATE = 20.1  # 新息门限（8自由度卡方分布99%分位数）
+KALMAN_MAX_REJECTS = 3  # 连续拒绝N次观测后用新观测重新初始化
+KALMAN_LOST_STD = 15  # 预测的位置标准差超过此值（像素）时视为丢失
+
+# 矩形评分参数
+QUALITY_THRESHOLD = 0.6  # 最低质量分数
+EDGE_WEIGHT = 0.6  # 边长得分权重
+ANGLE_WEIGHT = 0.4  # 角度得分权重
+COS_45 = 0.7071  # 角度偏差45°时的|cos|，此时角度得分为0
+BENCHMARK = False  # 定期运行基准测试：原评分与批量评分的吞吐量、单尺度与多尺度检测
+BENCH_INTERVAL = 30  # 基准测试间隔帧数
+BENCH_REPEAT = 20  # 每次基准测试重复评分的次数
+MAX_CANDIDATES = 8  # 每帧最多评分的候选数
+
+# find_rects阈值闭环调节
+AUTO_THRESHOLD = True  # 根据候选数量和检测结果每帧调节阈值
+RECT_THRESHOLD = 28000  # 初始阈值（保存文件存在时使用上次调节的结果）
+THRESHOLD_MIN = 5000
+THRESHOLD_MAX = 100000
+TARGET_MIN_RECTS = 1  # 候选数目标区间下限
+TARGET_MAX_RECTS = 3  # 候选数目标区间上限
+THRESHOLD_STEP = 0.1  # 每帧相对调整比例
+THRESHOLD_SEARCH_FRAMES = 10  # 没有候选时最多连续降低阈值的帧数，之后保持不变
+SAVE_STABLE_FRAMES = 30  # 连续N帧处于目标区间后保存阈值
+THRESHOLD_FILE = "/flash/rect_threshold_edge_run.txt"
+
+# 全分辨率角点精化
+REFINE_CORNERS = True  # 半分辨率检测后在原图上用直线拟合求亚像素角点
+REFINE_RADIUS = 4  # 沿法线搜索边缘的半径（原图像素）
+REFINE_SPAN = 16  # 角点附近用于拟合的边长范围（原图像素）
+REFINE_SAMPLES = 4  # 每条边的采样剖面数
+REFINE_MIN_GRADIENT = 20  # 最小边缘梯度（灰度差）
+
+# 边框宽度测量
+MEASURE_BORDER = True  # 沿各边法线测量实际边框宽度，代替按比例估算
+BORDER_SAMPLES = 3  # 每条边的采样剖面数
+BORDER_MAX_RATIO = 0.3  # 剖面在边两侧的搜索范围（相对边长）
+BORDER_MIN_GRADIENT = 30  # 边框内外边缘的最小梯度（灰度差）
+BORDER_RESCALE = 0.1  # 矩形平均边长变化超过此比例时重新测量
+border_cache_width = None  # 缓存的边框宽度（原图像素）
+border_cache_scale = 0  # 测量时的平均边长
+frame_count = 0
+
+# 跟踪模式：只在上一次矩形附近搜索
+USE_ROI_TRACKING = True  # 关闭后每帧全图搜索
+ROI_MARGIN = 0.25  # 搜索区域外扩比例（相对外接框较长边），每丢失一帧再加一份
+ROI_MIN_MARGIN = 8  # 最小外扩像素（缩放图像）
+FULL_SEARCH_MISSES = 3  # 连续丢失N帧后改为全图搜索
+FPS_WINDOW = 100  # 每N帧统计一次稳态帧率
+track_box = None  # 上一次矩形在缩放图像上的外接框
+last_corners = None  # 上一次检测到的角点（缩放图像，已对应编号）
+miss_count = 0
+roi_frames = 0
+fps_frames = 0
+fps_start = time.ticks_ms()
+
+# 缩放缓冲池
+USE_BUFFER_POOL = True  # 半分辨率图像只在启动时分配一次，之后每帧把均值池化的结果写入其中
+scaled_buffer = None
+pool_into_buffer = True  # 固件的mean_pooled不支持写入已有图像时自动置为False
+scale_alloc = 0  # 本统计窗口内缩放步骤分配的堆内存（字节）
+
+# 多尺度检测：全图搜索时先在1/4分辨率图像上找候选，再在半分辨率图像的小ROI中验证
+MULTI_SCALE = True  # 关闭后全图搜索直接在半分辨率图像上进行（跟踪ROI搜索不受影响）
+PROPOSAL_SCALE = 2  # 候选图像相对半分辨率图像的缩小倍数（160x120 -> 80x60）
+PROPOSAL_THRESHOLD_RATIO = 0.5  # 候选阶段阈值比例：边长减半，边缘强度之和约减半
+MAX_PROPOSALS = 3  # 每帧最多验证的候选数（按边缘强度）
+VERIFY_MARGIN = 6  # 验证ROI外扩像素（半分辨率图像）
+VERIFY_SIZE_TOL = 0.15  # 验证结果与候选外接框尺寸的最大相对偏差
+proposal_buffer = None  # 预先分配的候选图像
+bench_min_side = [None, None]  # 基准测试中单尺度/多尺度仍能检测到的最小矩形短边（原图像素）
+
+# 缩放图像：scale×scale均值池化（不修改原图，抗混叠），使用缓冲池时结果写入预先分配的图像，稳态帧不再分配新图像
+def scale_image(img, scale):
+    global scaled_buffer, pool_into_buffer
+    width = img.width() // scale
+    height = img.height() // scale
+    if USE_BUFFER_POOL:
+        if scaled_buffer is None or scaled_buffer.width() != width or scaled_buffer.height() != height:
+            scaled_buffer = image.Image(size=(width, height))
+        if pool_into_buffer:
+            try:
+                return img.mean_pooled(scale, scale, copy=scaled_buffer)
+            except TypeError:
+                pool_into_buffer = False
+                print("mean_pooled cannot write into a buffer, allocating per frame")
+        return img.mean_pooled(scale, scale)
+    return img.resize(width, height)
+
+# 确保顶点顺序为顺时针：用叉积找出与第一个点相对的顶点排成环形，再按有向面积决定方向，
+# 不做atan2排序；起始角点由associate_corners决定
 def ensure_clockwise(corners):
     if len(corners) != 4:
         return corners
 
+    p0 = corners[0]
+    ordered = list(corners)
+    for k in (1, 2, 3):
+        a, b = [corners[i] for i in (1, 2, 3) if i != k]
+        dx, dy = corners[k][0] - p0[0], corners[k][1] - p0[1]
+        # 对角点：另外两点分别位于p0到该点连线的两侧
+        if (dx * (a[1] - p0[1]) - dy * (a[0] - p0[0])) * (dx * (b[1] - p0[1]) - dy * (b[0] - p0[0])) < 0:
+            ordered = [p0, a, corners[k], b]
+            break
+
+    area = 0
+    for i in range(4):
+        x1, y1 = ordered[i]
+        x2, y2 = ordered[(i + 1) % 4]
+        area += (x1 * y2 - x2 * y1)
+
+    return ordered if area > 0 else [ordered[0], ordered[3], ordered[2], ordered[1]]
+
+# 矩形顶点的外接框 (x, y, w, h)
+def corners_box(corners):
+    xs = [p[0] for p in corners]
+    ys = [p[1] for p in corners]
+    return (min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+
+# 根据上一次的外接框计算搜索区域：每丢失一帧多外扩一份边距，连续丢失过多时返回None（全图搜索）
+def search_roi(box, misses, width, height):
+    if box is None or misses >= FULL_SEARCH_MISSES:
+        return None
+    x, y, w, h = box
+    margin = int(max(w, h) * ROI_MARGIN * (misses + 1)) + ROI_MIN_MARGIN
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(width, x + w + margin), min(height, y + h + margin)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+# 读取上次保存的阈值，文件不存在时使用默认值
+def load_threshold(default):
+    try:
+        with open(THRESHOLD_FILE) as f:
+            return max(THRESHOLD_MIN, min(THRESHOLD_MAX, int(f.read())))
+    except Exception:
+        return default
+
+# 保存阈值到文件
+def save_threshold(threshold):
+    try:
+        with open(THRESHOLD_FILE, "w") as f:
+            f.write(str(threshold))
+    except Exception as e:
+        print("Threshold save error:", e)
+
+# 闭环调节阈值：候选过多时提高阈值；没有候选时降低阈值，但连续THRESHOLD_SEARCH_FRAMES帧仍没有候选时
+# 视野中可能没有目标，保持阈值不再降低；有候选但最佳分数低于QUALITY_THRESHOLD时降低阈值只会引入更多
+# 噪声候选，同样保持不变；连续稳定SAVE_STABLE_FRAMES帧后打印收敛帧数，与已保存值相差超过5%时写入文件
+def update_threshold(count, best_score):
+    global rect_threshold, stable_frames, saved_threshold, tune_frames, empty_frames
+    tune_frames += 1
+    empty_frames = empty_frames + 1 if count < TARGET_MIN_RECTS else 0
+    if count > TARGET_MAX_RECTS:
+        rect_threshold = min(THRESHOLD_MAX, int(rect_threshold * (1 + THRESHOLD_STEP)))
+        stable_frames = 0
+    elif count < TARGET_MIN_RECTS:
+        if empty_frames <= THRESHOLD_SEARCH_FRAMES:
+            rect_threshold = max(THRESHOLD_MIN, int(rect_threshold * (1 - THRESHOLD_STEP)))
+        stable_frames = 0
+    elif best_score < QUALITY_THRESHOLD:
+        stable_frames = 0
+    else:
+        stable_frames += 1
+        if stable_frames == SAVE_STABLE_FRAMES:
+            print("Threshold settled at {} after {} frames".format(rect_threshold, tune_frames))
+            if abs(rect_threshold - saved_threshold) > saved_threshold * 0.05:
+                save_threshold(rect_threshold)
+                saved_threshold = rect_threshold
+
+# 读取全分辨率图像的灰度值（越界返回None）
+def gray_at(img, x, y):
+    if 0 <= x < img.width() and 0 <= y < img.height():
+        r, g, b = img.get_pixel(x, y)
+        return (r * 77 + g * 150 + b * 29) >> 8
+    return None
+
+# 从(x, y)沿法线(nx, ny)采样灰度剖面，返回梯度最强处的亚像素偏移（没有明显边缘时返回None）
+def edge_offset(img, x, y, nx, ny):
+    r = REFINE_RADIUS
+    profile = []
+    for k in range(-r - 2, r + 3):
+        v = gray_at(img, int(x + nx * k + 0.5), int(y + ny * k + 0.5))
+        if v is None:
+            return None
+        profile.append(v)
+
+    # 中心差分梯度，在[-r, r]内找绝对值最大处
+    grads = [abs(profile[k + 1] - profile[k - 1]) for k in range(1, len(profile) - 1)]
+    best_k = 1
+    for k in range(2, len(grads) - 1):
+        if grads[k] > grads[best_k]:
+            best_k = k
+    if grads[best_k] < REFINE_MIN_GRADIENT:
+        return None
+
+    # 抛物线插值求峰值的亚像素位置
+    offset = best_k - r - 1
+    g0, g1, g2 = grads[best_k - 1], grads[best_k], grads[best_k + 1]
+    den = g0 - 2 * g1 + g2
+    if den < 0:
+        offset += 0.5 * (g0 - g2) / den
+    return offset
+
+# 拟合角点corner到相邻角点other这条边在角点附近的直线，返回 (点x, 点y, 方向x, 方向y)
+def fit_side(img, corner, other):
+    dx, dy = other[0] - corner[0], other[1] - corner[1]
+    length = math.sqrt(dx*dx + dy*dy)
+    if length < 4:
+        return None
+    dx, dy = dx / length, dy / length
+    nx, ny = -dy, dx
+    span = min(REFINE_SPAN, length * 0.45)
+
+    # 沿边取几个采样位置，记录边缘相对粗略边的法向偏移
+    ts, offsets = [], []
+    for i in range(REFINE_SAMPLES):
+        t = span * (i + 1) / REFINE_SAMPLES
+        o = edge_offset(img, corner[0] + dx * t, corner[1] + dy * t, nx, ny)
+        if o is not None:
+            ts.append(t)
+            offsets.append(o)
+
+    # 最小二乘拟合 offset = a + b*t，剔除残差超过1像素的点后再拟合一次
+    for _ in range(2):
+        n = len(ts)
+        if n < 2:
+            return None
+        st, so = sum(ts), sum(offsets)
+        stt = sum(t * t for t in ts)
+        sto = sum(t * o for t, o in zip(ts, offsets))
+        den = n * stt - st * st
+        if den == 0:
+            return None
+        b = (n * sto - st * so) / den
+        a = (so - b * st) / n
+        keep = [i for i in range(n) if abs(a + b * ts[i] - offsets[i]) <= 1.0]
+        if len(keep) == n:
+            break
+        ts = [ts[i] for i in keep]
+        offsets = [offsets[i] for i in keep]
+
+    return (corner[0] + nx * a, corner[1] + ny * a, dx + nx * b, dy + ny * b)
+
+# 在全分辨率图像上精化角点：对每个角点的两条相邻边各拟合一条直线并求交点，
+# 只访问角点附近的小窗口；拟合失败或交点偏离过远时保留原角点
+def refine_corners(img, corners):
+    refined = []
+    for i in range(4):
+        corner = corners[i]
+        line1 = fit_side(img, corner, corners[i - 1])
+        line2 = fit_side(img, corner, corners[(i + 1) % 4])
+        if line1 is None or line2 is None:
+            refined.append(corner)
+            continue
+        px, py, vx, vy = line1
+        qx, qy, wx, wy = line2
+        cross = vx * wy - vy * wx
+        if abs(cross) < 0.1:  # 两边接近平行
+            refined.append(corner)
+            continue
+        u = ((qx - px) * wy - (qy - py) * wx) / cross
+        x, y = px + vx * u, py + vy * u
+        if abs(x - corner[0]) > 2 * REFINE_RADIUS or abs(y - corner[1]) > 2 * REFINE_RADIUS:
+            refined.append(corner)
+        else:
+            refined.append((x, y))
+    return refined
+
+# 沿各边内法线采样灰度剖面测量边框宽度（原图像素）：外边缘取由亮变暗最强处，
+# 内边缘取其内侧由暗变亮最强处，取所有剖面的中位数；有效剖面太少时返回None
+def measure_border_width(img, corners):
     cx = sum(p[0] for p in corners) / 4
     cy = sum(p[1] for p in corners) / 4
+    widths = []
+    for i in range(4):
+        x0, y0 = corners[i]
+        x1, y1 = corners[(i + 1) % 4]
+        dx, dy = x1 - x0, y1 - y0
+        length = math.sqrt(dx*dx + dy*dy)
+        if length < 8:
+            continue
+        nx, ny = -dy / length, dx / length
+        # 法线指向矩形内部
+        if (cx - (x0 + x1) / 2) * nx + (cy - (y0 + y1) / 2) * ny < 0:
+            nx, ny = -nx, -ny
+        reach = int(length * BORDER_MAX_RATIO)
+
+        for s in range(BORDER_SAMPLES):
+            t = (s + 1) / (BORDER_SAMPLES + 1)
+            px, py = x0 + dx * t, y0 + dy * t
+            profile = []
+            for k in range(-reach, reach + 1):
+                v = gray_at(img, int(px + nx * k + 0.5), int(py + ny * k + 0.5))
+                if v is None:
+                    break
+                profile.append(v)
+            if len(profile) < 2 * reach + 1:
+                continue
 
-    angles = []
-    for x, y in corners:
-        dx = x - cx
-        dy = y - cy
-        angles.append(math.atan2(dy, dx))
-
-    sorted_corners = [p for _, p in sorted(zip(angles, corners))]
-
-    min_index = 0
-    min_distance = float('inf')
-    for i, (x, y) in enumerate(sorted_corners):
-        distance = x + y
-        if distance < min_distance:
-            min_distance = distance
-            min_index = i
-
-    return sorted_corners[min_index:] + sorted_corners[:min_index]
+            # 由外向内的中心差分梯度
+            outer, outer_g = 0, 0
+            for k in range(1, len(profile) - 1):
+                g = profile[k + 1] - profile[k - 1]
+                if g < outer_g:
+                    outer, outer_g = k, g
+            inner, inner_g = 0, 0
+            for k in range(outer + 1, len(profile) - 1):
+                g = profile[k + 1] - profile[k - 1]
+                if g > inner_g:
+                    inner, inner_g = k, g
+            if -outer_g >= BORDER_MIN_GRADIENT and inner_g >= BORDER_MIN_GRADIENT:
+                widths.append(inner - outer)
+
+    if len(widths) < 3:
+        return None
+    widths.sort()
+    return widths[len(widths) // 2]
+
+# 边框宽度（原图像素）：缓存测量结果，平均边长变化超过BORDER_RESCALE时才重新测量，
+# 其余时间按边长比例缩放缓存值；从未测量成功时使用fallback。返回 (宽度, 是否为测量值)
+def get_border_width(img, corners, fallback):
+    global border_cache_width, border_cache_scale
+    scale = sum(distance(corners[i], corners[(i + 1) % 4]) for i in range(4)) / 4
+    if scale <= 0:
+        return fallback, False
+    if border_cache_width is None or abs(scale - border_cache_scale) > border_cache_scale * BORDER_RESCALE:
+        measured = measure_border_width(img, corners)
+        if measured is not None:
+            border_cache_width, border_cache_scale = measured, scale
+            print("Border width: {} px (side {:.1f} px)".format(measured, scale))
+    if border_cache_width is None:
+        return fallback, False
+    return border_cache_width * scale / border_cache_scale, True
+
+# 四边形平滑器：环形缓冲保存最近size帧的角点，按新旧线性加权（最新帧权重size，最旧帧权重1）。
+# 维护有效帧的坐标和与加权和，新帧到来时所有旧帧权重减1等价于 加权和 -= 坐标和，每帧O(1)更新；
+# 丢失的帧记为None，占用缓冲位置但不参与平均
+class QuadSmoother:
+    def __init__(self, size):
+        self.size = size
+        self.buf = [None] * size
+        self.index = 0
+        self.sum = [0] * 8    # 有效帧坐标之和 (x0, y0, ..., x3, y3)
+        self.wsum = [0] * 8   # 有效帧加权坐标之和
+        self.count = 0        # 缓冲中的有效帧数
+        self.weight = 0       # 有效帧权重之和
+
+    # 加入一帧角点，corners为None表示该帧未检测到矩形
+    def push(self, corners):
+        s, ws, n = self.sum, self.wsum, self.size
+        # 已有帧的权重各减1，最旧帧权重减为0后移出
+        for k in range(8):
+            ws[k] -= s[k]
+        self.weight -= self.count
+        old = self.buf[self.index]
+        if old is not None:
+            for k in range(8):
+                s[k] -= old[k]
+            self.count -= 1
+
+        flat = None
+        if corners is not None:
+            flat = (corners[0][0], corners[0][1], corners[1][0], corners[1][1],
+                    corners[2][0], corners[2][1], corners[3][0], corners[3][1])
+            for k in range(8):
+                s[k] += flat[k]
+                ws[k] += n * flat[k]
+            self.count += 1
+            self.weight += n
+        self.buf[self.index] = flat
+        self.index = (self.index + 1) % n
+
+    # 加权平均角点，缓冲中没有有效帧时返回None
+    def average(self):
+        if self.weight == 0:
+            return None
+        ws, w = self.wsum, self.weight
+        return [(int(ws[2*j] / w), int(ws[2*j + 1] / w)) for j in range(4)]
+
+# 角点卡尔曼滤波：8个坐标各自为匀速模型 (位置, 速度)，观测为位置。
+# 各坐标的模型和观测噪声相同，协方差随时间的演化也相同，因此只保存一份2x2协方差 [[a, b], [b, c]]，
+# 预测和更新都是闭式标量运算；整组角点的新息马氏距离超过门限时拒绝该次观测
+class CornerKalman:
+    def __init__(self, accel, meas_std, gate, max_rejects):
+        self.q = accel * accel        # 加速度白噪声方差 (像素/秒²)²
+        self.r = meas_std * meas_std  # 观测噪声方差 (像素²)
+        self.gate = gate              # 8自由度卡方门限
+        self.max_rejects = max_rejects
+        self.pos = [0.0] * 8
+        self.vel = [0.0] * 8
+        self.a = self.b = self.c = 0.0
+        self.ready = False
+        self.rejects = 0              # 连续被拒绝的观测数
+
+    # 用一组观测重新初始化：速度为0，速度方差取较大值
+    def reset(self, corners):
+        for j in range(4):
+            self.pos[2*j], self.pos[2*j + 1] = corners[j][0], corners[j][1]
+        self.vel = [0.0] * 8
+        self.a, self.b, self.c = self.r, 0.0, KALMAN_INIT_VEL_STD ** 2
+        self.rejects = 0
+        self.ready = True
+
+    # 按时间间隔dt（秒）预测
+    def predict(self, dt):
+        if not self.ready:
+            return
+        pos, vel = self.pos, self.vel
+        for k in range(8):
+            pos[k] += vel[k] * dt
+        a, b, c, q = self.a, self.b, self.c, self.q
+        dt2 = dt * dt
+        self.a = a + 2 * dt * b + dt2 * c + q * dt2 * dt2 / 4
+        self.b = b + dt * c + q * dt2 * dt / 2
+        self.c = c + q * dt2
+
+    # 用检测到的角点更新，返回是否接受该观测
+    def update(self, corners):
+        if not self.ready:
+            self.reset(corners)
+            return True
+        pos, vel = self.pos, self.vel
+        s = self.a + self.r
+        innov = [0.0] * 8
+        d2 = 0.0
+        for j in range(4):
+            innov[2*j] = corners[j][0] - pos[2*j]
+            innov[2*j + 1] = corners[j][1] - pos[2*j + 1]
+        for y in innov:
+            d2 += y * y
+        # 新息门限：连续多次拒绝说明目标确实跳变（例如换了位置），直接重新初始化
+        if d2 / s > self.gate:
+            self.rejects += 1
+            if self.rejects >= self.max_rejects:
+                self.reset(corners)
+                return True
+            return False
+        self.rejects = 0
+        ka, kb = self.a / s, self.b / s
+        for k in range(8):
+            pos[k] += ka * innov[k]
+            vel[k] += kb * innov[k]
+        a, b, c = self.a, self.b, self.c
+        self.a = a - a * a / s
+        self.b = b - a * b / s
+        self.c = c - b * b / s
+        return True
+
+    # 每个角点坐标的位置标准差（像素），供后续判断结果是否可信
+    def std(self):
+        return math.sqrt(self.a) if self.ready else float('inf')
+
+    # 当前估计的角点（整数像素坐标）
+    def corners(self):
+        pos = self.pos
+        return [(int(pos[2*j] + 0.5), int(pos[2*j + 1] + 0.5)) for j in range(4)]
+
+# 角点对应：在新四边形的4种循环起点和2种方向中，选与上一帧角点总位移（平方和）最小的排列，
+# 使角点编号在帧间保持稳定；没有上一帧时以x+y最小的点（左上角）为起点
+def associate_corners(corners, previous):
+    corners = list(corners)
+    if previous is None:
+        start = 0
+        for i in range(1, 4):
+            if corners[i][0] + corners[i][1] < corners[start][0] + corners[start][1]:
+                start = i
+        return corners[start:] + corners[:start]
+
+    best, best_cost = corners, -1
+    for order in (corners, [corners[0], corners[3], corners[2], corners[1]]):
+        for s in range(4):
+            cost = 0
+            for j in range(4):
+                p, q = order[(s + j) % 4], previous[j]
+                cost += (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2
+            if best_cost < 0 or cost < best_cost:
+                best, best_cost = order[s:] + order[:s], cost
+    return best
+
+# 原实现的历史平均（仅用于对比）：权重按缓冲位置取 size - i，缓冲绕回后最旧的帧可能权重最大
+def legacy_average(history):
+    size = len(history)
+    sums = [0] * 8
+    total_weight = 0
+    for i, corners in enumerate(history):
+        if corners is None:
+            continue
+        weight = size - i
+        total_weight += weight
+        for j in range(4):
+            sums[2*j] += corners[j][0] * weight
+            sums[2*j + 1] += corners[j][1] * weight
+    if total_weight == 0:
+        return None
+    return [(int(sums[2*j] / total_weight), int(sums[2*j + 1] / total_weight)) for j in range(4)]
+
+# 平滑结果的延迟：使平滑角点与k帧前原始角点平均距离最小的k（帧）
+def smoothing_lag(track, output, max_lag):
+    best_lag, best_err = 0, -1
+    for k in range(max_lag + 1):
+        err, n = 0.0, 0
+        for t in range(k, len(track)):
+            raw, out = track[t - k], output[t]
+            if raw is None or out is None:
+                continue
+            for j in range(4):
+                err += math.sqrt((out[j][0] - raw[j][0])**2 + (out[j][1] - raw[j][1])**2)
+            n += 4
+        if n and (best_err < 0 or err / n < best_err):
+            best_lag, best_err = k, err / n
+    return best_lag
+
+# 平滑结果的抖动：连续三帧角点二阶差分的均方根（像素）
+def smoothing_jitter(output):
+    total, n = 0.0, 0
+    for t in range(2, len(output)):
+        a, b, c = output[t - 2], output[t - 1], output[t]
+        if a is None or b is None or c is None:
+            continue
+        for j in range(4):
+            for k in range(2):
+                d = c[j][k] - 2 * b[j][k] + a[j][k]
+                total += d * d
+                n += 1
+    return math.sqrt(total / n) if n else 0.0
+
+# 在记录的角点轨迹上重放原历史平均与QuadSmoother（轨迹中None表示该帧未检测到矩形），
+# 返回 ((原延迟帧数, 原抖动), (新延迟帧数, 新抖动))
+def compare_smoothers(track, size):
+    history = [None] * size
+    index = 0
+    ring = QuadSmoother(size)
+    legacy_out, ring_out = [], []
+    for corners in track:
+        history[index] = corners
+        index = (index + 1) % size
+        ring.push(corners)
+        legacy_out.append(legacy_average(history))
+        ring_out.append(ring.average())
+    return ((smoothing_lag(track, legacy_out, size), smoothing_jitter(legacy_out)),
+            (smoothing_lag(track, ring_out, size), smoothing_jitter(ring_out)))
 
 # 计算两点之间的距离
 def distance(p1, p2):
     return math.sqrt((p2[0]-p1[0])**2 + (p2[1]-p1[1])**2)
 
-# 计算矩形质量分数
+# 计算矩形质量分数（原实现，仅用于基准测试对比）
 def calculate_rectangle_quality(corners):
     if len(corners) != 4:
         return 0
@@ -110,6 +631,133 @@ def calculate_rectangle_quality(corners):
 
     return (edge_score * 0.6) + (angle_score * 0.4)
 
+# 批量评估本帧所有候选矩形，返回 (最佳矩形, 分数)，没有达到min_score的候选时返回 (None, min_score)
+# 只用平方边长和余弦：边长得分为 sqrt(最短边²/最长边²)，角度得分由各角|cos|的平均值给出（45°偏差时为0）；
+# 非凸四边形、边长比不可能胜出的候选在计算角度前就被跳过
+def find_best_rect(rects, min_score):
+    best_rect = None
+    best_score = min_score
+    # 边长比下限：edge_score低于此值时即使四个角都是直角也无法超过best_score
+    limit = (best_score - ANGLE_WEIGHT) / EDGE_WEIGHT
+    limit2 = limit * limit if limit > 0 else 0.0
+    for rect in rects:
+        corners = rect.corners()
+        if len(corners) != 4:
+            continue
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = corners
+
+        # 四条边向量及平方长度
+        ax, ay = x1 - x0, y1 - y0
+        bx, by = x2 - x1, y2 - y1
+        cx, cy = x3 - x2, y3 - y2
+        dx, dy = x0 - x3, y0 - y3
+        la = ax*ax + ay*ay
+        lb = bx*bx + by*by
+        lc = cx*cx + cy*cy
+        ld = dx*dx + dy*dy
+        lmin = min(la, lb, lc, ld)
+        lmax = max(la, lb, lc, ld)
+        if lmin == 0 or lmin < limit2 * lmax:
+            continue
+
+        # 凸性检查：相邻边叉积同号（顺时针或逆时针均可，与顶点起始位置无关）
+        c0 = dx*ay - dy*ax
+        c1 = ax*by - ay*bx
+        c2 = bx*cy - by*cx
+        c3 = cx*dy - cy*dx
+        if not ((c0 > 0 and c1 > 0 and c2 > 0 and c3 > 0) or
+                (c0 < 0 and c1 < 0 and c2 < 0 and c3 < 0)):
+            continue
+
+        # 各角余弦的绝对值：相邻两边点积 / 两边长度之积
+        cos_sum = (abs(dx*ax + dy*ay) / math.sqrt(ld * la) +
+                   abs(ax*bx + ay*by) / math.sqrt(la * lb) +
+                   abs(bx*cx + by*cy) / math.sqrt(lb * lc) +
+                   abs(cx*dx + cy*dy) / math.sqrt(lc * ld))
+        score = (EDGE_WEIGHT * math.sqrt(lmin / lmax) +
+                 ANGLE_WEIGHT * (1 - cos_sum / (4 * COS_45)))
+        if score > best_score:
+            best_score = score
+            best_rect = rect
+            limit = (best_score - ANGLE_WEIGHT) / EDGE_WEIGHT
+            limit2 = limit * limit if limit > 0 else 0.0
+    return best_rect, best_score
+
+# 对比原评分（逐个排序+acos）与批量评分的吞吐量（候选数/毫秒）
+def bench_quality(rects):
+    if not rects:
+        return
+    t0 = time.ticks_us()
+    for _ in range(BENCH_REPEAT):
+        legacy_rect, legacy_score = None, QUALITY_THRESHOLD
+        for rect in rects:
+            corners = rect.corners()
+            if len(corners) != 4:
+                continue
+            score = calculate_rectangle_quality(ensure_clockwise(corners))
+            if score > legacy_score:
+                legacy_rect, legacy_score = rect, score
+    t1 = time.ticks_us()
+    for _ in range(BENCH_REPEAT):
+        batch_rect, batch_score = find_best_rect(rects, QUALITY_THRESHOLD)
+    t2 = time.ticks_us()
+    n = len(rects) * BENCH_REPEAT
+    print("Quad scoring: {} candidates, legacy {:.1f}/ms, batch {:.1f}/ms, same best: {}".format(
+        len(rects), n * 1000 / max(1, time.ticks_diff(t1, t0)),
+        n * 1000 / max(1, time.ticks_diff(t2, t1)), legacy_rect is batch_rect))
+
+# 候选阶段：把半分辨率图像再缩小到预先分配的候选图像中，在其上全图找矩形，返回(候选, 候选总数)
+def propose_rects(img_scaled, threshold):
+    global proposal_buffer
+    width = img_scaled.width() // PROPOSAL_SCALE
+    height = img_scaled.height() // PROPOSAL_SCALE
+    if proposal_buffer is None or proposal_buffer.width() != width or proposal_buffer.height() != height:
+        proposal_buffer = image.Image(size=(width, height))
+    proposal_buffer.draw_image(img_scaled, 0, 0, x_scale=1.0 / PROPOSAL_SCALE, y_scale=1.0 / PROPOSAL_SCALE)
+    proposals = proposal_buffer.find_rects(threshold=int(threshold * PROPOSAL_THRESHOLD_RATIO))
+    count = len(proposals)
+    if count > MAX_PROPOSALS:
+        proposals = sorted(proposals, key=lambda r: r.magnitude(), reverse=True)[:MAX_PROPOSALS]
+    return proposals, count
+
+# 验证阶段：在候选外接框（放大到半分辨率并外扩）内重新检测，
+# 没有检测到或尺寸与候选不符的候选被丢弃（相邻候选的ROI重叠时同一矩形只保留一次），返回半分辨率图像坐标
+def verify_rects(img_scaled, proposals, threshold):
+    width, height = img_scaled.width(), img_scaled.height()
+    verified = []
+    for proposal in proposals:
+        x, y, w, h = corners_box(proposal.corners())
+        w, h = w * PROPOSAL_SCALE, h * PROPOSAL_SCALE
+        x0 = max(0, x * PROPOSAL_SCALE - VERIFY_MARGIN)
+        y0 = max(0, y * PROPOSAL_SCALE - VERIFY_MARGIN)
+        x1 = min(width, x * PROPOSAL_SCALE + w + VERIFY_MARGIN)
+        y1 = min(height, y * PROPOSAL_SCALE + h + VERIFY_MARGIN)
+        for rect in img_scaled.find_rects(roi=(x0, y0, x1 - x0, y1 - y0), threshold=threshold):
+            _, _, rw, rh = corners_box(rect.corners())
+            # 候选坐标有±1个候选像素的量化误差，容差再加一个缩放倍数
+            if (abs(rw - w) <= w * VERIFY_SIZE_TOL + PROPOSAL_SCALE and
+                    abs(rh - h) <= h * VERIFY_SIZE_TOL + PROPOSAL_SCALE and
+                    not any(v.corners() == rect.corners() for v in verified)):
+                verified.append(rect)
+    return verified
+
+# 对比单尺度全图检测与多尺度检测的耗时，并记录各自仍能检测到的最小矩形（边缘强度最高者的短边）
+def bench_multiscale(img_scaled, threshold):
+    t0 = time.ticks_us()
+    single = img_scaled.find_rects(threshold=threshold)
+    t1 = time.ticks_us()
+    multi = verify_rects(img_scaled, propose_rects(img_scaled, threshold)[0], threshold)
+    t2 = time.ticks_us()
+    for i, rects in enumerate((single, multi)):
+        if rects:
+            _, _, w, h = corners_box(max(rects, key=lambda r: r.magnitude()).corners())
+            side = min(w, h) * 2
+            if bench_min_side[i] is None or side < bench_min_side[i]:
+                bench_min_side[i] = side
+    print("Rect search: single {:.1f} ms ({} rects), multi-scale {:.1f} ms ({} rects), min side found: single {} px, multi {} px".format(
+        time.ticks_diff(t1, t0) / 1000, len(single), time.ticks_diff(t2, t1) / 1000, len(multi),
+        bench_min_side[0], bench_min_side[1]))
+
 # 计算在矩形边缘上的位置
 def get_position_on_edge(avg_corners, position):
     position %= 4.0
@@ -138,19 +786,52 @@ def send_target_position(x, y):
     uart.write(data_str.encode())
     print("Sent:", data_str.strip())
 
+smoother = QuadSmoother(RECT_HISTORY_SIZE)
+kalman = CornerKalman(KALMAN_ACCEL, KALMAN_MEAS_STD, KALMAN_GATE, KALMAN_MAX_REJECTS)
+
+# 阈值调节状态
+rect_threshold = load_threshold(RECT_THRESHOLD) if AUTO_THRESHOLD else RECT_THRESHOLD
+saved_threshold = rect_threshold
+stable_frames = 0
+tune_frames = 0
+empty_frames = 0  # 连续没有候选的帧数
+
 while True:
     img = sensor.snapshot()
     img.gaussian(1)
 
     # 缩小图像以提高处理速度
-    img_scaled = img.copy().resize(img.width()//2, img.height()//2)
-
-    rects = img_scaled.find_rects(threshold=28000)
+    # 统计缩放步骤的堆分配（gc.mem_alloc差值，期间发生回收时差值为负，忽略）
+    heap_before = gc.mem_alloc()
+    img_scaled = scale_image(img, 2)
+    heap_delta = gc.mem_alloc() - heap_before
+    if heap_delta > 0:
+        scale_alloc += heap_delta
+
+    # 跟踪模式下只在上一次矩形附近搜索
+    roi = search_roi(track_box, miss_count, img_scaled.width(), img_scaled.height()) if USE_ROI_TRACKING else None
+    if roi:
+        rects = img_scaled.find_rects(roi=roi, threshold=rect_threshold)
+        rect_count = len(rects)
+        roi_frames += 1
+    elif MULTI_SCALE:
+        # 在80x60图像上找候选，只在候选附近的半分辨率ROI中验证
+        proposals, rect_count = propose_rects(img_scaled, rect_threshold)
+        rects = verify_rects(img_scaled, proposals, rect_threshold)
+    else:
+        rects = img_scaled.find_rects(threshold=rect_threshold)
+        rect_count = len(rects)
+    frame_count += 1
+    if BENCHMARK and frame_count % BENCH_INTERVAL == 0:
+        bench_quality(rects)
+        bench_multiscale(img_scaled, rect_threshold)
 
     # 更新移动位置
     current_time = time.ticks_ms()
     time_diff = current_time - last_move_time
     last_move_time = current_time
+    if USE_KALMAN:
+        kalman.predict(time_diff / 1000.0)
     current_position += MOVE_SPEED * (time_diff / 100.0)
     if current_position >= 4.0:
         current_position -= 4.0
@@ -158,32 +839,33 @@ while True:
     center_x, center_y = None, None
     avg_corners = []
 
-    valid_rect_found = False
-    best_rect = None
-    best_score = 0
+    # 限制参与评分的候选数，只保留边缘强度最高的几个
+    if len(rects) > MAX_CANDIDATES:
+        rects = sorted(rects, key=lambda r: r.magnitude(), reverse=True)[:MAX_CANDIDATES]
 
-    # 寻找最佳矩形
-    for rect in rects:
-        corners = rect.corners()
-        if len(corners) != 4:
-            continue
-
-        corners = ensure_clockwise(corners)
-        score = calculate_rectangle_quality(corners)
-
-        if score > best_score and score > 0.6:
-            best_score = score
-            best_rect = rect
-            valid_rect_found = True
+    # 一次遍历评估所有候选，寻找最佳矩形
+    # 下限取0以得到本帧最佳分数（即使不合格），供阈值调节区分“没有候选”和“候选质量差”
+    best_rect, best_score = find_best_rect(rects, 0.0)
+    valid_rect_found = best_score >= QUALITY_THRESHOLD
+    if AUTO_THRESHOLD:
+        update_threshold(rect_count, best_score)
 
     if valid_rect_found:
         rect = best_rect
         corners = rect.corners()
         corners = ensure_clockwise(corners)
+        corners = associate_corners(corners, last_corners)  # 与上一帧角点对应，保持编号稳定
+        last_corners = corners
+        track_box = corners_box(corners)
+        miss_count = 0
 
         # 放大到原始图像尺寸
         corners_orig = [(x*2, y*2) for (x, y) in corners]
 
+        # 在原图上对四个角点做亚像素精化
+        if REFINE_CORNERS:
+            corners_orig = refine_corners(img, corners_orig)
+
         # 计算矩形中心
         center_x = int(sum(p[0] for p in corners_orig) / 4)
         center_y = int(sum(p[1] for p in corners_orig) / 4)
@@ -192,6 +874,9 @@ while True:
         w = distance(corners_orig[0], corners_orig[1])
         h = distance(corners_orig[1], corners_orig[2])
         border_width = min(w, h) * 0.12
+        border_measured = False
+        if MEASURE_BORDER:
+            border_width, border_measured = get_border_width(img, corners_orig, border_width)
 
         # 计算内矩形顶点
         inner_corners = []
@@ -215,8 +900,14 @@ while True:
             if bisector_len > 0:
                 bisector = (bisector[0]/bisector_len, bisector[1]/bisector_len)
 
-            inner_x = curr[0] + bisector[0] * border_width
-            inner_y = curr[1] + bisector[1] * border_width
+            # 使用测量宽度时沿角平分线移动 宽度/sin(半角)，使内矩形各边与外边正好相距边框宽度；
+            # 12%估算值是按原有的沿角平分线内缩标定的，不做修正
+            inset = border_width
+            if border_measured:
+                sin_half = abs(v1[0]*bisector[1] - v1[1]*bisector[0])
+                inset = border_width / max(sin_half, 0.3)
+            inner_x = curr[0] + bisector[0] * inset
+            inner_y = curr[1] + bisector[1] * inset
             inner_corners.append((int(inner_x), int(inner_y)))
 
         # 计算平均顶点
@@ -225,33 +916,16 @@ while True:
             avg_x = int((corners_orig[i][0] + inner_corners[i][0]) / 2)
             avg_y = int((corners_orig[i][1] + inner_corners[i][1]) / 2)
             current_avg_corners.append((avg_x, avg_y))
+        if BENCH_SMOOTHER:
+            smoother_track.append(current_avg_corners)
 
-        # 保存到历史记录
-        rect_history[rect_history_index] = current_avg_corners
-        rect_history_index = (rect_history_index + 1) % RECT_HISTORY_SIZE
-
-        # 计算历史平均
-        avg_corners = [[0.0, 0.0] for _ in range(4)]
-        total_weight = 0
-
-        for i, corners in enumerate(rect_history):
-            if corners is None:
-                continue
-
-            weight = RECT_HISTORY_SIZE - i
-            total_weight += weight
-
-            for j in range(4):
-                avg_corners[j][0] += corners[j][0] * weight
-                avg_corners[j][1] += corners[j][1] * weight
-
-        if total_weight > 0:
-            for i in range(4):
-                avg_corners[i][0] = int(avg_corners[i][0] / total_weight)
-                avg_corners[i][1] = int(avg_corners[i][1] / total_weight)
-            avg_corners = [(x, y) for x, y in avg_corners]
+        # 卡尔曼滤波更新，或保存到历史记录并计算历史加权平均
+        if USE_KALMAN:
+            kalman.update(current_avg_corners)
+            avg_corners = kalman.corners()
         else:
-            avg_corners = current_avg_corners
+            smoother.push(current_avg_corners)
+            avg_corners = smoother.average()
 
         # 绘制平均矩形（蓝色）
         for i in range(4):
@@ -280,6 +954,11 @@ while True:
         quality_str = "Q{:.2f}".format(best_score)
         img.draw_string(10, 40, quality_str, color=(255, 255, 255), scale=1.0)
 
+        # 显示角点位置标准差
+        if USE_KALMAN:
+            std_str = "S{:.1f}".format(kalman.std())
+            img.draw_string(10, 60, std_str, color=(255, 255, 255), scale=1.0)
+
         # 绘制中心点（红色十字）
         img.draw_cross(center_x, center_y, color=(255, 0, 0), size=10)
 
@@ -288,32 +967,17 @@ while True:
         img.draw_string(center_x, center_y, center_str, color=(255, 255, 255))
 
     else:
-        # 更新历史记录
-        rect_history[rect_history_index] = None
-        rect_history_index = (rect_history_index + 1) % RECT_HISTORY_SIZE
-
-        # 尝试使用历史数据
-        valid_count = 0
-        avg_corners = [[0.0, 0.0] for _ in range(4)]
-        total_weight = 0
-
-        for i, corners in enumerate(rect_history):
-            if corners is None:
-                continue
-
-            weight = RECT_HISTORY_SIZE - i
-            total_weight += weight
-
-            for j in range(4):
-                avg_corners[j][0] += corners[j][0] * weight
-                avg_corners[j][1] += corners[j][1] * weight
-
-        if total_weight > 0:
-            for i in range(4):
-                avg_corners[i][0] = int(avg_corners[i][0] / total_weight)
-                avg_corners[i][1] = int(avg_corners[i][1] / total_weight)
-            avg_corners = [(x, y) for x, y in avg_corners]
+        miss_count += 1
+        if BENCH_SMOOTHER:
+            smoother_track.append(None)
 
+        # 卡尔曼模式按模型预测（不确定度过大时视为丢失），否则更新历史记录并尝试使用历史数据
+        if USE_KALMAN:
+            avg_corners = kalman.corners() if kalman.std() < KALMAN_LOST_STD else None
+        else:
+            smoother.push(None)
+            avg_corners = smoother.average()
+        if avg_corners is not None:
             # 在原始图像上绘制历史平均矩形（黄色）
             for i in range(4):
                 start = avg_corners[i]
@@ -334,7 +998,7 @@ while True:
             send_target_position(target_x, target_y)
 
             # 显示警告信息 - 使用文档1的格式
-            img.draw_string(10, 80, "HIST DATA", color=(255, 255, 0))
+            img.draw_string(10, 80, "PRED" if USE_KALMAN else "HIST DATA", color=(255, 255, 0))
         else:
             # 完全没有数据时显示错误
             img.draw_string(10, 10, "NO RECT", color=(255, 0, 0))
@@ -344,3 +1008,24 @@ while True:
 
     # 控制处理速度
     time.sleep_ms(20)
+
+    # 记录满一段轨迹后对比两种平滑方式（延迟按记录期间的平均帧间隔换算为毫秒）
+    if BENCH_SMOOTHER and len(smoother_track) >= BENCH_TRACK_FRAMES:
+        frame_ms = time.ticks_diff(time.ticks_ms(), smoother_track_start) / len(smoother_track)
+        (legacy_lag, legacy_jitter), (ring_lag, ring_jitter) = compare_smoothers(smoother_track, RECT_HISTORY_SIZE)
+        print("Smoother on {} frames ({} missed): legacy lag {:.0f} ms, jitter {:.2f} px; ring lag {:.0f} ms, jitter {:.2f} px".format(
+            len(smoother_track), smoother_track.count(None), legacy_lag * frame_ms, legacy_jitter,
+            ring_lag * frame_ms, ring_jitter))
+        smoother_track = []
+        smoother_track_start = time.ticks_ms()
+
+    # 统计稳态帧率（每FPS_WINDOW帧的平均值）
+    fps_frames += 1
+    if fps_frames == FPS_WINDOW:
+        elapsed = time.ticks_diff(time.ticks_ms(), fps_start)
+        print("FPS: {:.1f}, ROI frames: {}/{}, scale alloc: {} B/frame, heap free: {} B".format(
+            fps_frames * 1000 / elapsed, roi_frames, fps_frames, scale_alloc // fps_frames, gc.mem_free()))
+        scale_alloc = 0
+        fps_frames = 0
+        roi_frames = 0
+        fps_start = time.ticks_ms()
@@ -0,0 +1,103 @@
+# QuadSmoother 的主机端测试（CPython + pytest）
+# 脚本在导入时会初始化摄像头和串口，这里只从源码中取出平滑相关的类和函数执行
+import ast
+import math
+import os
+import random
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = ["rectangle_recognition_edge.py", "rectangle_recognition_edge_run.py.py"]
+NAMES = {"QuadSmoother", "legacy_average", "smoothing_lag", "smoothing_jitter", "compare_smoothers"}
+
+
+def load(script):
+    with open(os.path.join(HERE, script), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    body = [node for node in tree.body
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef)) and node.name in NAMES]
+    namespace = {"math": math}
+    exec(compile(ast.Module(body=body, type_ignores=[]), script, "exec"), namespace)
+    return namespace
+
+
+# 直接按新旧加权：窗口内最新帧权重size，最旧帧权重1，None只占位置
+def recency_average(frames, size):
+    window = frames[-size:]
+    sums, total = [0] * 8, 0
+    for age, corners in enumerate(reversed(window)):
+        if corners is None:
+            continue
+        weight = size - age
+        total += weight
+        for j in range(4):
+            sums[2*j] += corners[j][0] * weight
+            sums[2*j + 1] += corners[j][1] * weight
+    if total == 0:
+        return None
+    return [(int(sums[2*j] / total), int(sums[2*j + 1] / total)) for j in range(4)]
+
+
+def quad(x, y, w=80, h=60):
+    return [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+
+
+@pytest.fixture(params=SCRIPTS)
+def ns(request):
+    return load(request.param)
+
+
+def test_recency_weighting_after_wrap(ns):
+    size = 7
+    smoother = ns["QuadSmoother"](size)
+    history, index, frames = [None] * size, 0, []
+    for t in range(3 * size + 3):
+        corners = quad(10 * t, 5 * t)
+        frames.append(corners)
+        smoother.push(corners)
+        history[index] = corners
+        index = (index + 1) % size
+        assert smoother.average() == recency_average(frames, size)
+    # 绕回之后原实现按缓冲位置加权：此时最旧的帧在0号位置，权重最大，结果落后于按新旧加权
+    legacy = ns["legacy_average"](history)
+    assert legacy != smoother.average()
+    assert legacy[0][0] < smoother.average()[0][0]
+
+
+def test_missed_frames(ns):
+    size = 5
+    smoother = ns["QuadSmoother"](size)
+    history, index, frames = [None] * size, 0, []
+    random.seed(7)
+    for t in range(200):
+        corners = quad(t, 2 * t) if random.random() > 0.4 else None
+        frames.append(corners)
+        smoother.push(corners)
+        history[index] = corners
+        index = (index + 1) % size
+        assert smoother.average() == recency_average(frames, size)
+        # 有效帧集合与原实现相同：同为None，或同为有值
+        assert (smoother.average() is None) == (ns["legacy_average"](history) is None)
+
+    # 连续丢失size帧后历史清空；之后第一帧有效数据直接作为平均值
+    for _ in range(size):
+        smoother.push(None)
+    assert smoother.average() is None
+    smoother.push(quad(3, 4))
+    assert smoother.average() == quad(3, 4)
+
+
+def test_compare_smoothers_on_track(ns):
+    # 匀速移动、带±1像素噪声和丢帧的角点轨迹
+    random.seed(3)
+    track = []
+    for t in range(300):
+        if random.random() < 0.1:
+            track.append(None)
+            continue
+        x = 40 + t + random.randint(-1, 1)
+        track.append(quad(x, 30 + random.randint(-1, 1)))
+    (legacy_lag, legacy_jitter), (ring_lag, ring_jitter) = ns["compare_smoothers"](track, 7)
+    assert ring_lag < legacy_lag
+    assert ring_jitter < legacy_jitter
@@ -36,6 +36,30 @@ sensor.skip_frames(time=2000)
 lcd.rotation(0)                       # 确保显示方向正确
 clock = time.clock()
 
+EDGE_COLOR = (255, 0, 0)  # 边缘标记颜色（红色）
+USE_PIXEL_LOOP = False    # True: 使用逐像素循环叠加（仅用于帧率对比）
+BENCH_FRAMES = 0          # >0 时两种叠加方式各运行 BENCH_FRAMES 帧并打印平均帧率
+
+# 预先分配一张纯红色图像作为叠加颜色源（只在启动时分配一次）
+red_img = image.Image(size=(sensor.width(), sensor.height()))
+red_img.draw_rectangle(0, 0, red_img.width(), red_img.height(), color=EDGE_COLOR, fill=True)
+
+# 批量叠加：以边缘图作为掩码（>127 的像素为边缘），一次性把红色写入原图
+def overlay_edges(img, edges):
+    img.replace(red_img, mask=edges)
+
+# 逐像素叠加（原实现，QVGA 下每帧 76800 次 get_pixel）
+def overlay_edges_loop(img, edges):
+    for x in range(img.width()):
+        for y in range(img.height()):
+            if edges.get_pixel(x, y) > 127:  # 如果检测到边缘
+                img.set_pixel(x, y, EDGE_COLOR)
+
+# 帧率对比统计
+bench_count = 0
+bench_start = time.ticks_ms()
+bench_fps = {}
+
 while True:
     clock.tick()
     # 获取彩色图像
@@ -45,13 +69,25 @@ while True:
     gray = img.copy().to_grayscale()
     gray.find_edges(image.EDGE_SIMPLE, threshold=(100, 255))
 
-    # 在所有检测到的边缘上绘制红线
-    for x in range(img.width()):
-        for y in range(img.height()):
-            if gray.get_pixel(x, y) > 127:  # 如果检测到边缘
-                # 在原始彩色图像上绘制红线 (RGB565格式)
-                img.set_pixel(x, y, (255, 0, 0))
+    # 在所有检测到的边缘上标记红色
+    if USE_PIXEL_LOOP:
+        overlay_edges_loop(img, gray)
+    else:
+        overlay_edges(img, gray)
 
     lcd.display(img)  # 显示彩色图像
     print(clock.fps())  # 打印帧率
 
+    # 两种叠加方式轮流运行，统计各自的平均帧率
+    if BENCH_FRAMES > 0:
+        bench_count += 1
+        if bench_count >= BENCH_FRAMES:
+            elapsed = time.ticks_diff(time.ticks_ms(), bench_start)
+            mode = "loop" if USE_PIXEL_LOOP else "mask"
+            bench_fps[mode] = bench_count * 1000.0 / max(1, elapsed)
+            print("Overlay %s: %.2f fps" % (mode, bench_fps[mode]))
+            if len(bench_fps) == 2:
+                print("Speedup: %.1fx" % (bench_fps["mask"] / max(0.01, bench_fps["loop"])))
+            USE_PIXEL_LOOP = not USE_PIXEL_LOOP
+            bench_count = 0
+            bench_start = time.ticks_ms()
@@ -1,4 +1,5 @@
-import sensor, image, time, lcd, math, gc, heapq
+import sensor, image, time, lcd, math, gc, heapq, struct
+from array import array
 
 # 初始化摄像头
 sensor.reset()
@@ -9,8 +10,29 @@ lcd.rotation(0)
 clock = time.clock()
 
 # 系统参数
-GRID_SIZE = 8  # 网格大小（降低分辨率）
+GRID_SIZE = 8  # 网格大小（降低分辨率），可按需改为4/16等
 THRESHOLD = 30  # 污染区二值化阈值
+POOL_MODE = 'min'  # 'min': 网格内任一像素低于阈值即为障碍；'mean': 网格平均灰度低于阈值才为障碍
+BENCHMARK = False  # 基准测试：定期对比建图耗时，重新规划时对比新旧A*
+BENCH_INTERVAL = 30  # 基准测试间隔帧数
+PLANNER_MODE = 'lpa'  # 'lpa': 增量修复上一次的解（LPA*）；'astar': 地图变化时完整重新规划；
+                      # 'field': 维护从出口出发的代价场，起点每帧变化时沿代价场下降取路径；
+                      # 'hier': 先在粗网格上规划，再只在粗路径附近的走廊内做细网格A*（配合GRID_SIZE=4或2使用）
+COARSE_FACTOR = 4  # 'hier'模式粗网格边长（细网格数），例如GRID_SIZE=4时粗网格为16像素
+CORRIDOR_RADIUS = 1  # 'hier'模式走廊半径（粗网格数），细网格搜索只在粗路径外扩此半径的范围内进行
+PARTIAL_PENALTY = 200  # 'hier'模式进入部分被占据的粗单元的附加代价（粗网格直线移动代价为10），代价数组为字节，不超过255
+START_THRESHOLD = (80, 100, 55, 100, -30, 30)  # 'field'模式下起点标记（默认红色激光点）的LAB阈值
+RECORD_FILE = None  # 例如 "/sd/grid_seq.bin"：记录每帧网格地图，供离线回放
+REPLAY_FILE = None  # 设置后回放记录文件，打印每帧A*与LPA*的扩展节点数后退出
+USE_HYSTERESIS = True  # 对网格地图做时间迟滞滤波，抑制噪声引起的频繁重新规划
+BLOCK_FRAMES = 3  # 连续N帧为暗才判为障碍
+CLEAR_FRAMES = 5  # 连续M帧为亮才判为可通行
+SMOOTH_PATH = True  # 用视线检查剪枝网格路径，只保留转折点
+USE_CLEARANCE = True  # 根据离障碍物的距离膨胀障碍并增加软代价，使路径远离污染区
+INFLATE_RADIUS = 1  # 膨胀半径（网格数，按10/14倒角距离），此距离内的单元视为障碍
+SOFT_RADIUS = 3  # 软代价半径（网格数），此距离内越靠近障碍物通行代价越高
+CLEARANCE_WEIGHT = 4  # 软代价系数：每靠近障碍物一格增加的代价（直线移动代价为10）
+CM_PER_PIXEL = 0.1  # 假设1像素=0.1cm
 RED_COLOR = (255, 0, 0)
 BLUE_COLOR = (0, 0, 255)
 GREEN_COLOR = (0, 255, 0)
@@ -30,8 +52,11 @@ class Node:
     def __lt__(self, other):
         return self.f < other.f
 
-# A*路径规划算法
+# A*路径规划算法（原实现，仅用于基准测试对比）
+legacy_expanded = 0
+
 def astar(grid, start, end):
+    global legacy_expanded
     grid_w, grid_h = len(grid[0]), len(grid)
     open_set = []
     closed_set = set()
@@ -43,6 +68,7 @@ def astar(grid, start, end):
     while open_set:
         current = heapq.heappop(open_set)
         closed_set.add((current.x, current.y))
+        legacy_expanded += 1
 
         # 找到路径
         if (current.x, current.y) == (end_node.x, end_node.y):
@@ -82,31 +108,795 @@ def astar(grid, start, end):
 
     return []  # 无路径
 
-# 主循环
-path = []
-last_grid = None
+# 位压缩网格地图：每行一个整数，第x位为1表示(x, y)是障碍物
+class BitGrid:
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.rows = [0] * height
 
-while True:
-    clock.tick()
-    gc.collect()  # 垃圾回收防止内存溢出
+    def get(self, x, y):
+        return (self.rows[y] >> x) & 1
 
-    img = sensor.snapshot()
-    gray = img.copy().to_grayscale()
+    # 逐行比较，O(行数)
+    def equals(self, other):
+        return self.rows == other.rows
+
+    # 逐行异或，返回变化单元列表（元素为 (节点编号 << 1) | 新障碍值）
+    def diff(self, other):
+        changes = []
+        w = self.width
+        for y in range(self.height):
+            row = self.rows[y]
+            x_bits = row ^ other.rows[y]
+            x = 0
+            while x_bits:
+                if x_bits & 1:
+                    changes.append(((y * w + x) << 1) | ((row >> x) & 1))
+                x_bits >>= 1
+                x += 1
+        return changes
+
+    # 转换为二维列表地图（仅用于基准测试对比原实现）
+    def to_lists(self):
+        return [[(row >> x) & 1 for x in range(self.width)] for row in self.rows]
+
+# 网格迟滞滤波：每个单元一个饱和计数器，连续多帧观测一致后才翻转状态
+class HysteresisFilter:
+    def __init__(self, width, height, block_frames, clear_frames):
+        self.width, self.height = width, height
+        self.block_frames, self.clear_frames = block_frames, clear_frames
+        self.counts = bytearray(width * height)  # 连续与当前状态不一致的帧数
+        self.pending = [0] * height              # 计数器非零的单元位图
+        self.state = BitGrid(width, height)      # 去抖后的地图
+
+    # 直接采用raw作为初始状态
+    def reset(self, raw):
+        for y in range(self.height):
+            self.state.rows[y] = raw.rows[y]
+            self.pending[y] = 0
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+
+    # 输入一帧原始地图，返回去抖后地图的变化单元列表（元素为 (节点编号 << 1) | 新障碍值）
+    def update(self, raw):
+        changes = []
+        counts, rows, pending = self.counts, self.state.rows, self.pending
+        w = self.width
+        for y in range(self.height):
+            state = rows[y]
+            disagree = raw.rows[y] ^ state
+            # 只处理与状态不一致或计数器未清零的单元
+            bits = disagree | pending[y]
+            if not bits:
+                continue
+            new_pending = 0
+            x = 0
+            i = y * w
+            while bits:
+                if bits & 1:
+                    if (disagree >> x) & 1:
+                        count = counts[i] + 1
+                        limit = self.clear_frames if (state >> x) & 1 else self.block_frames
+                        if count >= limit:
+                            state ^= 1 << x
+                            counts[i] = 0
+                            changes.append((i << 1) | ((state >> x) & 1))
+                        else:
+                            counts[i] = count
+                            new_pending |= 1 << x
+                    else:
+                        counts[i] = 0
+                bits >>= 1
+                x += 1
+                i += 1
+            rows[y] = state
+            pending[y] = new_pending
+        return changes
+
+# 安全距离地图：两遍倒角距离变换（10/14）得到每个单元到最近障碍物的距离，
+# 据此把膨胀后的障碍和软代价直接写入规划器的blocked/penalty数组
+class ClearanceMap:
+    def __init__(self, width, height, blocked, penalty, inflate, soft, weight):
+        n = width * height
+        self.width, self.height = width, height
+        self.blocked, self.penalty = blocked, penalty  # 规划器的数组（就地写入）
+        self.inflate = inflate * 10                    # 膨胀距离（倒角距离单位）
+        self.cap = max(inflate, soft) * 10             # 距离上限，超过此距离的单元无附加代价
+        self.radius = max(inflate, soft)               # 单元变化的影响半径（网格数）
+        self.weight = weight
+        self.obstacle = bytearray(n)                   # 原始障碍物
+        self.dist = array('H', [self.cap] * n)         # 距离变换缓冲，仅在重新计算的窗口内有效
+        self.protected = -1                            # 不做膨胀的单元（终点）
+
+    # 载入整张地图并全图计算
+    def load(self, grid):
+        unpack_grid(grid, self.obstacle)
+        self._recompute(0, 0, self.width - 1, self.height - 1, 0, 0, self.width - 1, self.height - 1, None)
+
+    # 只在变化单元附近重新计算，返回规划器数组中发生变化的单元（元素为 (节点编号 << 1) | 新障碍值）
+    def update(self, changes):
+        result = []
+        if not changes:
+            return result
+        w, h, r = self.width, self.height, self.radius
+        x0, y0, x1, y1 = w, h, -1, -1
+        obstacle = self.obstacle
+        for change in changes:
+            u = change >> 1
+            obstacle[u] = change & 1
+            x, y = u % w, u // w
+            if x < x0: x0 = x
+            if x > x1: x1 = x
+            if y < y0: y0 = y
+            if y > y1: y1 = y
+        # 受影响区域为变化外接框外扩r，计算时还需再外扩r以包含所有可能的最近障碍物
+        bx0, by0 = max(0, x0 - r), max(0, y0 - r)
+        bx1, by1 = min(w - 1, x1 + r), min(h - 1, y1 + r)
+        self._recompute(max(0, bx0 - r), max(0, by0 - r), min(w - 1, bx1 + r), min(h - 1, by1 + r),
+                        bx0, by0, bx1, by1, result)
+        return result
+
+    # 在窗口(wx0..wx1, wy0..wy1)内做两遍倒角距离变换，只写回区域(bx0..bx1, by0..by1)
+    def _recompute(self, wx0, wy0, wx1, wy1, bx0, by0, bx1, by1, result):
+        w, cap, obstacle, dist = self.width, self.cap, self.obstacle, self.dist
+        # 正向扫描
+        for y in range(wy0, wy1 + 1):
+            i = y * w + wx0
+            for x in range(wx0, wx1 + 1):
+                if obstacle[i]:
+                    d = 0
+                else:
+                    d = cap
+                    if x > wx0 and dist[i - 1] + 10 < d:
+                        d = dist[i - 1] + 10
+                    if y > wy0:
+                        j = i - w
+                        if dist[j] + 10 < d:
+                            d = dist[j] + 10
+                        if x > wx0 and dist[j - 1] + 14 < d:
+                            d = dist[j - 1] + 14
+                        if x < wx1 and dist[j + 1] + 14 < d:
+                            d = dist[j + 1] + 14
+                dist[i] = d
+                i += 1
+        # 反向扫描
+        for y in range(wy1, wy0 - 1, -1):
+            i = y * w + wx1
+            for x in range(wx1, wx0 - 1, -1):
+                d = dist[i]
+                if d:
+                    if x < wx1 and dist[i + 1] + 10 < d:
+                        d = dist[i + 1] + 10
+                    if y < wy1:
+                        j = i + w
+                        if dist[j] + 10 < d:
+                            d = dist[j] + 10
+                        if x < wx1 and dist[j + 1] + 14 < d:
+                            d = dist[j + 1] + 14
+                        if x > wx0 and dist[j - 1] + 14 < d:
+                            d = dist[j - 1] + 14
+                    dist[i] = d
+                i -= 1
+        # 距离转换为膨胀障碍和软代价
+        blocked, penalty = self.blocked, self.penalty
+        for y in range(by0, by1 + 1):
+            i = y * w + bx0
+            for x in range(bx0, bx1 + 1):
+                d = dist[i]
+                if obstacle[i]:
+                    b, p = 1, 0
+                elif d <= self.inflate and i != self.protected:
+                    b, p = 1, 0
+                else:
+                    b = 0
+                    p = self.weight * (cap - d) // 10
+                    if p > 254:
+                        p = 254
+                if b != blocked[i] or p != penalty[i]:
+                    blocked[i] = b
+                    penalty[i] = p
+                    if result is not None:
+                        result.append((i << 1) | b)
+                i += 1
+
+# 把位压缩地图展开到规划器的扁平障碍数组
+def unpack_grid(grid, blocked):
+    w = grid.width
+    i = 0
+    for row in grid.rows:
+        for x in range(w):
+            blocked[i] = (row >> x) & 1
+            i += 1
+
+# 8邻域方向及移动代价（直线10，对角线14）
+NEIGHBORS = ((0, 1, 10), (1, 0, 10), (0, -1, 10), (-1, 0, 10),
+             (1, 1, 14), (1, -1, 14), (-1, 1, 14), (-1, -1, 14))
+INDEX_BITS = 16  # 堆中打包整数的节点编号位数（网格最多65536个单元）
+INDEX_MASK = (1 << INDEX_BITS) - 1
+
+# 八方向距离启发函数（与14/10代价一致，可采纳且一致）
+def octile(dx, dy):
+    if dx < 0:
+        dx = -dx
+    if dy < 0:
+        dy = -dy
+    return 10 * (dx + dy) - 6 * (dx if dx < dy else dy)
+
+# 网格A*规划器：所有状态保存在预分配的扁平数组中，搜索过程中不为节点分配对象
+class GridPlanner:
+    def __init__(self, width, height):
+        n = width * height
+        if n > INDEX_MASK + 1:
+            raise ValueError("grid too large")
+        self.width, self.height = width, height
+        self.blocked = bytearray(n)           # 1=障碍物
+        self.penalty = bytearray(n)           # 进入该单元的附加代价（安全距离软代价）
+        self.g = array('i', [0] * n)          # 起点到各节点的代价
+        self.parent = array('i', [0] * n)     # 父节点编号，-1表示起点
+        self.stamp = array('H', [0] * n)      # g/parent有效的搜索编号，避免每次清零
+        self.closed = bytearray((n + 7) >> 3)  # 关闭列表位图
+        self.search_id = 0
+        self.heap = []                        # 元素为 (f, h, 节点编号) 打包成的整数
+        self.expanded = 0                     # 上一次规划扩展的节点数
+
+    # 从位压缩网格地图载入障碍物
+    def load(self, grid):
+        unpack_grid(grid, self.blocked)
+
+    # 写入变化单元：changes中每个元素为 (节点编号 << 1) | 新障碍值
+    def update(self, changes):
+        blocked = self.blocked
+        for change in changes:
+            blocked[change >> 1] = change & 1
+
+    # 障碍/代价数组被外部整体改写（每次规划都从头搜索，无需处理）
+    def invalidate(self):
+        pass
+
+    def _new_search(self):
+        self.search_id += 1
+        if self.search_id > 0xFFFF:
+            stamp = self.stamp
+            for i in range(len(stamp)):
+                stamp[i] = 0
+            self.search_id = 1
+        closed = self.closed
+        for i in range(len(closed)):
+            closed[i] = 0
+        del self.heap[:]
+        self.expanded = 0
+
+    # 规划从start到goal的最优路径，返回网格坐标列表（无路径返回空列表）
+    def plan(self, start, goal):
+        self.expanded = 0
+        w, h = self.width, self.height
+        sx, sy = start
+        tx, ty = goal
+        if not (0 <= sx < w and 0 <= sy < h and 0 <= tx < w and 0 <= ty < h):
+            return []
+        blocked = self.blocked
+        target = ty * w + tx
+        if blocked[target]:
+            return []
+
+        self._new_search()
+        g, parent, stamp, closed = self.g, self.parent, self.stamp, self.closed
+        penalty, heap, sid = self.penalty, self.heap, self.search_id
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        source = sy * w + sx
+        g[source] = 0
+        parent[source] = -1
+        stamp[source] = sid
+        hs = octile(tx - sx, ty - sy)
+        heappush(heap, (((hs << INDEX_BITS) | hs) << INDEX_BITS) | source)
+
+        expanded = 0
+        found = False
+        while heap:
+            u = heappop(heap) & INDEX_MASK
+            # 惰性删除：同一节点的旧条目在关闭后直接丢弃
+            if closed[u >> 3] & (1 << (u & 7)):
+                continue
+            closed[u >> 3] |= 1 << (u & 7)
+            expanded += 1
+            if u == target:
+                found = True
+                break
+
+            ux, uy = u % w, u // w
+            gu = g[u]
+            for dx, dy, cost in NEIGHBORS:
+                nx, ny = ux + dx, uy + dy
+                if nx < 0 or ny < 0 or nx >= w or ny >= h:
+                    continue
+                v = ny * w + nx
+                if blocked[v] or closed[v >> 3] & (1 << (v & 7)):
+                    continue
+                ng = gu + cost + penalty[v]
+                # 去重：已有更优或相同代价时不再入堆
+                if stamp[v] == sid and g[v] <= ng:
+                    continue
+                stamp[v] = sid
+                g[v] = ng
+                parent[v] = u
+                hv = octile(tx - nx, ty - ny)
+                heappush(heap, ((((ng + hv) << INDEX_BITS) | hv) << INDEX_BITS) | v)
+
+        self.expanded = expanded
+        if not found:
+            return []
+
+        path = []
+        u = target
+        while u >= 0:
+            path.append((u % w, u // w))
+            u = parent[u]
+        path.reverse()
+        return path
+
+# 分层规划器：粗网格单元内细单元全为障碍才视为障碍，部分占据的单元加代价；
+# 细网格A*只在粗路径走廊内搜索，走廊外的单元在细规划器的障碍数组中始终为1
+class HierarchicalPlanner:
+    def __init__(self, width, height, factor, radius):
+        if not 0 <= PARTIAL_PENALTY <= 255:
+            raise ValueError("PARTIAL_PENALTY must fit in a byte")
+        n = width * height
+        self.width, self.height = width, height
+        self.factor, self.radius = factor, radius
+        self.blocked = bytearray(n)           # 细网格障碍（1=障碍物）
+        self.penalty = bytearray(n)           # 细网格附加代价
+        cw, ch = (width + factor - 1) // factor, (height + factor - 1) // factor
+        self.coarse = GridPlanner(cw, ch)
+        self.fine = GridPlanner(width, height)
+        self.fine.penalty = self.penalty      # 细搜索共用代价数组，只替换障碍数组
+        fine_blocked = self.fine.blocked
+        for i in range(n):
+            fine_blocked[i] = 1
+        self.corridor = bytearray(cw * ch)    # 当前已展开到细规划器的粗单元
+        self.corridor_cells = []
+        # 展开/收回时按行切片复制；memoryview切片不分配新的字节数组
+        self.blocked_view = memoryview(self.blocked)
+        self.fine_view = memoryview(fine_blocked)
+        self.ones = memoryview(bytes([1]) * factor)
+        self.expanded = 0                     # 上一次规划扩展的节点数（粗+细）
+        self.fallbacks = 0                    # 走廊内无解、退回全图细搜索的次数
+
+    # 从位压缩网格地图载入障碍物
+    def load(self, grid):
+        unpack_grid(grid, self.blocked)
+        self.invalidate()
+
+    # 写入变化单元，只重新统计受影响的粗单元
+    def update(self, changes):
+        blocked, f, w = self.blocked, self.factor, self.width
+        cw = self.coarse.width
+        touched = set()
+        for change in changes:
+            u = change >> 1
+            blocked[u] = change & 1
+            touched.add((u // w) // f * cw + (u % w) // f)
+        for c in touched:
+            self._update_coarse(c)
+
+    # 细网格障碍/代价数组被外部整体改写后，重新生成整张粗网格
+    def invalidate(self):
+        for c in range(self.coarse.width * self.coarse.height):
+            self._update_coarse(c)
+
+    def _update_coarse(self, c):
+        f, w, h, blocked = self.factor, self.width, self.height, self.blocked
+        cw = self.coarse.width
+        x0, y0 = (c % cw) * f, (c // cw) * f
+        x1, y1 = min(x0 + f, w), min(y0 + f, h)
+        count = 0
+        for y in range(y0, y1):
+            i = y * w
+            for x in range(x0, x1):
+                count += blocked[i + x]
+        total = (x1 - x0) * (y1 - y0)
+        # 细单元全被占据时粗单元不可通行；部分占据的单元可能是细网格上的墙，
+        # 给较大代价使粗路径尽量只经过完全空闲的单元（这样的路径在细网格上必然连通）
+        self.coarse.blocked[c] = 1 if count == total else 0
+        self.coarse.penalty[c] = PARTIAL_PENALTY if count else 0
+
+    # 把粗单元c展开到细规划器（复制细网格障碍），或收回（全部置为障碍）
+    def _set_block(self, c, expand):
+        f, w, h = self.factor, self.width, self.height
+        cw = self.coarse.width
+        x0, y0 = (c % cw) * f, (c // cw) * f
+        x1 = min(x0 + f, w)
+        src, dst, ones = self.blocked_view, self.fine_view, self.ones
+        for y in range(y0, min(y0 + f, h)):
+            i = y * w
+            dst[i + x0:i + x1] = src[i + x0:i + x1] if expand else ones[:x1 - x0]
+
+    def _expand(self, c):
+        if not self.corridor[c]:
+            self.corridor[c] = 1
+            self.corridor_cells.append(c)
+            self._set_block(c, True)
+
+    # 恢复细规划器的障碍数组：走廊外全部为障碍
+    def _clear_corridor(self):
+        corridor = self.corridor
+        for c in self.corridor_cells:
+            self._set_block(c, False)
+            corridor[c] = 0
+        del self.corridor_cells[:]
+
+    def plan(self, start, goal):
+        f, r = self.factor, self.radius
+        coarse, fine = self.coarse, self.fine
+        cw, ch = coarse.width, coarse.height
+        self.expanded = 0
+        # 细路径经过的粗单元至少含一个空闲细单元且依次相邻，因此粗网格无解时细网格也无解
+        coarse_path = coarse.plan((start[0] // f, start[1] // f), (goal[0] // f, goal[1] // f))
+        self.expanded = coarse.expanded
+        if not coarse_path:
+            return []
+
+        # 粗路径外扩r个粗单元作为走廊，展开对应的细单元
+        for cx, cy in coarse_path:
+            for ny in range(max(0, cy - r), min(ch, cy + r + 1)):
+                for nx in range(max(0, cx - r), min(cw, cx + r + 1)):
+                    self._expand(ny * cw + nx)
+        path = fine.plan(start, goal)
+        self.expanded += fine.expanded
+        if not path:
+            # 粗单元内的空闲细单元可能互不连通，此时退回全图细搜索
+            self.fallbacks += 1
+            for c in range(cw * ch):
+                self._expand(c)
+            path = fine.plan(start, goal)
+            self.expanded += fine.expanded
+        self._clear_corridor()
+        return path
+
+# 增量A*（LPA*）规划器：地图只有少量单元变化时，只重新扩展受影响的节点
+KEY_BITS = 22  # 打包键中每个分量的位数
+INF = (1 << KEY_BITS) - 1
+HEAP_COMPACT_FACTOR = 4  # 堆条目数超过 单元数×此倍数 时清理过期条目
+
+class LPAStarPlanner:
+    def __init__(self, width, height):
+        n = width * height
+        if n > INDEX_MASK + 1:
+            raise ValueError("grid too large")
+        self.width, self.height = width, height
+        self.blocked = bytearray(n)           # 1=障碍物
+        self.penalty = bytearray(n)           # 进入该单元的附加代价（安全距离软代价）
+        self.g = array('i', [INF] * n)
+        self.rhs = array('i', [INF] * n)      # 基于邻居g值的单步前瞻代价
+        self.heap = []                        # 元素为 (k1, k2, 节点编号) 打包成的整数
+        self.heap_limit = n * HEAP_COMPACT_FACTOR
+        self.start = self.goal = -1
+        self.expanded = 0                     # 上一次规划扩展的节点数
+        self.dirty = True                     # 地图整体变化，需要重新初始化
+
+    # 从位压缩网格地图载入障碍物（下次规划时从头搜索）
+    def load(self, grid):
+        unpack_grid(grid, self.blocked)
+        self.dirty = True
+
+    # 障碍/代价数组被外部整体改写，下次规划时从头搜索
+    def invalidate(self):
+        self.dirty = True
+
+    # 通知单元变化：changes中每个元素为 (节点编号 << 1) | 新障碍值
+    def update(self, changes):
+        blocked = self.blocked
+        for change in changes:
+            blocked[change >> 1] = change & 1
+        if self.dirty:
+            return
+        for change in changes:
+            u = change >> 1
+            self._update_vertex(u)
+            self._update_neighbors(u)
+
+    def _heuristic(self, u):
+        if self.goal < 0:
+            return 0  # 距离场模式没有终点，退化为增量Dijkstra
+        w = self.width
+        return octile(self.goal % w - u % w, self.goal // w - u // w)
+
+    def _push(self, u):
+        k2 = self.g[u]
+        if self.rhs[u] < k2:
+            k2 = self.rhs[u]
+        k1 = k2 + self._heuristic(u)
+        heapq.heappush(self.heap, ((((k1 << KEY_BITS) | k2) << INDEX_BITS) | u))
+        if len(self.heap) > self.heap_limit:
+            self._compact()
+
+    # 清理堆：惰性删除只在条目到达堆顶时丢弃，长时间增量运行后过期条目会不断累积。
+    # 只保留不一致且键仍为当前值的节点（每个节点一条），原地重建堆
+    def _compact(self):
+        g, rhs, heap = self.g, self.rhs, self.heap
+        kept = bytearray(len(g))
+        live = []
+        for entry in heap:
+            u = entry & INDEX_MASK
+            if g[u] == rhs[u] or kept[u]:
+                continue
+            k2 = g[u] if g[u] < rhs[u] else rhs[u]
+            if ((k2 + self._heuristic(u)) << KEY_BITS) | k2 == entry >> INDEX_BITS:
+                kept[u] = 1
+                live.append(entry)
+        heap[:] = live
+        heapq.heapify(heap)
+
+    def _update_vertex(self, u):
+        if u != self.start:
+            best = INF
+            if not self.blocked[u]:
+                w, h = self.width, self.height
+                ux, uy = u % w, u // w
+                g, blocked, start = self.g, self.blocked, self.start
+                for dx, dy, cost in NEIGHBORS:
+                    nx, ny = ux + dx, uy + dy
+                    if nx < 0 or ny < 0 or nx >= w or ny >= h:
+                        continue
+                    v = ny * w + nx
+                    if blocked[v] and v != start:
+                        continue
+                    c = g[v] + cost
+                    if c < best:
+                        best = c
+                if best < INF:
+                    best += self.penalty[u]
+                    if best > INF:
+                        best = INF
+            self.rhs[u] = best
+        if self.g[u] != self.rhs[u]:
+            self._push(u)
+
+    def _update_neighbors(self, u):
+        w, h = self.width, self.height
+        ux, uy = u % w, u // w
+        for dx, dy, cost in NEIGHBORS:
+            nx, ny = ux + dx, uy + dy
+            if 0 <= nx < w and 0 <= ny < h:
+                self._update_vertex(ny * w + nx)
+
+    def _reset(self, start, goal):
+        g, rhs = self.g, self.rhs
+        for i in range(len(g)):
+            g[i] = INF
+            rhs[i] = INF
+        del self.heap[:]
+        self.start, self.goal = start, goal
+        rhs[start] = 0
+        self._push(start)
+        self.dirty = False
+
+    def _compute(self):
+        g, rhs, heap, goal = self.g, self.rhs, self.heap, self.goal
+        heappop = heapq.heappop
+        expanded = 0
+        while heap:
+            top = heap[0]
+            u = top & INDEX_MASK
+            # 惰性删除：已一致的节点或键已过期的条目直接丢弃
+            k2 = g[u] if g[u] < rhs[u] else rhs[u]
+            key = ((k2 + self._heuristic(u)) << KEY_BITS) | k2
+            if g[u] == rhs[u] or key != top >> INDEX_BITS:
+                heappop(heap)
+                continue
+            # 终点一致且堆顶键不小于终点键时，终点代价已是最优
+            if goal >= 0:
+                k2 = g[goal] if g[goal] < rhs[goal] else rhs[goal]
+                if rhs[goal] == g[goal] and key >= ((k2 << KEY_BITS) | k2):
+                    break
+            heappop(heap)
+            expanded += 1
+            if g[u] > rhs[u]:
+                g[u] = rhs[u]
+            else:
+                g[u] = INF
+                self._update_vertex(u)
+            self._update_neighbors(u)
+        self.expanded = expanded
+
+    # 规划从start到goal的最优路径；起终点不变时只修复受变化影响的部分
+    def plan(self, start, goal):
+        w, h = self.width, self.height
+        sx, sy = start
+        tx, ty = goal
+        if not (0 <= sx < w and 0 <= sy < h and 0 <= tx < w and 0 <= ty < h):
+            return []
+        source, target = sy * w + sx, ty * w + tx
+        if self.dirty or source != self.start or target != self.goal:
+            self._reset(source, target)
+        self._compute()
+        return self.path()
+
+    # 以source为源计算到所有单元的代价场；地图只有少量变化时增量更新
+    def build_field(self, source):
+        sx, sy = source
+        if not (0 <= sx < self.width and 0 <= sy < self.height):
+            return
+        u = sy * self.width + sx
+        if self.dirty or u != self.start or self.goal >= 0:
+            self._reset(u, -1)
+        self._compute()
+
+    # 规划结果：从终点回溯后反转为起点到终点
+    def path(self):
+        if self.goal < 0 or self.blocked[self.goal]:
+            return []
+        path = self.descend(self.goal % self.width, self.goal // self.width)
+        path.reverse()
+        return path
+
+    # 从(x, y)沿g值下降方向走到源点，O(路径长度)；不可达返回空列表
+    # (x, y)本身在障碍物或膨胀区内时，先走到代价最小的可通行邻居
+    def descend(self, x, y):
+        g, blocked, start = self.g, self.blocked, self.start
+        w, h = self.width, self.height
+        if not (0 <= x < w and 0 <= y < h):
+            return []
+        u = y * w + x
+        if g[u] >= INF and not blocked[u]:
+            return []
+        path = [(x, y)]
+        for _ in range(len(g)):
+            if u == start:
+                return path
+            ux, uy = u % w, u // w
+            best, best_v = INF, -1
+            for dx, dy, cost in NEIGHBORS:
+                nx, ny = ux + dx, uy + dy
+                if nx < 0 or ny < 0 or nx >= w or ny >= h:
+                    continue
+                v = ny * w + nx
+                if blocked[v] and v != start:
+                    continue
+                c = g[v] + cost
+                if c < best:
+                    best, best_v = c, v
+            if best_v < 0:
+                break
+            u = best_v
+            path.append((u % w, u // w))
+        return []
+
+# 计算路径代价（直线10，对角线14）
+def path_cost(path):
+    cost = 0
+    for i in range(1, len(path)):
+        cost += 14 if path[i][0] != path[i-1][0] and path[i][1] != path[i-1][1] else 10
+    return cost
+
+# 网格视线检查：线段经过的所有单元（恰好经过格点时含两侧单元）都不是障碍物
+def line_of_sight(blocked, w, x0, y0, x1, y1):
+    dx, dy = abs(x1 - x0), abs(y1 - y0)
+    sx = 1 if x1 > x0 else -1
+    sy = 1 if y1 > y0 else -1
+    x, y = x0, y0
+    ix = iy = 0
+    while ix < dx or iy < dy:
+        decision = (1 + 2 * ix) * dy - (1 + 2 * iy) * dx
+        if decision == 0:
+            if blocked[y * w + x + sx] or blocked[(y + sy) * w + x]:
+                return False
+            x += sx
+            y += sy
+            ix += 1
+            iy += 1
+        elif decision < 0:
+            x += sx
+            ix += 1
+        else:
+            y += sy
+            iy += 1
+        if blocked[y * w + x]:
+            return False
+    return True
 
-    # 创建二值污染区地图
-    grid_width = gray.width() // GRID_SIZE
-    grid_height = gray.height() // GRID_SIZE
+# 视线剪枝：从锚点出发跳到最远可直达的路径点，只保留转折点
+def smooth_path(path, blocked, w):
+    if len(path) < 3:
+        return list(path)
+    waypoints = [path[0]]
+    ax, ay = path[0]
+    for i in range(2, len(path)):
+        x, y = path[i]
+        if not line_of_sight(blocked, w, ax, ay, x, y):
+            ax, ay = path[i - 1]
+            waypoints.append(path[i - 1])
+    waypoints.append(path[-1])
+    return waypoints
+
+# 网格坐标转换为像素坐标（网格中心）
+def to_pixels(path, cell):
+    half = cell // 2
+    return [(gx * cell + half, gy * cell + half) for gx, gy in path]
+
+# 折线的欧氏长度（像素）
+def polyline_length(points):
+    length = 0
+    for i in range(1, len(points)):
+        dx = points[i][0] - points[i-1][0]
+        dy = points[i][1] - points[i-1][1]
+        length += math.sqrt(dx*dx + dy*dy)
+    return length
+
+# 检测起点标记（车辆或激光点）的像素坐标，找不到时使用入口
+def find_start(img):
+    blobs = img.find_blobs([START_THRESHOLD], pixels_threshold=3, area_threshold=3, merge=True)
+    if not blobs:
+        return ENTRANCE
+    best = max(blobs, key=lambda b: b.pixels())
+    return (best.cx(), best.cy())
+
+# 对比当前规划器本帧的结果（path、耗时plan_us，不含安全距离更新）与在同一障碍/代价数组上完整重新规划的A*；
+# 未开启安全距离时规划器的障碍数组就是原始地图，同时对比原A*
+def bench_planner(reference, planner, grid, path, start, goal, plan_us):
+    global legacy_expanded
+    reference.blocked[:] = planner.blocked  # 复制到参考规划器自己的数组
+    reference.penalty[:] = planner.penalty
+    t0 = time.ticks_us()
+    full_path = reference.plan(start, goal)
+    t1 = time.ticks_us()
+    print("A* full replan: %d nodes, %.2f ms, cost %d | planner: %d nodes, %.2f ms, cost %d" % (
+        reference.expanded, time.ticks_diff(t1, t0) / 1000, path_cost(full_path),
+        planner.expanded, plan_us / 1000, path_cost(path)))
+    if not USE_CLEARANCE:
+        legacy_expanded = 0
+        grid_map = grid.to_lists()
+        t0 = time.ticks_us()
+        legacy_path = astar(grid_map, start, goal)
+        t1 = time.ticks_us()
+        print("A* legacy: %d nodes, %.2f ms, cost %d" % (
+            legacy_expanded, time.ticks_diff(t1, t0) / 1000, path_cost(legacy_path)))
+
+# 对比细网格上的全图A*与分层规划的扩展节点数、耗时和路径代价
+def bench_hierarchical(planner, flat, start, goal):
+    flat.blocked[:] = planner.blocked  # 复制到全图规划器自己的数组，不与分层规划器共用
+    flat.penalty[:] = planner.penalty
+    t0 = time.ticks_us()
+    flat_path = flat.plan(start, goal)
+    t1 = time.ticks_us()
+    hier_path = planner.plan(start, goal)
+    t2 = time.ticks_us()
+    print("Flat A* %dx%d: %d nodes, %.2f ms, cost %d | hierarchical: %d nodes, %.2f ms, cost %d, fallbacks %d" % (
+        flat.width, flat.height, flat.expanded, time.ticks_diff(t1, t0) / 1000, path_cost(flat_path),
+        planner.expanded, time.ticks_diff(t2, t1) / 1000, path_cost(hier_path), planner.fallbacks))
+
+# 池化生成网格地图（1=障碍物）写入grid，每帧只访问网格而不是每个像素
+def build_grid(gray, cell, grid):
+    if POOL_MODE == 'mean':
+        pooled = gray.mean_pooled(cell, cell)
+    else:
+        pooled = gray.midpoint_pooled(cell, cell, bias=0.0)  # bias=0 即最小值池化
+    # 批量阈值化：污染网格变为白色(255)
+    pooled.binary([(0, THRESHOLD - 1)])
+
+    rows = grid.rows
+    for gy in range(grid.height):
+        bits = 0
+        for gx in range(grid.width):
+            if pooled.get_pixel(gx, gy):
+                bits |= 1 << gx
+        rows[gy] = bits
+    return grid
+
+# 逐像素生成网格地图（原实现，仅用于基准测试对比）
+def build_grid_loop(gray, cell):
+    grid_width = gray.width() // cell
+    grid_height = gray.height() // cell
     grid_map = [[0]*grid_width for _ in range(grid_height)]
 
-    # 生成网格地图（1=障碍物）
     for gy in range(grid_height):
         for gx in range(grid_width):
-            sx, sy = gx * GRID_SIZE, gy * GRID_SIZE
+            sx, sy = gx * cell, gy * cell
 
             # 检查网格内是否有污染像素
             has_pollution = False
-            for y in range(sy, sy + GRID_SIZE):
-                for x in range(sx, sx + GRID_SIZE):
+            for y in range(sy, sy + cell):
+                for x in range(sx, sx + cell):
                     # 确保坐标在图像范围内
                     if x < gray.width() and y < gray.height():
                         if gray.get_pixel(x, y) < THRESHOLD:
@@ -117,49 +907,263 @@ while True:
 
             if has_pollution:
                 grid_map[gy][gx] = 1
-                # 在原图标记污染区（红色）
-                img.draw_rectangle(sx, sy, GRID_SIZE, GRID_SIZE, RED_COLOR, fill=True)
+    return grid_map
+
+# 在原图标记污染区（红色）
+def draw_grid(img, grid, cell):
+    for gy, bits in enumerate(grid.rows):
+        gx = 0
+        while bits:
+            if bits & 1:
+                img.draw_rectangle(gx * cell, gy * cell, cell, cell, RED_COLOR, fill=True)
+            bits >>= 1
+            gx += 1
+
+# 对比两种建图方式的耗时
+def bench_grid(gray, cell):
+    pooled_grid = BitGrid(gray.width() // cell, gray.height() // cell)
+    t0 = time.ticks_us()
+    build_grid(gray, cell, pooled_grid)
+    t1 = time.ticks_us()
+    loop_map = build_grid_loop(gray, cell)
+    t2 = time.ticks_us()
+    print("Grid build: pooled %.2f ms, loop %.2f ms, same=%s" % (
+        time.ticks_diff(t1, t0) / 1000, time.ticks_diff(t2, t1) / 1000,
+        pooled_grid.to_lists() == loop_map))
+
+# 记录一帧网格地图：4字节时间戳(ms) + 每行按位压缩的字节
+def record_grid(f, grid, t):
+    f.write(struct.pack('<I', t))
+    row_bytes = (grid.width + 7) >> 3
+    for row in grid.rows:
+        f.write(row.to_bytes(row_bytes, 'little'))
+
+# 读取一帧记录到grid，返回时间戳（文件结束返回None）
+def read_grid(f, grid):
+    header = f.read(4)
+    row_bytes = (grid.width + 7) >> 3
+    data = f.read(row_bytes * grid.height)
+    if len(header) < 4 or len(data) < row_bytes * grid.height:
+        return None
+    for y in range(grid.height):
+        grid.rows[y] = int.from_bytes(data[y*row_bytes:(y+1)*row_bytes], 'little')
+    return struct.unpack('<I', header)[0]
+
+# 回放记录的网格序列，对比每帧完整A*与增量LPA*的扩展节点数
+def replay_benchmark(path):
+    f = open(path, 'rb')
+    w, h = struct.unpack('<HH', f.read(4))
+    full = GridPlanner(w, h)
+    incremental = LPAStarPlanner(w, h)
+    start = (ENTRANCE[0]//GRID_SIZE, ENTRANCE[1]//GRID_SIZE)
+    goal = (EXIT[0]//GRID_SIZE, EXIT[1]//GRID_SIZE)
+
+    hysteresis = HysteresisFilter(w, h, BLOCK_FRAMES, CLEAR_FRAMES)
+
+    frames = replans = avoided = full_total = inc_total = 0
+    first_t = last_t = 0
+    grid, last = BitGrid(w, h), BitGrid(w, h)
+    while True:
+        grid, last = last, grid  # 双缓冲：交换引用而不复制
+        t = read_grid(f, grid)
+        if t is None:
+            break
+        frames += 1
+        if frames == 1:
+            first_t = t
+            hysteresis.reset(grid)
+        last_t = t
+
+        if USE_HYSTERESIS:
+            changes = hysteresis.update(grid)
+            map_grid = hysteresis.state
+            if frames > 1 and not changes and not grid.equals(last):
+                avoided += 1
+        else:
+            changes = grid.diff(last)
+            map_grid = grid
+        if frames > 1 and not changes:
+            continue
+
+        full.load(map_grid)
+        full.plan(start, goal)
+        if frames == 1:
+            changed = w * h
+            incremental.load(map_grid)
+        else:
+            changed = len(changes)
+            incremental.update(changes)
+        incremental.plan(start, goal)
+
+        replans += 1
+        full_total += full.expanded
+        inc_total += incremental.expanded
+        print("Frame %d: %d changed cells, A* %d nodes, LPA* %d nodes" % (
+            frames, changed, full.expanded, incremental.expanded))
+    f.close()
+    print("Replay: %d frames, %d replans, A* %.1f nodes/frame, LPA* %.1f nodes/frame" % (
+        frames, replans, full_total / max(1, frames), inc_total / max(1, frames)))
+    minutes = time.ticks_diff(last_t, first_t) / 60000
+    print("Hysteresis: %d replans avoided, %.1f per minute" % (
+        avoided, avoided / minutes if minutes > 0 else 0))
+
+# 主循环
+path = []
+path_points = []  # 绘制用的路径点（像素坐标）
+path_length = 0   # 路径长度(cm)
+frame_count = 0
+grid_w, grid_h = sensor.width() // GRID_SIZE, sensor.height() // GRID_SIZE
+grid, last_grid = BitGrid(grid_w, grid_h), BitGrid(grid_w, grid_h)  # 双缓冲网格地图
+if PLANNER_MODE == 'astar':
+    active = GridPlanner(grid_w, grid_h)
+elif PLANNER_MODE == 'hier':
+    active = HierarchicalPlanner(grid_w, grid_h, COARSE_FACTOR, CORRIDOR_RADIUS)
+else:
+    active = LPAStarPlanner(grid_w, grid_h)
+bench_astar = GridPlanner(grid_w, grid_h) if BENCHMARK else None
+
+# 安全距离地图直接写入规划器的障碍/代价数组，出口单元不做膨胀
+clearance = None
+if USE_CLEARANCE:
+    clearance = ClearanceMap(grid_w, grid_h, active.blocked, active.penalty,
+                             INFLATE_RADIUS, SOFT_RADIUS, CLEARANCE_WEIGHT)
+    clearance.protected = (EXIT[1]//GRID_SIZE) * grid_w + EXIT[0]//GRID_SIZE
+hysteresis = HysteresisFilter(grid_w, grid_h, BLOCK_FRAMES, CLEAR_FRAMES)
+avoided_replans = 0  # 原始地图变化但去抖后无变化、因而省去的重新规划次数
+avoided_since = time.ticks_ms()
+
+if REPLAY_FILE:
+    replay_benchmark(REPLAY_FILE)
+    raise SystemExit
+
+record = None
+if RECORD_FILE:
+    record = open(RECORD_FILE, 'wb')
+    record.write(struct.pack('<HH', grid_w, grid_h))
+
+while True:
+    clock.tick()
+    gc.collect()  # 垃圾回收防止内存溢出
+
+    img = sensor.snapshot()
+    gray = img.copy().to_grayscale()
+    # 起点：'field'模式下每帧从图像中检测，在绘制叠加层之前完成
+    start_px = find_start(img) if PLANNER_MODE == 'field' else ENTRANCE
+
+    # 创建二值污染区地图（1=障碍物），写入两帧前的缓冲区
+    grid, last_grid = last_grid, grid
+    build_grid(gray, GRID_SIZE, grid)
+
+    if BENCHMARK and frame_count % BENCH_INTERVAL == 0:
+        bench_grid(gray, GRID_SIZE)
+    if record:
+        record_grid(record, grid, time.ticks_ms())
+        if frame_count % 30 == 0:
+            record.flush()
+    frame_count += 1
 
     # 转换入口/出口到网格坐标
-    grid_start = (ENTRANCE[0]//GRID_SIZE, ENTRANCE[1]//GRID_SIZE)
+    grid_start = (start_px[0]//GRID_SIZE, start_px[1]//GRID_SIZE)
     grid_end = (EXIT[0]//GRID_SIZE, EXIT[1]//GRID_SIZE)
 
+    # 迟滞滤波：只有去抖后的变化才触发重新规划
+    if USE_HYSTERESIS:
+        if frame_count == 1:
+            hysteresis.reset(grid)
+        changes = hysteresis.update(grid)
+        map_grid = hysteresis.state
+        if frame_count > 1 and not changes and not grid.equals(last_grid):
+            avoided_replans += 1
+    else:
+        changes = grid.diff(last_grid)
+        map_grid = grid
+    draw_grid(img, map_grid, GRID_SIZE)
+
+    # 每分钟报告一次省去的重新规划次数
+    if time.ticks_diff(time.ticks_ms(), avoided_since) >= 60000:
+        print("Avoided replans: %d/min" % avoided_replans)
+        avoided_replans = 0
+        avoided_since = time.ticks_ms()
+
     # 当污染区变化时重新规划路径
-    if grid_map != last_grid:
-        last_grid = [row[:] for row in grid_map]  # 深拷贝
-        path = astar(grid_map, grid_start, grid_end)
+    replan = frame_count == 1 or changes
+    path_changed = False
+    clearance_us = 0  # 本帧安全距离更新耗时，单独报告，不计入规划耗时
+    t0 = time.ticks_us()
+    if replan:
+        # 只把变化单元交给规划器（LPA*据此修复上一次的解）；
+        # 开启安全距离时先在变化单元附近更新距离变换，再转交由此引起的代价变化
+        if frame_count == 1:
+            if clearance:
+                tc = time.ticks_us()
+                clearance.load(map_grid)
+                clearance_us = time.ticks_diff(time.ticks_us(), tc)
+                active.invalidate()
+            else:
+                active.load(map_grid)
+        elif clearance:
+            tc = time.ticks_us()
+            cost_changes = clearance.update(changes)
+            clearance_us = time.ticks_diff(time.ticks_us(), tc)
+            if BENCHMARK:
+                print("Clearance: %d cells -> %d cost changes, %.2f ms" % (
+                    len(changes), len(cost_changes), clearance_us / 1000))
+            active.update(cost_changes)
+        else:
+            active.update(changes)
+
+        if PLANNER_MODE == 'field':
+            # 增量更新从出口出发的代价场
+            active.build_field(grid_end)
+        else:
+            path = active.plan(grid_start, grid_end)
+            path_changed = True
+    if PLANNER_MODE == 'field':
+        # 每帧只沿代价场下降，无需搜索
+        path = active.descend(grid_start[0], grid_start[1])
+        path_changed = True
+    t1 = time.ticks_us()
+    plan_us = time.ticks_diff(t1, t0) - clearance_us
+
+    if path_changed:
+        # 路径后处理：只保留转折点，长度按真实欧氏距离计算
+        waypoints = smooth_path(path, active.blocked, grid_w) if SMOOTH_PATH else path
+        t2 = time.ticks_us()
+        path_points = to_pixels(waypoints, GRID_SIZE)
+        path_length = polyline_length(path_points) * CM_PER_PIXEL
+
+        if BENCHMARK and replan:
+            if PLANNER_MODE == 'hier':
+                bench_hierarchical(active, bench_astar, grid_start, grid_end)
+            else:
+                bench_planner(bench_astar, active, map_grid, path, grid_start, grid_end, plan_us)
+            print("Path: %d nodes expanded, %d cells -> %d waypoints, clearance %.2f ms, plan %.2f ms, smooth %.2f ms, %.1f -> %.1f cm" % (
+                active.expanded, len(path), len(waypoints), clearance_us / 1000, plan_us / 1000,
+                time.ticks_diff(t2, t1) / 1000, polyline_length(to_pixels(path, GRID_SIZE)) * CM_PER_PIXEL,
+                path_length))
 
     # 绘制路径（蓝色）
-    if path:
-        total_length = 0
+    if path_points:
         prev_pixel = None
 
-        for i, (gx, gy) in enumerate(path):
-            # 转换网格坐标回像素坐标（网格中心）
-            px = gx * GRID_SIZE + GRID_SIZE//2
-            py = gy * GRID_SIZE + GRID_SIZE//2
-
+        for px, py in path_points:
             # 绘制路径点
             img.draw_circle(px, py, 3, BLUE_COLOR, fill=True)
 
             # 连接路径点
             if prev_pixel:
                 img.draw_line(prev_pixel[0], prev_pixel[1], px, py, BLUE_COLOR, 2)
-                # 计算线段长度
-                dx = (px - prev_pixel[0]) * 0.1  # 假设1像素=0.1cm
-                dy = (py - prev_pixel[1]) * 0.1
-                total_length += math.sqrt(dx*dx + dy*dy)
 
             prev_pixel = (px, py)
 
         # 显示路径长度（使用传统字符串格式化）
-        text = "Path: %.1f cm" % total_length
+        text = "Path: %.1f cm" % path_length
         # 添加背景矩形提高文字可读性
         img.draw_rectangle(10, 10, len(text)*8, 16, (255, 255, 255), fill=True)
         img.draw_string(10, 10, text, color=BLUE_COLOR, scale=1)
 
-    # 标记入口（绿色）和出口（绿色）
-    img.draw_circle(ENTRANCE[0], ENTRANCE[1], 5, GREEN_COLOR, fill=True)
+    # 标记起点（绿色）和出口（绿色）
+    img.draw_circle(start_px[0], start_px[1], 5, GREEN_COLOR, fill=True)
     img.draw_circle(EXIT[0], EXIT[1], 5, GREEN_COLOR, fill=True)
 
     lcd.display(img)
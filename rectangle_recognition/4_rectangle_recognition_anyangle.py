@@ -2,6 +2,8 @@ import sensor
 import image
 import lcd
 import math
+import time
+import gc
 
 # 初始化LCD显示屏
 lcd.init()
@@ -13,12 +15,54 @@ sensor.set_framesize(sensor.QVGA)
 sensor.set_vflip(False)
 sensor.run(1)
 
-# 缩放图像
+# find_rects阈值闭环调节
+AUTO_THRESHOLD = True  # 根据候选数量和检测结果每帧调节阈值
+RECT_THRESHOLD = 50000  # 初始阈值（保存文件存在时使用上次调节的结果）
+THRESHOLD_MIN = 5000
+THRESHOLD_MAX = 100000
+TARGET_MIN_RECTS = 1  # 候选数目标区间下限
+TARGET_MAX_RECTS = 4  # 候选数目标区间上限
+THRESHOLD_STEP = 0.1  # 每帧相对调整比例
+THRESHOLD_SEARCH_FRAMES = 10  # 没有候选时最多连续降低阈值的帧数，之后保持不变
+SAVE_STABLE_FRAMES = 30  # 连续N帧处于目标区间后保存阈值
+THRESHOLD_FILE = "/flash/rect_threshold_anyangle.txt"
+
+# 跟踪模式：只在上一次矩形附近搜索
+USE_ROI_TRACKING = True  # 关闭后每帧全图搜索
+ROI_MARGIN = 0.25  # 搜索区域外扩比例（相对外接框较长边），每丢失一帧再加一份
+ROI_MIN_MARGIN = 8  # 最小外扩像素（缩放图像）
+FULL_SEARCH_MISSES = 3  # 连续丢失N帧后改为全图搜索
+FULL_SEARCH_INTERVAL = 10  # 每N帧强制全图搜索一次，发现搜索区域外新出现的矩形
+FPS_WINDOW = 100  # 每N帧统计一次稳态帧率
+track_box = None  # 上一次矩形在缩放图像上的外接框
+miss_count = 0
+roi_frames = 0
+search_frames = 0
+fps_frames = 0
+fps_start = time.ticks_ms()
+
+# 缩放缓冲池
+USE_BUFFER_POOL = True  # 半分辨率图像只在启动时分配一次，之后每帧把均值池化的结果写入其中
+scaled_buffer = None
+pool_into_buffer = True  # 固件的mean_pooled不支持写入已有图像时自动置为False
+scale_alloc = 0  # 本统计窗口内缩放步骤分配的堆内存（字节）
+
+# 缩放图像：scale×scale均值池化（不修改原图，抗混叠），使用缓冲池时结果写入预先分配的图像，稳态帧不再分配新图像
 def scale_image(img, scale):
+    global scaled_buffer, pool_into_buffer
     width = img.width() // scale
     height = img.height() // scale
-    img_scaled = img.resize(width, height)
-    return img_scaled
+    if USE_BUFFER_POOL:
+        if scaled_buffer is None or scaled_buffer.width() != width or scaled_buffer.height() != height:
+            scaled_buffer = image.Image(size=(width, height))
+        if pool_into_buffer:
+            try:
+                return img.mean_pooled(scale, scale, copy=scaled_buffer)
+            except TypeError:
+                pool_into_buffer = False
+                print("mean_pooled cannot write into a buffer, allocating per frame")
+        return img.mean_pooled(scale, scale)
+    return img.resize(width, height)
 
 # 自动估算边框宽度（根据矩形大小比例）
 def estimate_border_width(w, h):
@@ -44,14 +88,97 @@ def ensure_clockwise(corners):
 def midpoint(p1, p2):
     return ((p1[0] + p2[0]) // 2, (p1[1] + p2[1]) // 2)
 
+# 矩形顶点的外接框 (x, y, w, h)
+def corners_box(corners):
+    xs = [p[0] for p in corners]
+    ys = [p[1] for p in corners]
+    return (min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+
+# 根据上一次的外接框计算搜索区域：每丢失一帧多外扩一份边距，连续丢失过多时返回None（全图搜索）
+def search_roi(box, misses, width, height):
+    if box is None or misses >= FULL_SEARCH_MISSES:
+        return None
+    x, y, w, h = box
+    margin = int(max(w, h) * ROI_MARGIN * (misses + 1)) + ROI_MIN_MARGIN
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(width, x + w + margin), min(height, y + h + margin)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+# 读取上次保存的阈值，文件不存在时使用默认值
+def load_threshold(default):
+    try:
+        with open(THRESHOLD_FILE) as f:
+            return max(THRESHOLD_MIN, min(THRESHOLD_MAX, int(f.read())))
+    except Exception:
+        return default
+
+# 保存阈值到文件
+def save_threshold(threshold):
+    try:
+        with open(THRESHOLD_FILE, "w") as f:
+            f.write(str(threshold))
+    except Exception as e:
+        print("Threshold save error:", e)
+
+# 闭环调节阈值：候选过多时提高阈值；没有候选时降低阈值，但连续THRESHOLD_SEARCH_FRAMES帧仍没有候选时
+# 视野中可能没有目标，保持阈值不再降低；连续稳定SAVE_STABLE_FRAMES帧后打印收敛帧数，与已保存值相差超过5%时写入文件
+def update_threshold(count, found):
+    global rect_threshold, stable_frames, saved_threshold, tune_frames, empty_frames
+    tune_frames += 1
+    empty_frames = empty_frames + 1 if count < TARGET_MIN_RECTS else 0
+    if count > TARGET_MAX_RECTS:
+        rect_threshold = min(THRESHOLD_MAX, int(rect_threshold * (1 + THRESHOLD_STEP)))
+        stable_frames = 0
+    elif count < TARGET_MIN_RECTS or not found:
+        if empty_frames <= THRESHOLD_SEARCH_FRAMES:
+            rect_threshold = max(THRESHOLD_MIN, int(rect_threshold * (1 - THRESHOLD_STEP)))
+        stable_frames = 0
+    else:
+        stable_frames += 1
+        if stable_frames == SAVE_STABLE_FRAMES:
+            print("Threshold settled at {} after {} frames".format(rect_threshold, tune_frames))
+            if abs(rect_threshold - saved_threshold) > saved_threshold * 0.05:
+                save_threshold(rect_threshold)
+                saved_threshold = rect_threshold
+
 # 计算两点之间的距离
 def distance(p1, p2):
     return math.sqrt((p2[0]-p1[0])**2 + (p2[1]-p1[1])**2)
 
+# 阈值调节状态
+rect_threshold = load_threshold(RECT_THRESHOLD) if AUTO_THRESHOLD else RECT_THRESHOLD
+saved_threshold = rect_threshold
+stable_frames = 0
+tune_frames = 0
+empty_frames = 0  # 连续没有候选的帧数
+
 while True:
     img = sensor.snapshot()
+    # 统计缩放步骤的堆分配（gc.mem_alloc差值，期间发生回收时差值为负，忽略）
+    heap_before = gc.mem_alloc()
     img_scaled = scale_image(img, 2)  # 将图像缩小为原来的一半
-    rects = img_scaled.find_rects(threshold=50000)
+    heap_delta = gc.mem_alloc() - heap_before
+    if heap_delta > 0:
+        scale_alloc += heap_delta
+    # 跟踪模式下只在上一次所有矩形的外接框附近搜索，每FULL_SEARCH_INTERVAL帧全图搜索一次
+    search_frames += 1
+    roi = None
+    if USE_ROI_TRACKING and search_frames % FULL_SEARCH_INTERVAL:
+        roi = search_roi(track_box, miss_count, img_scaled.width(), img_scaled.height())
+    if roi:
+        rects = img_scaled.find_rects(roi=roi, threshold=rect_threshold)
+        roi_frames += 1
+    else:
+        rects = img_scaled.find_rects(threshold=rect_threshold)
+    if AUTO_THRESHOLD:
+        update_threshold(len(rects), len(rects) > 0)
+
+    # 跟踪所有矩形的整体外接框
+    if rects:
+        track_box = corners_box([p for rect in rects for p in rect.corners()])
+        miss_count = 0
+    else:
+        miss_count += 1
 
     for rect in rects:
         # 获取缩放后图像上的矩形顶点
@@ -134,3 +261,14 @@ while True:
             print("Corner {}: ({}, {})".format(i, int(x), int(y)))
 
     lcd.display(img)
+
+    # 统计稳态帧率（每FPS_WINDOW帧的平均值）
+    fps_frames += 1
+    if fps_frames == FPS_WINDOW:
+        elapsed = time.ticks_diff(time.ticks_ms(), fps_start)
+        print("FPS: {:.1f}, ROI frames: {}/{}, scale alloc: {} B/frame, heap free: {} B".format(
+            fps_frames * 1000 / elapsed, roi_frames, fps_frames, scale_alloc // fps_frames, gc.mem_free()))
+        scale_alloc = 0
+        fps_frames = 0
+        roi_frames = 0
+        fps_start = time.ticks_ms()